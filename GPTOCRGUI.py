@@ -1,199 +1,121 @@
-import os
-import re
 import pystray
 import pyperclip
 import platform
+import os
 #import keyboard
 import threading
+import multiprocessing
 import tkinter as tk
-from tkinter import ttk
-from PIL import Image, ImageGrab, ImageDraw, ImageTk
+from tkinter import ttk, filedialog, messagebox
+from PIL import Image, ImageDraw, ImageTk
 import time
-from openai import OpenAI
-import httpx
 from utils.path_tools import get_absolute_path
-from processors.image_encoder import ImageEncoder
-from processors.markdown_processor import MarkdownProcessor
+from processors.image_to_markdown import ImageToMarkdown, DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT
+from processors.profile_manager import ProfileManager
+from processors.model_router import ModelRouter, DEFAULT_THRESHOLDS
+from processors.document_filter import DocumentFilter, DEFAULT_THRESHOLD as PREFILTER_THRESHOLD
+from processors.backends import LOCAL_BACKENDS
+from processors.translator import Translator
+from processors.encode_pool import EncodePool
+from processors.shadow_eval import create_shadow_evaluator, load_report, format_report
+from processors.scheduler import format_summary as format_scheduler_summary
 from utils.config_manager import ConfigManager
 from utils.hotkey_manager import create_hotkey_manager, HotkeyManager
+from utils.api_server import RecognitionServer
+from utils.history_store import HistoryStore
+from utils.trace_recorder import TraceRecorder
+from utils.region_selector import RegionSelector
+from utils.folder_watcher import FolderWatcher
+from utils.capture_spool import CaptureSpool
+from utils.memory_monitor import MemoryMonitor
 
-class ImageToMarkdown:
-    def __init__(self, log_callback, app):
-        self.log_callback = log_callback
-        self.app = app
-        self.running = False
-        self.client = None
-        self.gpt_model = 'gpt-4o'
-        self.image_encoder = ImageEncoder()
-        self.markdown_processor = MarkdownProcessor()
-        self.current_provider = 'OPENAI'
-        self.screenshot_hotkey_isNull = True # 用于标记是否注册了截图快捷键
-        self.screenshot_hotkey_triggered = False # 用于标记是否触发了截图快捷键
-        self.process_pre_exist_image=True # 用于标记是否处理软件启动时已经存在的剪贴板图片
-        try:
-            self.initial_image = ImageGrab.grabclipboard()
-        except:
-            self.initial_image = None
-        self.system_prompt = (
-            "You are a helpful assistant that converts images to markdown format. "
-            "If the image contains mathematical formulas, use LaTeX syntax for them. "
-            "Return only the markdown content of the image, without any additional words or explanations."
-        )
-        self.user_prompt = "Here is my image."
-        self.max_tokens = 1000
-
-    def set_prompts(self, system_prompt, user_prompt):
-        self.system_prompt = system_prompt
-        self.user_prompt = user_prompt
-
-    def set_max_tokens(self, max_tokens):
-        self.max_tokens = max_tokens
-
-    def set_provider(self, provider):
-        """设置当前服务商"""
-        self.current_provider = provider
-
-    def set_api_key(self, api_key):
-        if not api_key:
-            self.log_callback("API Key不能为空")
-        os.environ['OPENAI_API_KEY'] = api_key
-
-    def set_proxy(self, proxy):
-        """根据服务商设置代理和client"""
-        try:
-            if self.current_provider == 'OPENAI':
-                if proxy:
-                    self.client = OpenAI(
-                        http_client=httpx.Client(
-                            transport=httpx.HTTPTransport(proxy=proxy)
-                        )
-                    )
-                else:
-                    self.client = OpenAI()
-            elif self.current_provider == '火山引擎':
-                if proxy:
-                    self.client = OpenAI(
-                        base_url="https://ark.cn-beijing.volces.com/api/v3",
-                        http_client=httpx.Client(
-                            transport=httpx.HTTPTransport(proxy=proxy)
-                        )
-                    )
-                else:
-                    self.client = OpenAI(
-                        base_url="https://ark.cn-beijing.volces.com/api/v3"
-                    )
-            elif self.current_provider == '自定义':
-                # 从app获取用户设置的URL
-                custom_url = self.app.url_var.get().strip()
-                if not custom_url:
-                    self.log_callback("自定义URL不能为空")
-                    
-                if proxy:
-                    self.client = OpenAI(
-                        base_url=custom_url,
-                        http_client=httpx.Client(
-                            transport=httpx.HTTPTransport(proxy=proxy)
-                        )
-                    )
-                else:
-                    self.client = OpenAI(
-                        base_url=custom_url
-                    )
-        except Exception as e:
-            if self.log_callback:
-                self.log_callback(f"设置客户端时出错: {str(e)}")
-
-    def set_gpt_model(self, model_name):
-        if not model_name:
-            self.log_callback("模型不能为空")
-            return
-        self.gpt_model = model_name
-
-    def process_image(self, image):
-        if not self.client:
-            raise Exception("请先设置 API Key 或推理接入点")
-        
-        base64_img = f"data:image/png;base64,{self.image_encoder.encode_image(image)}"
-        
-        response = self.client.chat.completions.create(
-            model=self.gpt_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": self.system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": self.user_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"{base64_img}"}
-                        }
-                    ],
-                }
-            ],
-            max_tokens=self.max_tokens,
-        )
-        #debug用
-        #print(response)
-        markdown_content = response.choices[0].message.content
-        markdown_content = re.sub(r'^```markdown\s*\n(.*?)\n```\s*$', r'\1', markdown_content, flags=re.DOTALL)
-        return self.markdown_processor.modify_wrappers(markdown_content)
-
-    def process_clipboard_image(self):
-        if  not self.process_pre_exist_image:
-            last_image=self.initial_image
-        else:
-            last_image = None
-        while self.running:
-            try:
-                if self.screenshot_hotkey_isNull or self.screenshot_hotkey_triggered:
-                    image = ImageGrab.grabclipboard()
-                    if isinstance(image, Image.Image) and image != last_image:
-                        self.log_callback("检测到新的剪贴板图像。")
-                        self.app.update_icon_status('processing')
-
-                        markdown_content = self.process_image(image)
-                        pyperclip.copy(markdown_content)
-                        self.log_callback("识别后的内容已复制到剪贴板。")
-
-                        self.app.update_icon_status('success')
-                        last_image = image
-                        self.screenshot_hotkey_triggered = False
-            except Exception as e:
-                self.log_callback(f"发生错误: {e}")
-                self.app.update_icon_status('error')
-                self.running = False
-                break
-            time.sleep(1)
-
-    def start(self):
-        self.running = True
-        threading.Thread(target=self.process_clipboard_image, daemon=True).start()
-
-    def stop(self):
-        self.running = False
-
-    def set_wrappers(self, inline_wrapper: str, block_wrapper: str):
-        """代理到 markdown_processor 的 set_wrappers 方法"""
-        self.markdown_processor.set_wrappers(inline_wrapper, block_wrapper)
+MAX_LOG_LINES = 1000  # 日志窗口最多保留的行数
 
 class App:
     def __init__(self, root, processor):
         self.processor = processor
-        self.processor.app = self
         self.processor.log_callback = self.log
+        self.processor.status_callback = self.update_icon_status
+        self.processor.confirm_callback = self.confirm_prefilter
         self.config_manager = ConfigManager()
         self.hotkey_manager = create_hotkey_manager(self.toggle_processing)
         self.hotkey_var = tk.StringVar(value='ctrl+shift+o')
         self.screenshot_hotkey_var = tk.StringVar(value='')  # 添加截图快捷键变量
+        self.region_hotkey_var = tk.StringVar(value='')  # 内置区域截图快捷键
+        self.region_selector = None
         self.provider_var = tk.StringVar(value='OPENAI')  # 确保 provider_var 在 load_settings 之前定义
         self.url_var = tk.StringVar(value='')
         self.system_prompt_var = tk.StringVar(value=self.processor.system_prompt)
         self.user_prompt_var   = tk.StringVar(value=self.processor.user_prompt)
         self.max_tokens_var    = tk.IntVar(   value=self.processor.max_tokens)
+        self.adaptive_max_tokens_var = tk.BooleanVar(value=self.processor.adaptive_max_tokens)
+        self.progressive_resolution_var = tk.BooleanVar(value=self.processor.progressive_resolution)
+        self.cost_aware_resize_var = tk.BooleanVar(value=self.processor.cost_aware_resize)
+        self.routing_enabled_var = tk.BooleanVar(value=False)  # 是否按图片复杂度选择模型
+        self.routing_fast_var = tk.StringVar(value='')
+        self.routing_strong_var = tk.StringVar(value='')
+        self.routing_lines_var = tk.IntVar(value=DEFAULT_THRESHOLDS['max_simple_lines'])
+        self.routing_ink_var = tk.DoubleVar(value=DEFAULT_THRESHOLDS['max_simple_ink'])
+        self.routing_thresholds = {}  # 界面未提供的阈值，原样保存在配置文件中
+        self.translation_enabled_var = tk.BooleanVar(value=False)  # 是否在识别后翻译
+        self.translation_model_var = tk.StringVar(value='')
+        self.translation_language_var = tk.StringVar(value='简体中文')
         self.process_pre_exist_image_var = tk.BooleanVar(value=False)  # 用于标记是否处理软件启动时已经存在的剪贴板图片
+        self.spool_enabled_var = tk.BooleanVar(value=True)  # 截图是否先写入磁盘缓冲区
+        self.scroll_stitch_var = tk.BooleanVar(value=False)  # 连续截图是否只识别新增部分并拼接结果
+        self.prefilter_enabled_var = tk.BooleanVar(value=False)  # 是否跳过照片、图标等非文档图片
+        self.prefilter_threshold_var = tk.DoubleVar(value=PREFILTER_THRESHOLD)
+        self.prefilter_action_var = tk.StringVar(value='skip')  # 'skip' 直接跳过，'ask' 询问
+        self.capture_spool = None
+        self.api_server_enabled_var = tk.BooleanVar(value=False)  # 是否启用本地识别接口
+        self.api_server_port_var = tk.IntVar(value=8765)
+        self.api_server_socket = ''  # Unix socket 路径，仅通过配置文件设置
+        self.pack_images_var = tk.IntVar(value=1)  # 同时提交的图片（识别接口、监听文件夹）合并为一次请求的最多图片数
+        self.api_server = None
+        self.watch_folder_enabled_var = tk.BooleanVar(value=False)  # 是否监听文件夹中新保存的图片
+        self.watch_folder_path_var = tk.StringVar(value='')
+        self.watch_folder_output_var = tk.StringVar(value='sidecar')  # sidecar 写入同名 .md，append 追加到文件
+        self.watch_folder_target_var = tk.StringVar(value='')
+        self.watch_folder_workers = 2  # 同时识别的图片数，仅通过配置文件设置
+        self.folder_watcher = None
+        self.shadow_enabled_var = tk.BooleanVar(value=False)  # 是否把部分截图同时交给候选配置方案评估
+        self.shadow_profile_var = tk.StringVar(value='')
+        self.shadow_fraction_var = tk.DoubleVar(value=0.1)
+        self.shadow_prices = {}  # 模型 -> [每百万输入 token 价格, 每百万输出 token 价格]，仅通过配置文件设置
+        self.shadow_evaluator = None
+        self.result_cache_enabled_var = tk.BooleanVar(value=False)  # 是否缓存识别结果（相同图片不重复付费识别）
+        self.result_cache_url_var = tk.StringVar(value='')  # 团队共享缓存服务地址，为空时只使用本地缓存
+        self.result_cache_token_var = tk.StringVar(value='')
+        self.result_cache_publish_var = tk.BooleanVar(value=True)
+        self.result_cache_timeout = 0.3  # 查询团队缓存的超时（秒），仅通过配置文件设置
+        self.scheduler_enabled_var = tk.BooleanVar(value=False)  # 是否按优先级调度截图、接口和后台任务的请求
+        self.scheduler_rate_limit_var = tk.IntVar(value=0)  # 每分钟最多请求数，0 为不限
+        self.scheduler_caps = {}  # 类别 -> 并发上限，仅通过配置文件设置
+        self.history_enabled_var = tk.BooleanVar(value=True)  # 是否记录识别历史
+        self.history_search_var = tk.StringVar(value='')
+        self.history_rows = []
+        self.memory_limit_var = tk.IntVar(value=0)  # RSS 上限（MB），0 为不限制
+        self.encode_workers_var = tk.IntVar(value=0)  # 编码大图片的子进程数，0 为在主进程编码
+        self.memory_monitor = MemoryMonitor(log_callback=self.log)
+        self.memory_monitor.add_release_hook(lambda: self.trim_log(100))
+        self.processor.set_memory_monitor(self.memory_monitor)
+        self.screenshot_reset_timer = None
+        self.profile_manager = ProfileManager(log_callback=self.log)
+        self.processor.set_profile_manager(self.profile_manager)
+        self.profile_name_var = tk.StringVar(value='')
+        self.profile_hotkey_var = tk.StringVar(value='')
+        self.profile_grayscale_var = tk.BooleanVar(value=False)
+        self.profile_max_side_var = tk.IntVar(value=0)
+        self.profile_backend_var = tk.StringVar(value='api')  # 识别引擎：服务商接口或本地后端
+        self.profile_tesseract_lang_var = tk.StringVar(value='chi_sim+eng')
+        self.active_profile_var = tk.StringVar(value='默认设置')
+        self.trace_dir = ''  # 识别录制目录，仅通过配置文件设置，为空时不录制
+        self.trace_recorder = None
+        try:
+            self.history_store = HistoryStore(log_callback=self.log)
+        except Exception as e:
+            self.history_store = None
+            print(f"打开历史记录失败: {e}")
         self.log_text = tk.Text()  # 确保 log_text 在 load_settings 之前定义
         self.root = root
         self.root.title("OCR")
@@ -261,7 +183,7 @@ class App:
         # 左侧导航
         nav_frame = ttk.Frame(main_frame, style='TFrame')
         nav_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0,10))
-        categories = ['模型设置','LaTeX设置','其他设置', '日志']
+        categories = ['模型设置','配置方案','LaTeX设置','其他设置', '历史记录', '日志']
         if HotkeyManager.should_show_ui():
             categories.append('快捷键设置')
         for cat in categories:
@@ -389,10 +311,71 @@ class App:
         max_frame = ttk.Frame(prompt_frame, style='TFrame')
         ttk.Label(max_frame, text="Max Tokens:").pack(side=tk.LEFT)
         ttk.Entry(max_frame, textvariable=self.max_tokens_var, width=8).pack(side=tk.LEFT, padx=(10,0))
+        tk.Checkbutton(
+            max_frame,
+            text="按图片内容自动调整（不超过 Max Tokens，截断时自动续写）",
+            variable=self.adaptive_max_tokens_var,
+            bg=bg_color,
+            fg=text_color
+        ).pack(side=tk.LEFT, padx=(10,0))
         max_frame.pack(fill=tk.X)
+        tk.Checkbutton(
+            prompt_frame,
+            text="渐进式识别（先发送缩小的图片，结果可疑时再发送原图）",
+            variable=self.progressive_resolution_var,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+        tk.Checkbutton(
+            prompt_frame,
+            text="按服务商的图片计费方式缩放图片（文字仍清晰时减少图片 token，自动设置 detail）",
+            variable=self.cost_aware_resize_var,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
         
         ttk.Button(prompt_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
 
+        # 模型路由
+        routing_frame = ttk.LabelFrame(model_section, text="模型路由（简单截图用快速模型，复杂或手写用强模型）", padding=10, style='TLabelframe')
+        routing_frame.pack(fill=tk.X, pady=(0, 10))
+        routing_frame.grid_columnconfigure(1, weight=1)
+        tk.Checkbutton(
+            routing_frame,
+            text="启用",
+            variable=self.routing_enabled_var,
+            bg=bg_color,
+            fg=text_color
+        ).grid(row=0, column=0, sticky='w')
+        ttk.Label(routing_frame, text="快速模型:").grid(row=1, column=0, sticky='w')
+        ttk.Entry(routing_frame, textvariable=self.routing_fast_var).grid(row=1, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        ttk.Label(routing_frame, text="强模型（留空为当前模型）:").grid(row=2, column=0, sticky='w')
+        ttk.Entry(routing_frame, textvariable=self.routing_strong_var).grid(row=2, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        routing_threshold_frame = ttk.Frame(routing_frame, style='TFrame')
+        routing_threshold_frame.grid(row=3, column=0, columnspan=2, sticky='ew')
+        ttk.Label(routing_threshold_frame, text="简单图片最多行数:").pack(side=tk.LEFT)
+        ttk.Entry(routing_threshold_frame, textvariable=self.routing_lines_var, width=5).pack(side=tk.LEFT, padx=(10, 10))
+        ttk.Label(routing_threshold_frame, text="最大笔迹密度:").pack(side=tk.LEFT)
+        ttk.Entry(routing_threshold_frame, textvariable=self.routing_ink_var, width=6).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(routing_threshold_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+
+        # 识别后翻译
+        translation_frame = ttk.LabelFrame(model_section, text="识别后翻译（公式和代码保持原样）", padding=10, style='TLabelframe')
+        translation_frame.pack(fill=tk.X, pady=(0, 10))
+        translation_frame.grid_columnconfigure(1, weight=1)
+        tk.Checkbutton(
+            translation_frame,
+            text="启用",
+            variable=self.translation_enabled_var,
+            bg=bg_color,
+            fg=text_color
+        ).grid(row=0, column=0, sticky='w')
+        ttk.Label(translation_frame, text="翻译模型（留空为当前模型）:").grid(row=1, column=0, sticky='w')
+        ttk.Entry(translation_frame, textvariable=self.translation_model_var).grid(row=1, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        ttk.Label(translation_frame, text="目标语言:").grid(row=2, column=0, sticky='w')
+        ttk.Entry(translation_frame, textvariable=self.translation_language_var).grid(row=2, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        ttk.Button(translation_frame, text="保存", command=self.save_settings).grid(row=3, column=1, sticky='e')
+
         self.sections['模型设置'] = model_section
 
         # # ——— 代理设置 区块 ———
@@ -476,6 +459,26 @@ class App:
                 e.bind('<Key>', self.capture_hotkey)
                 e.bind('<FocusOut>', self.save_screenshot_hotkey)
 
+            # 内置区域截图快捷键（三个单键输入框 + “+” 分隔）
+            hk_region_frame = ttk.Frame(hotkey_frame, style='TFrame')
+            hk_region_frame.pack(fill=tk.X, pady=(5,0))
+            # 统一第一列宽度，确保对齐
+            hk_region_frame.grid_columnconfigure(0, minsize=140)
+            ttk.Label(hk_region_frame, text="区域截图识别快捷键:").grid(row=0, column=0, padx=(0,5))
+            self.rk1 = ttk.Entry(hk_region_frame, width=5)
+            self.rk2 = ttk.Entry(hk_region_frame, width=5)
+            self.rk3 = ttk.Entry(hk_region_frame, width=5)
+            self.rk1.grid(row=0, column=1)
+            ttk.Label(hk_region_frame, text="+").grid(row=0, column=2, padx=2)
+            self.rk2.grid(row=0, column=3)
+            ttk.Label(hk_region_frame, text="+").grid(row=0, column=4, padx=2)
+            self.rk3.grid(row=0, column=5)
+            ttk.Button(hk_region_frame, text="保存", command=self.save_region_hotkey).grid(row=0, column=6, padx=(10,0))
+            for e in (self.rk1, self.rk2, self.rk3):
+                e.bind('<FocusIn>', lambda ev: ev.widget.delete(0, tk.END))
+                e.bind('<Key>', self.capture_hotkey)
+                e.bind('<FocusOut>', self.save_region_hotkey)
+
         self.sections['快捷键设置'] = hotkey_section
         
         # ——— 其他设置 区块 ———
@@ -492,9 +495,275 @@ class App:
             fg=text_color
         )
         process_pre_exist_image_check.pack(anchor='w')
+        tk.Checkbutton(
+            startup_frame,
+            text="截图先保存到磁盘缓冲区（退出、崩溃或断网后重新识别）",
+            variable=self.spool_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+        tk.Checkbutton(
+            startup_frame,
+            text="连续截图拼接（与上一张截图重叠时只识别新增部分，结果追加到上一次的结果后）",
+            variable=self.scroll_stitch_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+
+        # 识别前过滤
+        prefilter_frame = ttk.LabelFrame(others_section, text="识别前过滤（跳过照片、图标等不含文字的图片）", padding=10, style='TLabelframe')
+        prefilter_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Checkbutton(
+            prefilter_frame,
+            text="启用",
+            variable=self.prefilter_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(side=tk.LEFT)
+        ttk.Label(prefilter_frame, text="阈值（0-1）:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(prefilter_frame, textvariable=self.prefilter_threshold_var, width=5).pack(side=tk.LEFT, padx=(5, 0))
+        for value, text in (('skip', '直接跳过'), ('ask', '询问')):
+            tk.Radiobutton(
+                prefilter_frame,
+                text=text,
+                variable=self.prefilter_action_var,
+                value=value,
+                command=self.save_settings,
+                bg=bg_color,
+                fg=text_color
+            ).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(prefilter_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+
+        # 本地识别接口
+        api_server_frame = ttk.LabelFrame(others_section, text="本地识别接口", padding=10, style='TLabelframe')
+        api_server_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Checkbutton(
+            api_server_frame,
+            text="启用（仅监听 127.0.0.1，POST 图片至 /v1/recognize）",
+            variable=self.api_server_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+        api_port_frame = ttk.Frame(api_server_frame, style='TFrame')
+        api_port_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(api_port_frame, text="端口:").pack(side=tk.LEFT)
+        ttk.Entry(api_port_frame, textvariable=self.api_server_port_var, width=8).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(api_port_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+
+        # 监听文件夹
+        watch_frame = ttk.LabelFrame(others_section, text="监听文件夹", padding=10, style='TLabelframe')
+        watch_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Checkbutton(
+            watch_frame,
+            text="识别截图工具保存到该文件夹的新图片",
+            variable=self.watch_folder_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+        watch_path_frame = ttk.Frame(watch_frame, style='TFrame')
+        watch_path_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(watch_path_frame, text="文件夹:").pack(side=tk.LEFT)
+        ttk.Entry(watch_path_frame, textvariable=self.watch_folder_path_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
+        ttk.Button(
+            watch_path_frame, text="选择",
+            command=lambda: self.choose_path(self.watch_folder_path_var, directory=True)
+        ).pack(side=tk.LEFT, padx=(10, 0))
+        watch_output_frame = ttk.Frame(watch_frame, style='TFrame')
+        watch_output_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Radiobutton(watch_output_frame, text="写入同名 .md 文件", value='sidecar',
+                        variable=self.watch_folder_output_var).pack(side=tk.LEFT)
+        ttk.Radiobutton(watch_output_frame, text="追加到:", value='append',
+                        variable=self.watch_folder_output_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(watch_output_frame, textvariable=self.watch_folder_target_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        ttk.Button(
+            watch_output_frame, text="选择",
+            command=lambda: self.choose_path(self.watch_folder_target_var)
+        ).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(watch_output_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+
+        # 结果缓存
+        cache_frame = ttk.LabelFrame(others_section, text="结果缓存（相同图片直接使用之前的结果，可与团队共享）", padding=10, style='TLabelframe')
+        cache_frame.pack(fill=tk.X, pady=(0, 10))
+        cache_frame.grid_columnconfigure(1, weight=1)
+        tk.Checkbutton(
+            cache_frame,
+            text="启用",
+            variable=self.result_cache_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).grid(row=0, column=0, sticky='w')
+        tk.Checkbutton(
+            cache_frame,
+            text="上传本机的识别结果（只上传哈希和文本，不上传图片）",
+            variable=self.result_cache_publish_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).grid(row=0, column=1, sticky='w')
+        ttk.Label(cache_frame, text="团队缓存地址（留空只用本地缓存）:").grid(row=1, column=0, sticky='w', pady=(5, 0))
+        ttk.Entry(cache_frame, textvariable=self.result_cache_url_var).grid(row=1, column=1, sticky='ew', padx=(10, 0), pady=(5, 0))
+        ttk.Label(cache_frame, text="访问令牌:").grid(row=2, column=0, sticky='w', pady=(5, 0))
+        ttk.Entry(cache_frame, textvariable=self.result_cache_token_var, show='*').grid(row=2, column=1, sticky='ew', padx=(10, 0), pady=(5, 0))
+        ttk.Button(cache_frame, text="保存", command=self.save_settings).grid(row=3, column=1, sticky='e', pady=(5, 0))
+
+        # 请求调度
+        scheduler_frame = ttk.LabelFrame(others_section, text="请求调度（截图优先于识别接口和后台任务）", padding=10, style='TLabelframe')
+        scheduler_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Checkbutton(
+            scheduler_frame,
+            text="启用",
+            variable=self.scheduler_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(side=tk.LEFT)
+        ttk.Label(scheduler_frame, text="每分钟最多请求数 (0 为不限):").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(scheduler_frame, textvariable=self.scheduler_rate_limit_var, width=6).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(scheduler_frame, text="合并同时提交的图片（最多张数，1 为不合并）:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(scheduler_frame, textvariable=self.pack_images_var, width=4).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(scheduler_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+        ttk.Button(scheduler_frame, text="排队统计", command=self.show_scheduler_summary).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # 影子评估
+        shadow_frame = ttk.LabelFrame(others_section, text="影子评估（比较候选模型，候选结果不会复制到剪贴板）", padding=10, style='TLabelframe')
+        shadow_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Checkbutton(
+            shadow_frame,
+            text="启用",
+            variable=self.shadow_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(side=tk.LEFT)
+        ttk.Label(shadow_frame, text="候选配置方案:").pack(side=tk.LEFT, padx=(10, 0))
+        self.shadow_profile_combo = ttk.Combobox(shadow_frame, textvariable=self.shadow_profile_var, width=12, state='readonly')
+        self.shadow_profile_combo.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(shadow_frame, text="抽样比例:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(shadow_frame, textvariable=self.shadow_fraction_var, width=5).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(shadow_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+        ttk.Button(shadow_frame, text="评估报告", command=self.show_shadow_report).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # 内存设置
+        memory_frame = ttk.LabelFrame(others_section, text="内存设置", padding=10, style='TLabelframe')
+        memory_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(memory_frame, text="内存上限 (MB，0 为不限制):").pack(side=tk.LEFT)
+        ttk.Entry(memory_frame, textvariable=self.memory_limit_var, width=8).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(memory_frame, text="保存", command=self.save_settings).pack(side=tk.RIGHT)
+        ttk.Button(memory_frame, text="内存快照", command=self.show_memory_snapshot).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Label(memory_frame, text="编码进程数 (0 为不使用):").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(memory_frame, textvariable=self.encode_workers_var, width=4).pack(side=tk.LEFT, padx=(10, 0))
 
         self.sections['其他设置'] = others_section
 
+        # ——— 历史记录 区块 ———
+        history_section = ttk.Frame(self.content_frame, style='TFrame')
+        history_frame = ttk.LabelFrame(history_section, text="识别历史", padding=10, style='TLabelframe')
+        history_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        tk.Checkbutton(
+            history_frame,
+            text="记录识别历史",
+            variable=self.history_enabled_var,
+            command=self.save_settings,
+            bg=bg_color,
+            fg=text_color
+        ).pack(anchor='w')
+
+        search_frame = ttk.Frame(history_frame, style='TFrame')
+        search_frame.pack(fill=tk.X, pady=(5, 5))
+        history_search_entry = ttk.Entry(search_frame, textvariable=self.history_search_var)
+        history_search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        history_search_entry.bind('<KeyRelease>', lambda e: self.search_history())
+        ttk.Button(search_frame, text="搜索", command=self.search_history).pack(side=tk.RIGHT)
+
+        list_frame = ttk.Frame(history_frame, style='TFrame')
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        history_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
+        self.history_list = tk.Listbox(
+            list_frame,
+            height=12,
+            font=('Consolas', 9),
+            bg='#eeeae7',
+            fg=text_color,
+            relief='flat',
+            highlightthickness=1.5,
+            highlightbackground='#b3b0a9',
+            highlightcolor='#587d9d',
+            yscrollcommand=history_scrollbar.set
+        )
+        history_scrollbar.config(command=self.history_list.yview)
+        history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.history_list.bind('<Double-Button-1>', lambda e: self.copy_history_item())
+
+        history_btn_frame = ttk.Frame(history_frame, style='TFrame')
+        history_btn_frame.pack(fill=tk.X, pady=(5, 0))
+        self.history_summary_label = ttk.Label(history_btn_frame, text="")
+        self.history_summary_label.pack(side=tk.LEFT)
+        ttk.Button(history_btn_frame, text="复制所选结果", command=self.copy_history_item).pack(side=tk.RIGHT)
+
+        self.sections['历史记录'] = history_section
+
+        # ——— 配置方案 区块 ———
+        profile_section = ttk.Frame(self.content_frame, style='TFrame')
+        profile_list_frame = ttk.LabelFrame(profile_section, text="配置方案", padding=10, style='TLabelframe')
+        profile_list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        ttk.Label(profile_list_frame, textvariable=self.active_profile_var).pack(anchor='w')
+        self.profile_list = tk.Listbox(
+            profile_list_frame,
+            height=8,
+            font=('Consolas', 9),
+            bg='#eeeae7',
+            fg=text_color,
+            relief='flat',
+            highlightthickness=1.5,
+            highlightbackground='#b3b0a9',
+            highlightcolor='#587d9d'
+        )
+        self.profile_list.pack(fill=tk.BOTH, expand=True, pady=(5, 5))
+        self.profile_list.bind('<Double-Button-1>', lambda e: self.activate_selected_profile())
+        profile_btn_frame = ttk.Frame(profile_list_frame, style='TFrame')
+        profile_btn_frame.pack(fill=tk.X)
+        ttk.Button(profile_btn_frame, text="删除所选", command=self.delete_selected_profile).pack(side=tk.RIGHT)
+        ttk.Button(profile_btn_frame, text="使用默认设置",
+                   command=lambda: self.activate_profile(None)).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Button(profile_btn_frame, text="启用所选", command=self.activate_selected_profile).pack(side=tk.RIGHT, padx=(0, 10))
+
+        profile_new_frame = ttk.LabelFrame(profile_section, text="以当前模型、Prompt 和 LaTeX 设置新建", padding=10, style='TLabelframe')
+        profile_new_frame.pack(fill=tk.X, pady=(0, 10))
+        profile_new_frame.grid_columnconfigure(1, weight=1)
+        ttk.Label(profile_new_frame, text="名称:").grid(row=0, column=0, sticky='w')
+        ttk.Entry(profile_new_frame, textvariable=self.profile_name_var).grid(row=0, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        ttk.Label(profile_new_frame, text="热键（如 ctrl+alt+1）:").grid(row=1, column=0, sticky='w')
+        ttk.Entry(profile_new_frame, textvariable=self.profile_hotkey_var).grid(row=1, column=1, sticky='ew', padx=(10, 0), pady=(0, 5))
+        ttk.Label(profile_new_frame, text="最长边上限（0 为不缩放）:").grid(row=2, column=0, sticky='w')
+        ttk.Entry(profile_new_frame, textvariable=self.profile_max_side_var, width=8).grid(row=2, column=1, sticky='w', padx=(10, 0), pady=(0, 5))
+        tk.Checkbutton(
+            profile_new_frame,
+            text="转为灰度后发送",
+            variable=self.profile_grayscale_var,
+            bg=bg_color,
+            fg=text_color
+        ).grid(row=3, column=0, columnspan=2, sticky='w')
+        ttk.Label(profile_new_frame, text="识别引擎（本地引擎需另行安装）:").grid(row=4, column=0, sticky='w')
+        ttk.Combobox(
+            profile_new_frame,
+            textvariable=self.profile_backend_var,
+            values=['api', *LOCAL_BACKENDS],
+            state='readonly',
+            width=12
+        ).grid(row=4, column=1, sticky='w', padx=(10, 0), pady=(5, 5))
+        ttk.Label(profile_new_frame, text="Tesseract 语言:").grid(row=5, column=0, sticky='w')
+        ttk.Entry(profile_new_frame, textvariable=self.profile_tesseract_lang_var, width=16).grid(row=5, column=1, sticky='w', padx=(10, 0), pady=(0, 5))
+        ttk.Button(profile_new_frame, text="保存", command=self.save_current_as_profile).grid(row=5, column=1, sticky='e')
+
+        self.sections['配置方案'] = profile_section
+
         # ——— 日志 区块 ———
         log_section = ttk.Frame(self.content_frame, style='TFrame')
         # 日志显示
@@ -565,8 +834,38 @@ class App:
         for sec in self.sections.values():
             sec.pack_forget()
         self.sections[name].pack(fill=tk.BOTH, expand=True)
+        if name == '历史记录':
+            self.search_history()
         self.root.update_idletasks()
 
+    def search_history(self):
+        """按关键词全文搜索历史记录并刷新列表"""
+        if not self.history_store:
+            return
+        try:
+            self.history_rows = self.history_store.search(self.history_search_var.get())
+        except Exception as e:
+            self.log(f"搜索历史记录失败: {e}")
+            return
+        self.history_list.delete(0, tk.END)
+        for row in self.history_rows:
+            stamp = time.strftime('%m-%d %H:%M', time.localtime(row['created_at']))
+            preview = ' '.join((row['markdown'] or '').split())[:60]
+            self.history_list.insert(tk.END, f"{stamp}  [{row['model'] or ''}]  {preview}")
+        summary = self.history_store.usage_summary()
+        total_tokens = sum(r['total_tokens'] or 0 for r in summary)
+        cached_tokens = sum(r['cached_tokens'] or 0 for r in summary)
+        self.history_summary_label.config(text=f"累计用量: {total_tokens} tokens（其中缓存命中的输入 {cached_tokens}）")
+
+    def copy_history_item(self):
+        """将所选历史结果重新复制到剪贴板，无需再次调用接口"""
+        selection = self.history_list.curselection()
+        if not selection or selection[0] >= len(self.history_rows):
+            return
+        row = self.history_rows[selection[0]]
+        pyperclip.copy(row['markdown'] or '')
+        self.log("已将历史结果复制到剪贴板。")
+
     def debounced_update_wrappers(self, *args):
         """防抖包装符更新"""
         DEBOUNCE_TIME = 2.0  # 1秒防抖时间
@@ -594,8 +893,22 @@ class App:
 
     def log(self, message):
         self.log_text.insert(tk.END, message + "\n")
+        self.trim_log(MAX_LOG_LINES)
         self.log_text.see(tk.END)
 
+    def trim_log(self, max_lines):
+        """删除超出行数上限的旧日志"""
+        line_count = int(self.log_text.index('end-1c').split('.')[0])
+        if line_count > max_lines:
+            self.log_text.delete('1.0', f'{line_count - max_lines + 1}.0')
+
+    def show_memory_snapshot(self, icon=None, item=None):
+        """输出内存统计和 tracemalloc 快照对比"""
+        stats = self.memory_monitor.check()
+        self.log("内存统计: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        for line in self.memory_monitor.snapshot_diff():
+            self.log(line)
+
     def update_wrappers(self):
         """更新包装符并保存配置"""
         inline_wrapper = self.inline_var.get()
@@ -695,7 +1008,7 @@ class App:
                     self.on_screenshot_hotkey_triggered
                 )
                 if result:
-                    self.processor.screenshot_hotkey_isNull = False  # 标记已注册截图快捷键
+                    self.processor.set_screenshot_hotkey(True)  # 标记已注册截图快捷键
                     # 分割快捷键字符串并填充到输入框
                     parts = self.screenshot_hotkey_var.get().strip().split('+')
                     for i in range(1, 4):
@@ -717,19 +1030,76 @@ class App:
         
         try:
             self.hotkey_manager.unregister_screenshot_listener()
-            self.processor.screenshot_hotkey_isNull = True
+            self.processor.set_screenshot_hotkey(False)
         except:
             pass
 
         
+    def save_region_hotkey(self, event=None):
+        """保存区域截图快捷键设置"""
+        if not HotkeyManager.is_supported():
+            return
+
+        try:
+            parts = [self.rk1.get().strip(), self.rk2.get().strip(), self.rk3.get().strip()]
+            combo = '+'.join(p.lower() for p in parts if p)
+            self.region_hotkey_var.set(combo)
+            self.register_region_hotkey()
+            self.save_settings()
+            self.log(f"区域截图快捷键已设置为: {combo}")
+        except Exception as e:
+            self.log(f"区域截图快捷键设置失败: {e}")
+
+    def register_region_hotkey(self):
+        """注册区域截图快捷键（命名热键，回调转到 Tk 主线程执行）"""
+        if not HotkeyManager.is_supported():
+            return
+        self.hotkey_manager.unregister_named_hotkey('region_capture')
+        hotkey = self.region_hotkey_var.get().strip()
+        if not hotkey:
+            return
+        if self.hotkey_manager.register_named_hotkey(
+                'region_capture', hotkey, lambda: self.root.after(0, self.start_region_capture)):
+            # 分割快捷键字符串并填充到输入框
+            parts = hotkey.split('+')
+            for i in range(1, 4):
+                entry = getattr(self, f'rk{i}', None)
+                if entry is None:
+                    break
+                entry.delete(0, tk.END)
+                if i <= len(parts) and parts[i-1]:
+                    entry.insert(0, parts[i-1].lower())
+            self.log(f"已注册区域截图快捷键: {hotkey}")
+        else:
+            self.log(f"注册区域截图快捷键失败: {hotkey}")
+
+    def start_region_capture(self):
+        """打开内置区域截图，选中的区域直接交给识别引擎，不经过剪贴板"""
+        if self.region_selector is None:
+            self.region_selector = RegionSelector(
+                self.root, self.on_region_selected, lambda: self.log("已取消区域截图"))
+        try:
+            self.region_selector.select()
+        except Exception as e:
+            self.log(f"区域截图失败: {e}")
+
+    def on_region_selected(self, image):
+        self.log(f"已截取区域: {image.width}x{image.height}")
+        self.processor.process_region_image(image)
+
     def on_screenshot_hotkey_triggered(self):
         """截图快捷键触发回调"""
         # 延迟一小段时间，确保截图已经保存到剪贴板
         if self.running_state:
-            self.processor.screenshot_hotkey_triggered = True
+            self.processor.trigger_screenshot()
             self.log("检测到截图快捷键触发")
-            # 60s 后重置 screenshot_hotkey_triggered 标志
-            threading.Timer(60, lambda: setattr(self.processor, 'screenshot_hotkey_triggered', False)).start()
+            # 60s 后重置 screenshot_hotkey_triggered 标志，重复触发时复用同一个计时器
+            if self.screenshot_reset_timer:
+                self.screenshot_reset_timer.cancel()
+            self.screenshot_reset_timer = threading.Timer(
+                60, lambda: setattr(self.processor, 'screenshot_hotkey_triggered', False))
+            self.screenshot_reset_timer.daemon = True
+            self.screenshot_reset_timer.start()
 
     def start_processing(self):
         self.processor.start()
@@ -773,10 +1143,30 @@ class App:
                 "停止" if self.running_state else "启动",  # 使用 self.running_state
                 self.toggle_processing
             ),
+            pystray.MenuItem(
+                f"配置方案: {self.profile_manager.active or '默认设置'}",
+                self.create_profile_menu()
+            ),
+            pystray.MenuItem("区域截图识别", lambda icon, item: self.root.after(0, self.start_region_capture)),
             pystray.MenuItem("设置", self.show_window),
+            pystray.MenuItem("内存快照", self.show_memory_snapshot),
             pystray.MenuItem("退出", self.quit_app)
         )
 
+    def create_profile_menu(self):
+        """创建配置方案子菜单"""
+        items = [self.profile_menu_item("默认设置", None)]
+        items += [self.profile_menu_item(name, name) for name in self.profile_manager.names()]
+        return pystray.Menu(*items)
+
+    def profile_menu_item(self, text, name):
+        return pystray.MenuItem(
+            text,
+            lambda icon, item: self.activate_profile(name),
+            checked=lambda item: self.profile_manager.active == name,
+            radio=True
+        )
+
     def toggle_processing(self, icon=None, item=None):
         """切换启动/停止状态"""
         if self.running_state:
@@ -826,7 +1216,25 @@ class App:
     def quit_app(self):
         self.unregister_hotkey()  # 取消热键注册
         self.unregister_screenshot_listener()  # 取消截图监听
+        if HotkeyManager.is_supported():
+            self.hotkey_manager.unregister_all_named_hotkeys()
         self.processor.stop()
+        if self.processor.encode_pool:
+            self.processor.encode_pool.shutdown()
+        self.memory_monitor.stop()
+        if self.api_server:
+            self.api_server.stop()
+        if self.folder_watcher:
+            self.folder_watcher.stop()
+        if self.capture_spool:
+            self.capture_spool.stop()
+        if self.shadow_evaluator:
+            self.shadow_evaluator.stop()
+        self.processor.set_result_cache(None)
+        if self.history_store:
+            self.history_store.close()
+        if self.trace_recorder:
+            self.trace_recorder.close()
         if self.icon:
             self.icon.stop()
         self.root.destroy()  # 修改为 destroy 以立即关闭窗口和主循环
@@ -843,6 +1251,9 @@ class App:
         current_provider = self.provider_var.get()
         settings = self.provider_settings.get(current_provider, {})
         
+        # 更新自定义 URL
+        self.processor.set_base_url(settings.get('url', ''))
+
         # 更新API Key
         self.processor.set_api_key(settings.get('api_key', ''))
         
@@ -860,12 +1271,21 @@ class App:
         # 更新Prompt&Token 设置
         prov_cfg = settings.get('prompt_settings', {})
         self.processor.set_prompts(
-            prov_cfg.get('system_prompt', 'You are a helpful assistant that converts images to markdown format. If the image contains mathematical formulas, use LaTeX syntax for them. Return only the markdown content of the image, without any additional words or explanations.'),
-            prov_cfg.get('user_prompt', 'Here is my image.')
+            prov_cfg.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+            prov_cfg.get('user_prompt', DEFAULT_USER_PROMPT)
         )
         self.processor.set_max_tokens(
             int(prov_cfg.get('max_tokens', 1000))
         )
+        self.processor.set_adaptive_max_tokens(prov_cfg.get('adaptive_max_tokens', False))
+        self.processor.set_progressive_resolution(prov_cfg.get('progressive_resolution', False))
+        self.processor.set_cost_aware_resize(prov_cfg.get('cost_aware_resize', False))
+
+        # 更新模型路由
+        self.processor.set_router(ModelRouter.from_config(settings.get('routing', {}), self.log))
+
+        # 更新识别后翻译
+        self.processor.set_translator(Translator.from_config(self.processor, settings.get('translation', {})))
 
     def apply_provider_settings(self):
         """处理和切换服务商相关的 UI 界面更新和组件显示"""
@@ -911,6 +1331,21 @@ class App:
         sys_txt = prov_cfg.get('system_prompt', self.processor.system_prompt)
         usr_txt = prov_cfg.get('user_prompt',   self.processor.user_prompt)
         max_t  = prov_cfg.get('max_tokens',    self.processor.max_tokens)
+        routing = settings.get('routing', {})
+        self.routing_enabled_var.set(routing.get('enabled', False))
+        self.routing_fast_var.set(routing.get('fast_model', ''))
+        self.routing_strong_var.set(routing.get('strong_model', ''))
+        self.routing_thresholds = dict(DEFAULT_THRESHOLDS)
+        self.routing_thresholds.update(routing.get('thresholds', {}))
+        self.routing_lines_var.set(self.routing_thresholds['max_simple_lines'])
+        self.routing_ink_var.set(self.routing_thresholds['max_simple_ink'])
+        translation = settings.get('translation', {})
+        self.translation_enabled_var.set(translation.get('enabled', False))
+        self.translation_model_var.set(translation.get('model', ''))
+        self.translation_language_var.set(translation.get('language', '') or '简体中文')
+        adaptive = prov_cfg.get('adaptive_max_tokens', False)
+        progressive = prov_cfg.get('progressive_resolution', False)
+        cost_aware = prov_cfg.get('cost_aware_resize', False)
 
         # 更新多行文本框
         self.system_text.delete('1.0', tk.END)
@@ -919,6 +1354,9 @@ class App:
         self.user_text.insert('1.0',   usr_txt)
         # 更新 max_tokens 输入框
         self.max_tokens_var.set(max_t)
+        self.adaptive_max_tokens_var.set(adaptive)
+        self.progressive_resolution_var.set(progressive)
+        self.cost_aware_resize_var.set(cost_aware)
         
         # 确保在应用设置时更新客户端
         self.update_client_settings()
@@ -963,6 +1401,26 @@ class App:
                 'model': self.model_var.get().strip()
             }
             
+        # 模型路由
+        thresholds = dict(self.routing_thresholds)
+        thresholds.update({
+            'max_simple_lines': self.routing_lines_var.get(),
+            'max_simple_ink':   self.routing_ink_var.get()
+        })
+        settings['routing'] = {
+            'enabled':      self.routing_enabled_var.get(),
+            'fast_model':   self.routing_fast_var.get().strip(),
+            'strong_model': self.routing_strong_var.get().strip(),
+            'thresholds':   thresholds
+        }
+
+        # 识别后翻译
+        settings['translation'] = {
+            'enabled':  self.translation_enabled_var.get(),
+            'model':    self.translation_model_var.get().strip(),
+            'language': self.translation_language_var.get().strip()
+        }
+
         self.provider_settings[current_provider] = settings
         
         # 保存 LaTeX 包装符
@@ -976,7 +1434,10 @@ class App:
         self.provider_settings[current_provider]['prompt_settings'].update({
             'system_prompt': self.system_text.get("1.0","end-1c").strip(),
             'user_prompt':   self.user_text.get("1.0","end-1c").strip(),
-            'max_tokens':    self.max_tokens_var.get()
+            'max_tokens':    self.max_tokens_var.get(),
+            'adaptive_max_tokens': self.adaptive_max_tokens_var.get(),
+            'progressive_resolution': self.progressive_resolution_var.get(),
+            'cost_aware_resize': self.cost_aware_resize_var.get()
         })
 
         # 构造最终要写入的 config
@@ -986,16 +1447,332 @@ class App:
             'latex_settings':          latex_cfg,
             'hotkey':                  self.hotkey_var.get(),
             'screenshot_hotkey':       self.screenshot_hotkey_var.get(),
-            'process_pre_exist_image': self.process_pre_exist_image_var.get()
+            'region_hotkey':           self.region_hotkey_var.get(),
+            'process_pre_exist_image': self.process_pre_exist_image_var.get(),
+            'spool_enabled':           self.spool_enabled_var.get(),
+            'scroll_stitch':           self.scroll_stitch_var.get(),
+            'prefilter': {
+                'enabled':   self.prefilter_enabled_var.get(),
+                'threshold': self.prefilter_threshold_var.get(),
+                'action':    self.prefilter_action_var.get()
+            },
+            'history_enabled':         self.history_enabled_var.get(),
+            'memory_limit_mb':         self.memory_limit_var.get(),
+            'encode_workers':          self.encode_workers_var.get(),
+            'profiles':                self.profile_manager.profiles,
+            'active_profile':          self.profile_manager.active or '',
+            'api_server': {
+                'enabled':     self.api_server_enabled_var.get(),
+                'port':        self.api_server_port_var.get(),
+                'unix_socket': self.api_server_socket
+            },
+            'watch_folder': {
+                'enabled':     self.watch_folder_enabled_var.get(),
+                'path':        self.watch_folder_path_var.get().strip(),
+                'output':      self.watch_folder_output_var.get(),
+                'target_file': self.watch_folder_target_var.get().strip(),
+                'workers':     self.watch_folder_workers
+            },
+            'result_cache': {
+                'enabled': self.result_cache_enabled_var.get(),
+                'url':     self.result_cache_url_var.get().strip(),
+                'token':   self.result_cache_token_var.get().strip(),
+                'timeout': self.result_cache_timeout,
+                'publish': self.result_cache_publish_var.get()
+            },
+            'pack_images':             self.pack_images_var.get(),
+            'scheduler': {
+                'enabled':    self.scheduler_enabled_var.get(),
+                'rate_limit': self.scheduler_rate_limit_var.get(),
+                'caps':       self.scheduler_caps
+            },
+            'shadow': {
+                'enabled':  self.shadow_enabled_var.get(),
+                'profile':  self.shadow_profile_var.get(),
+                'fraction': self.shadow_fraction_var.get(),
+                'prices':   self.shadow_prices
+            },
+            'trace_dir':               self.trace_dir
         }
         # 更新处理起始图片设置
         self.processor.process_pre_exist_image=config.get('process_pre_exist_image', False)
+        self.processor.set_prefilter(DocumentFilter.from_config(config['prefilter'], self.log))
+        self.processor.set_scroll_stitch(config['scroll_stitch'])
+        self.processor.apply_result_cache_settings(config['result_cache'])
+        self.processor.apply_scheduler_settings(config['scheduler'])
+        self.processor.set_pack_images(config['pack_images'])
+        self.apply_history_settings()
+        self.apply_spool_settings()
+        self.memory_monitor.set_limit(config['memory_limit_mb'])
+        self.apply_encode_pool_settings()
         try:
             self.config_manager.save(config)
             self.update_client_settings()
+            self.profile_manager.load(config)
+            self.apply_shadow_settings(config)
+            self.apply_api_server_settings()
+            self.apply_watch_folder_settings()
         except Exception as e:
             self.log(f"保存设置失败: {e}")
 
+    def refresh_profile_list(self):
+        """刷新配置方案列表和当前配置方案显示"""
+        self.profile_list.delete(0, tk.END)
+        for name in self.profile_manager.names():
+            profile = self.profile_manager.profiles[name]
+            marker = '*' if name == self.profile_manager.active else ' '
+            hotkey = f"[{profile['hotkey']}] " if profile.get('hotkey') else ''
+            engine = profile.get('backend') or f"{profile.get('provider', '')}/{profile.get('model', '')}"
+            self.profile_list.insert(tk.END, f"{marker} {name}  {hotkey}{engine}")
+        self.active_profile_var.set(f"当前: {self.profile_manager.active or '默认设置'}")
+        self.shadow_profile_combo['values'] = self.profile_manager.names()
+
+    def save_current_as_profile(self):
+        """以当前模型、Prompt 和 LaTeX 设置保存配置方案（API Key 和代理沿用服务商设置）"""
+        name = self.profile_name_var.get().strip()
+        if not name:
+            self.log("配置方案名称不能为空")
+            return
+        provider = self.provider_var.get()
+        backend = self.profile_backend_var.get()
+        backend_options = {}
+        if backend == 'tesseract':
+            backend_options['lang'] = self.profile_tesseract_lang_var.get().strip() or 'eng'
+        self.profile_manager.set_profile(name, {
+            'provider':            provider,
+            'url':                 self.url_var.get().strip() if provider == '自定义' else '',
+            'model':               self.model_var.get().strip(),
+            'system_prompt':       self.system_text.get("1.0", "end-1c").strip(),
+            'user_prompt':         self.user_text.get("1.0", "end-1c").strip(),
+            'max_tokens':          self.max_tokens_var.get(),
+            'adaptive_max_tokens': self.adaptive_max_tokens_var.get(),
+            'progressive_resolution': self.progressive_resolution_var.get(),
+            'cost_aware_resize':   self.cost_aware_resize_var.get(),
+            'inline_wrapper':      self.inline_var.get(),
+            'block_wrapper':       self.block_var.get(),
+            'preprocess': {
+                'grayscale': self.profile_grayscale_var.get(),
+                'max_side':  self.profile_max_side_var.get()
+            },
+            'routing':             self.provider_settings.get(provider, {}).get('routing', {}),
+            'translation':         self.provider_settings.get(provider, {}).get('translation', {}),
+            'backend':             '' if backend == 'api' else backend,
+            'backend_options':     backend_options,
+            'hotkey':              self.profile_hotkey_var.get().strip().lower()
+        })
+        self.save_settings()
+        self.register_profile_hotkeys()
+        self.refresh_profile_list()
+        self.log(f"已保存配置方案: {name}")
+
+    def selected_profile_name(self):
+        selection = self.profile_list.curselection()
+        names = self.profile_manager.names()
+        if not selection or selection[0] >= len(names):
+            return None
+        return names[selection[0]]
+
+    def delete_selected_profile(self):
+        name = self.selected_profile_name()
+        if not name:
+            return
+        self.profile_manager.remove_profile(name)
+        self.save_settings()
+        self.register_profile_hotkeys()
+        self.refresh_profile_list()
+        self.icon.menu = self.create_menu()
+        self.log(f"已删除配置方案: {name}")
+
+    def activate_selected_profile(self):
+        name = self.selected_profile_name()
+        if name:
+            self.activate_profile(name)
+
+    def activate_profile(self, name):
+        """切换配置方案，管线已预先建好，不会重建客户端"""
+        if not self.profile_manager.activate(name):
+            return
+        self.refresh_profile_list()
+        self.icon.menu = self.create_menu()
+        self.log(f"已切换到配置方案: {name or '默认设置'}")
+        # 仅记录当前配置方案，无需走完整的保存流程
+        try:
+            cfg = self.config_manager.load() or {}
+            cfg['active_profile'] = name or ''
+            self.config_manager.save(cfg)
+        except Exception as e:
+            self.log(f"保存当前配置方案失败: {e}")
+
+    def on_profile_hotkey(self, name):
+        """配置方案热键回调：切换配置方案，绑定截图快捷键时同时等待下一张截图"""
+        self.activate_profile(name)
+        if not self.processor.screenshot_hotkey_isNull:
+            self.on_screenshot_hotkey_triggered()
+
+    def register_profile_hotkeys(self):
+        """按配置方案重新注册热键"""
+        if not HotkeyManager.is_supported():
+            return
+        self.hotkey_manager.unregister_all_named_hotkeys()
+        for name, hotkey in self.profile_manager.hotkeys().items():
+            if self.hotkey_manager.register_named_hotkey(
+                    name, hotkey, lambda n=name: self.on_profile_hotkey(n)):
+                self.log(f"已注册配置方案热键: {hotkey} -> {name}")
+            else:
+                self.log(f"注册配置方案热键失败: {hotkey}")
+        # 区域截图快捷键同样是命名热键，需要一并重新注册
+        self.register_region_hotkey()
+
+    def apply_history_settings(self):
+        """根据设置启用或停用历史记录"""
+        if self.history_enabled_var.get() and self.history_store:
+            self.processor.set_history(self.history_store)
+        else:
+            self.processor.set_history(None)
+
+    def confirm_prefilter(self, score, reason):
+        """识别前过滤的询问回调，在剪贴板线程中调用，弹窗在 Tk 主线程中显示；一分钟未回答视为跳过"""
+        answer = {'value': False}
+        done = threading.Event()
+
+        def ask():
+            try:
+                answer['value'] = messagebox.askyesno(
+                    "PillOCR",
+                    f"剪贴板中的图片看起来不含文字或公式（得分 {score:.2f}）。\n{reason}\n\n仍要发送识别吗？"
+                )
+            finally:
+                done.set()
+
+        self.root.after(0, ask)
+        done.wait(timeout=60)
+        return answer['value']
+
+    def apply_spool_settings(self):
+        """启用时截图先写入磁盘缓冲区，由后台线程识别；上次未识别完的截图在此时重新识别"""
+        if self.spool_enabled_var.get() and not self.capture_spool:
+            try:
+                self.capture_spool = CaptureSpool(self.processor.handle_spooled, log_callback=self.log)
+                self.capture_spool.start()
+            except OSError as e:
+                self.capture_spool = None
+                self.log(f"打开截图缓冲区失败: {e}")
+        elif not self.spool_enabled_var.get() and self.capture_spool:
+            # 未识别的截图留在磁盘上，重新启用时继续识别
+            self.capture_spool.stop()
+            self.capture_spool = None
+        self.processor.set_spool(self.capture_spool)
+
+    def apply_encode_pool_settings(self):
+        """按设置的进程数创建或关闭编码进程池"""
+        workers = max(0, self.encode_workers_var.get())
+        pool = self.processor.encode_pool
+        if pool and pool.max_workers == workers:
+            return
+        if pool:
+            pool.shutdown()
+        self.processor.set_encode_pool(EncodePool(workers) if workers else None)
+
+    def apply_trace_settings(self):
+        """配置了录制目录时开始录制每次识别，供 pillocr_replay.py 重放"""
+        if self.trace_recorder and self.trace_recorder.trace_dir != self.trace_dir:
+            self.trace_recorder.close()
+            self.trace_recorder = None
+        if self.trace_dir and not self.trace_recorder:
+            try:
+                self.trace_recorder = TraceRecorder(self.trace_dir, log_callback=self.log)
+                self.log(f"正在录制识别: {self.trace_dir}")
+            except OSError as e:
+                self.log(f"打开录制目录失败: {e}")
+        self.processor.set_trace(self.trace_recorder)
+
+    def apply_api_server_settings(self):
+        """根据设置启动或停止本地识别接口"""
+        enabled = self.api_server_enabled_var.get()
+        port = self.api_server_port_var.get()
+        if self.api_server and (not enabled or self.api_server.port != port
+                                or self.api_server.unix_socket != (self.api_server_socket or None)):
+            self.api_server.stop()
+            self.api_server = None
+        if enabled and not self.api_server:
+            self.api_server = RecognitionServer(
+                self.processor,
+                port=port,
+                unix_socket=self.api_server_socket or None,
+                log_callback=self.log
+            )
+            if not self.api_server.start():
+                self.api_server = None
+
+    def choose_path(self, variable, directory=False):
+        """弹出文件夹或文件选择框，将结果写入 variable"""
+        if directory:
+            path = filedialog.askdirectory(initialdir=variable.get() or None)
+        else:
+            path = filedialog.asksaveasfilename(
+                initialfile=variable.get() or 'PillOCR.md',
+                defaultextension='.md',
+                filetypes=[('Markdown', '*.md'), ('所有文件', '*.*')]
+            )
+        if path:
+            variable.set(path)
+
+    def apply_shadow_settings(self, config):
+        """按配置创建或停止影子评估，候选配置方案或设置变化时重新创建"""
+        evaluator = create_shadow_evaluator(config, self.profile_manager, self.log)
+        current = self.shadow_evaluator
+        if current and evaluator and current.signature == evaluator.signature:
+            evaluator.stop()
+            return
+        if current:
+            current.stop()
+        self.shadow_evaluator = evaluator
+        self.processor.set_shadow(evaluator)
+        if evaluator:
+            self.log(f"影子评估已启用: {evaluator.fraction:.0%} 的截图同时交给「{evaluator.candidate_name}」识别")
+
+    def show_shadow_report(self):
+        """在日志中输出影子评估汇总"""
+        try:
+            if self.shadow_evaluator:
+                report = self.shadow_evaluator.report(self.shadow_prices)
+            else:
+                report = load_report(prices=self.shadow_prices)
+            for line in format_report(report):
+                self.log(line)
+        except Exception as e:
+            self.log(f"读取影子评估结果失败: {e}")
+
+    def show_scheduler_summary(self):
+        """在日志中输出每类任务的排队统计"""
+        if not self.processor.scheduler:
+            self.log("请求调度未启用")
+            return
+        for line in format_scheduler_summary(self.processor.scheduler.summary()):
+            self.log(line)
+
+    def apply_watch_folder_settings(self):
+        """根据设置开始或停止监听文件夹"""
+        enabled = self.watch_folder_enabled_var.get()
+        folder = self.watch_folder_path_var.get().strip()
+        output = self.watch_folder_output_var.get()
+        target = self.watch_folder_target_var.get().strip()
+        watcher = self.folder_watcher
+        if watcher and (not enabled or (watcher.folder, watcher.output, watcher.target_file, watcher.workers)
+                        != (os.path.abspath(folder or '.'), output, target, self.watch_folder_workers)):
+            watcher.stop()
+            self.folder_watcher = None
+        if enabled and folder and not self.folder_watcher:
+            watcher = FolderWatcher(
+                self.processor, folder,
+                output=output,
+                target_file=target,
+                workers=self.watch_folder_workers,
+                log_callback=self.log
+            )
+            if watcher.start():
+                self.folder_watcher = watcher
+
     def load_settings(self):
         """从配置文件加载设置到内存"""
         try:
@@ -1014,8 +1791,56 @@ class App:
             # 恢复热键相关设置
             self.hotkey_var.set(config.get('hotkey', 'ctrl+shift+o'))
             self.screenshot_hotkey_var.set(config.get('screenshot_hotkey', ''))
+            self.region_hotkey_var.set(config.get('region_hotkey', ''))
             self.process_pre_exist_image_var.set(config.get('process_pre_exist_image', False))
             self.processor.process_pre_exist_image = self.process_pre_exist_image_var.get()
+            self.spool_enabled_var.set(config.get('spool_enabled', True))
+            self.scroll_stitch_var.set(config.get('scroll_stitch', False))
+            self.processor.set_scroll_stitch(self.scroll_stitch_var.get())
+            prefilter_cfg = config.get('prefilter', {})
+            self.prefilter_enabled_var.set(prefilter_cfg.get('enabled', False))
+            self.prefilter_threshold_var.set(prefilter_cfg.get('threshold', PREFILTER_THRESHOLD))
+            self.prefilter_action_var.set(prefilter_cfg.get('action', 'skip'))
+            self.processor.set_prefilter(DocumentFilter.from_config(prefilter_cfg, self.log))
+            api_cfg = config.get('api_server', {})
+            self.api_server_enabled_var.set(api_cfg.get('enabled', False))
+            self.api_server_port_var.set(api_cfg.get('port', 8765))
+            self.api_server_socket = api_cfg.get('unix_socket', '')
+            watch_cfg = config.get('watch_folder', {})
+            self.watch_folder_enabled_var.set(watch_cfg.get('enabled', False))
+            self.watch_folder_path_var.set(watch_cfg.get('path', ''))
+            self.watch_folder_output_var.set(watch_cfg.get('output', 'sidecar'))
+            self.watch_folder_target_var.set(watch_cfg.get('target_file', ''))
+            self.watch_folder_workers = watch_cfg.get('workers', 2)
+            cache_cfg = config.get('result_cache', {})
+            self.result_cache_enabled_var.set(cache_cfg.get('enabled', False))
+            self.result_cache_url_var.set(cache_cfg.get('url', ''))
+            self.result_cache_token_var.set(cache_cfg.get('token', ''))
+            self.result_cache_publish_var.set(cache_cfg.get('publish', True))
+            self.result_cache_timeout = cache_cfg.get('timeout', 0.3)
+            self.processor.apply_result_cache_settings(cache_cfg)
+            scheduler_cfg = config.get('scheduler', {})
+            self.scheduler_enabled_var.set(scheduler_cfg.get('enabled', False))
+            self.scheduler_rate_limit_var.set(scheduler_cfg.get('rate_limit', 0))
+            self.scheduler_caps = scheduler_cfg.get('caps', {})
+            self.processor.apply_scheduler_settings(scheduler_cfg)
+            # 旧版本的设置保存在 api_server.pack_images 中
+            self.pack_images_var.set(config.get('pack_images', api_cfg.get('pack_images', 1)))
+            self.processor.set_pack_images(self.pack_images_var.get())
+            shadow_cfg = config.get('shadow', {})
+            self.shadow_enabled_var.set(shadow_cfg.get('enabled', False))
+            self.shadow_profile_var.set(shadow_cfg.get('profile', ''))
+            self.shadow_fraction_var.set(shadow_cfg.get('fraction', 0.1))
+            self.shadow_prices = shadow_cfg.get('prices', {})
+            self.history_enabled_var.set(config.get('history_enabled', True))
+            self.apply_history_settings()
+            self.trace_dir = config.get('trace_dir', '')
+            self.apply_trace_settings()
+            self.memory_limit_var.set(config.get('memory_limit_mb', 0))
+            self.memory_monitor.set_limit(self.memory_limit_var.get())
+            self.memory_monitor.start()
+            self.encode_workers_var.set(config.get('encode_workers', 0))
+            self.apply_encode_pool_settings()
             self.register_hotkey()
             self.register_screenshot_listener()
 
@@ -1034,13 +1859,43 @@ class App:
 
             # 应用服务商 UI 和 client 设置
             self.apply_provider_settings()
+
+            # 创建并预热所有配置方案的管线
+            self.profile_manager.load(config)
+            self.profile_manager.activate(config.get('active_profile', ''))
+            # 服务商和配置方案就绪后再开始识别缓冲区中遗留的截图
+            self.apply_spool_settings()
+            self.register_profile_hotkeys()
+            self.refresh_profile_list()
+            self.icon.menu = self.create_menu()
+            self.apply_shadow_settings(config)
+            self.apply_api_server_settings()
+            self.apply_watch_folder_settings()
         except Exception as e:
             self.log(f"加载配置失败: {e}")
 
     def quit_app(self):
         self.unregister_hotkey()  # 取消热键注册
         self.unregister_screenshot_listener()  # 取消截图监听
+        if HotkeyManager.is_supported():
+            self.hotkey_manager.unregister_all_named_hotkeys()
         self.processor.stop()
+        if self.processor.encode_pool:
+            self.processor.encode_pool.shutdown()
+        self.memory_monitor.stop()
+        if self.api_server:
+            self.api_server.stop()
+        if self.folder_watcher:
+            self.folder_watcher.stop()
+        if self.capture_spool:
+            self.capture_spool.stop()
+        if self.shadow_evaluator:
+            self.shadow_evaluator.stop()
+        self.processor.set_result_cache(None)
+        if self.history_store:
+            self.history_store.close()
+        if self.trace_recorder:
+            self.trace_recorder.close()
         if self.icon:
             self.icon.stop()
         self.root.destroy()  # 修改为 destroy 以立即关闭窗口和主循环
@@ -1106,6 +1961,8 @@ class App:
 
 
 if __name__ == "__main__":
+    # 打包后的程序启动编码子进程时需要
+    multiprocessing.freeze_support()
     root = tk.Tk()
     root.geometry("800x800+{}+{}".format(
         root.winfo_screenwidth() // 2 - 400,  # 水平居中
@@ -1113,11 +1970,11 @@ if __name__ == "__main__":
     ))  # 调整窗口大小以适应新布局
     # 在创建窗口后立即隐藏
     root.withdraw()
-    processor = ImageToMarkdown(None, None)
+    processor = ImageToMarkdown()
     app = App(root, processor)
 
-    # 更新 processor 的引用
+    # 更新 processor 的回调
     processor.log_callback = app.log
-    processor.app = app
+    processor.status_callback = app.update_icon_status
     root.withdraw()
     root.mainloop()
@@ -24,6 +24,30 @@ a = Analysis(
         'utils.config_manager',
         'processors.image_encoder',
         'processors.markdown_processor',
+        'processors.image_to_markdown',
+        'processors.image_features',
+        'processors.profile_manager',
+        'processors.model_router',
+        'processors.output_checks',
+        'processors.backends',
+        'processors.request_packer',
+        'processors.translator',
+        'processors.image_cost',
+        'processors.shadow_eval',
+        'processors.document_filter',
+        'processors.scroll_stitch',
+        'processors.result_cache',
+        'processors.scheduler',
+        'processors.encode_pool',
+        'utils.api_server',
+        'utils.cache_server',
+        'utils.history_store',
+        'utils.memory_monitor',
+        'utils.trace_recorder',
+        'utils.region_selector',
+        'utils.folder_watcher',
+        'processors.batch_job',
+        'utils.capture_spool',
         'keyboard'
     ],
     hookspath=[],
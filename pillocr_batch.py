@@ -0,0 +1,56 @@
+"""PillOCR 批量转换
+
+使用服务商的 Batch API（OpenAI 兼容的 /v1/files 和 /v1/batches 接口）批量识别图片，
+结果经过与剪贴板识别相同的后处理，每张图片输出一个同名 .md 文件：
+
+    python pillocr_batch.py INPUT... --out DIR [--config PATH] [--poll 30] [--no-wait]
+
+INPUT 可以是图片或目录（递归查找图片）。任务状态保存在 DIR/batch_state.json 中，
+中断后用相同的命令重新运行即可继续，已提交的任务不会重复提交。
+"""
+import argparse
+import json
+import os
+import sys
+from processors.batch_job import BatchJob, collect_images
+from processors.image_to_markdown import ImageToMarkdown
+from utils.config_manager import ConfigManager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pillocr-batch', description='使用 Batch API 批量识别图片')
+    parser.add_argument('inputs', nargs='*', help='图片文件或目录；继续已有任务时可以省略')
+    parser.add_argument('--out', required=True, help='输出目录')
+    parser.add_argument('--config', help='配置文件路径，默认使用设置窗口保存的配置')
+    parser.add_argument('--poll', type=float, default=30, help='轮询间隔（秒）')
+    parser.add_argument('--no-wait', action='store_true', help='只提交和查询一次，不等待任务结束')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出各状态的图片数')
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager()
+    if args.config:
+        config_manager.config_file = os.path.abspath(args.config)
+    config = config_manager.load() or {}
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    processor = ImageToMarkdown(log_callback=log)
+    processor.apply_config(config)
+    # 批量模式总是通过服务商接口识别，不使用本地后端和识别后翻译
+    processor.set_backend('')
+    processor.set_translator(None)
+
+    job = BatchJob(processor, args.out, log_callback=log)
+    added = job.add_images(collect_images(args.inputs))
+    if added:
+        log(f"新增 {added} 张图片")
+    counts = job.run(poll_interval=max(args.poll, 1), wait=not args.no_wait)
+    if args.json:
+        print(json.dumps(counts, ensure_ascii=False))
+        return
+    print('，'.join(f"{status}: {count}" for status, count in sorted(counts.items())) or '没有需要识别的图片')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""PillOCR 团队共享结果缓存服务
+
+团队成员识别相同的教材、论文截图时共用识别结果，同一张图片只需付费识别一次。
+服务只保存缓存键（图片指纹、模型和 Prompt 的哈希）和识别结果文本，不接收图片：
+
+    python pillocr_cache.py [--host 0.0.0.0] [--port 8790] [--db PATH] [--token TOKEN]
+
+客户端在配置文件的 result_cache 中设置 url（和 token）后，识别前先查询该服务，识别后上传结果。
+"""
+import argparse
+import os
+import threading
+from utils.cache_server import CacheServer
+from utils.path_tools import get_app_data_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pillocr-cache', description='PillOCR 团队共享结果缓存服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，供团队使用时设为 0.0.0.0')
+    parser.add_argument('--port', type=int, default=8790, help='监听端口')
+    parser.add_argument('--db', help='数据库路径，默认为应用数据目录下的 team_cache.db')
+    parser.add_argument('--token', default=os.environ.get('PILLOCR_CACHE_TOKEN', ''),
+                        help='访问令牌，默认读取环境变量 PILLOCR_CACHE_TOKEN，为空时不校验')
+    args = parser.parse_args(argv)
+
+    server = CacheServer(
+        args.db or os.path.join(get_app_data_dir(), 'team_cache.db'),
+        host=args.host,
+        port=args.port,
+        token=args.token,
+        log_callback=print
+    )
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""PillOCR 无界面守护进程
+
+不加载 Tk 和 pystray，仅运行剪贴板监听（以及配置中启用的本地识别接口），
+适合在 systemd 等进程管理器下长期运行：
+
+    python pillocr_daemon.py [--config PATH] [--status-socket PATH] [--record-trace DIR]
+
+信号:
+    SIGHUP          重新加载配置文件并重启监听
+    SIGUSR1         输出内存统计和 tracemalloc 快照对比
+    SIGTERM/SIGINT  退出
+
+状态查询:
+    连接 status socket 即可读到一行 JSON 格式的运行状态，例如
+    socat - UNIX-CONNECT:$XDG_CONFIG_HOME/PillOCR/pillocr.sock
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from processors.image_to_markdown import ImageToMarkdown
+from processors.profile_manager import ProfileManager
+from processors.encode_pool import EncodePool
+from utils.config_manager import ConfigManager
+from utils.path_tools import get_app_data_dir
+from utils.api_server import RecognitionServer
+from utils.history_store import HistoryStore
+from utils.memory_monitor import MemoryMonitor
+from utils.trace_recorder import TraceRecorder
+from utils.folder_watcher import FolderWatcher
+from utils.capture_spool import CaptureSpool
+from processors.shadow_eval import create_shadow_evaluator
+
+logger = logging.getLogger('pillocr')
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，便于 journald 等收集"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class StatusRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        status = self.server.daemon.status()
+        self.wfile.write(json.dumps(status, ensure_ascii=False).encode('utf-8') + b"\n")
+
+
+class ThreadingUnixStatusServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPStatusServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PillOCRDaemon:
+    def __init__(self, config_manager, status_socket=None, status_port=0, restart_delay=30, record_trace=''):
+        self.config_manager = config_manager
+        self.record_trace = record_trace
+        self.trace_recorder = None
+        self.status_socket = status_socket
+        self.status_port = status_port
+        self.restart_delay = restart_delay
+        self.processor = ImageToMarkdown(self.on_log, self.on_status)
+        self.memory_monitor = MemoryMonitor(log_callback=self.on_log)
+        self.processor.set_memory_monitor(self.memory_monitor)
+        self.profile_manager = ProfileManager(log_callback=self.on_log)
+        self.processor.set_profile_manager(self.profile_manager)
+        self.snapshot_requested = threading.Event()
+        self.history_store = None
+        self.api_server = None
+        self.folder_watcher = None
+        self.capture_spool = None
+        self.shadow_evaluator = None
+        self.status_server = None
+        self.started_at = time.time()
+        self.reloaded_at = None
+        self.reload_requested = threading.Event()
+        self.stop_requested = threading.Event()
+
+    def on_log(self, message):
+        logger.info(message, extra={'fields': {'event': 'processor'}})
+
+    def on_status(self, status):
+        logger.info(f"状态: {status}", extra={'fields': {'event': 'status', 'status': status}})
+
+    def status(self):
+        """供 status socket 返回的运行状态"""
+        return {
+            'pid': os.getpid(),
+            'running': self.processor.running,
+            'status': self.processor.status,
+            'provider': self.processor.current_provider,
+            'model': self.processor.gpt_model,
+            'profile': self.profile_manager.active,
+            'routing': self.processor.router.decisions if self.processor.router else None,
+            'prefilter': self.processor.prefilter.decisions if self.processor.prefilter else None,
+            'scroll_stitch': self.processor.scroll_stitcher.summary() if self.processor.scroll_stitcher else None,
+            'result_cache': self.processor.result_cache.summary() if self.processor.result_cache else None,
+            'scheduler': self.processor.scheduler.summary() if self.processor.scheduler else None,
+            'progressive': self.processor.progressive_summary(),
+            'image_cost': self.processor.image_cost_summary(),
+            'translation': self.processor.translator.stats if self.processor.translator else None,
+            'processed': self.processor.processed_count,
+            'last_error': self.processor.last_error,
+            'api_server': self.api_server.is_running if self.api_server else False,
+            'watch_folder': self.folder_watcher.summary() if self.folder_watcher else None,
+            'spool': self.capture_spool.summary() if self.capture_spool else None,
+            'shadow': self.shadow_evaluator.stats if self.shadow_evaluator else None,
+            'uptime': round(time.time() - self.started_at, 1),
+            'reloaded_at': self.reloaded_at,
+            'memory': self.memory_monitor.stats(),
+        }
+
+    def load(self):
+        """读取配置并应用到处理器、历史记录和本地识别接口"""
+        config = self.config_manager.load() or {}
+        self.processor.apply_config(config)
+        self.memory_monitor.set_limit(config.get('memory_limit_mb', 0))
+        workers = max(0, int(config.get('encode_workers', 0) or 0))
+        pool = self.processor.encode_pool
+        if not pool or pool.max_workers != workers:
+            if pool:
+                pool.shutdown()
+            self.processor.set_encode_pool(EncodePool(workers) if workers else None)
+        self.profile_manager.load(config)
+        self.profile_manager.activate(config.get('active_profile', ''))
+        if self.shadow_evaluator:
+            self.shadow_evaluator.stop()
+        self.shadow_evaluator = create_shadow_evaluator(config, self.profile_manager, self.on_log)
+        self.processor.set_shadow(self.shadow_evaluator)
+
+        if config.get('history_enabled', True):
+            if not self.history_store:
+                self.history_store = HistoryStore(log_callback=self.on_log)
+            self.processor.set_history(self.history_store)
+        else:
+            self.processor.set_history(None)
+
+        if config.get('spool_enabled', True):
+            if not self.capture_spool:
+                self.capture_spool = CaptureSpool(self.processor.handle_spooled, log_callback=self.on_log)
+                self.capture_spool.start()
+        elif self.capture_spool:
+            self.capture_spool.stop()
+            self.capture_spool = None
+        self.processor.set_spool(self.capture_spool)
+
+        trace_dir = self.record_trace or config.get('trace_dir', '')
+        if self.trace_recorder and self.trace_recorder.trace_dir != trace_dir:
+            self.trace_recorder.close()
+            self.trace_recorder = None
+        if trace_dir and not self.trace_recorder:
+            self.trace_recorder = TraceRecorder(trace_dir, log_callback=self.on_log)
+            logger.info("正在录制识别", extra={'fields': {'event': 'trace', 'dir': trace_dir}})
+        self.processor.set_trace(self.trace_recorder)
+
+        api_cfg = config.get('api_server', {})
+        if self.api_server:
+            self.api_server.stop()
+            self.api_server = None
+        if api_cfg.get('enabled', False):
+            self.api_server = RecognitionServer(
+                self.processor,
+                port=api_cfg.get('port', 8765),
+                unix_socket=api_cfg.get('unix_socket') or None,
+                log_callback=self.on_log
+            )
+            if not self.api_server.start():
+                self.api_server = None
+
+        watch_cfg = config.get('watch_folder', {})
+        if self.folder_watcher:
+            self.folder_watcher.stop()
+            self.folder_watcher = None
+        if watch_cfg.get('enabled', False) and watch_cfg.get('path'):
+            self.folder_watcher = FolderWatcher(
+                self.processor, watch_cfg['path'],
+                output=watch_cfg.get('output', 'sidecar'),
+                target_file=watch_cfg.get('target_file', ''),
+                workers=watch_cfg.get('workers', 2),
+                log_callback=self.on_log
+            )
+            if not self.folder_watcher.start():
+                self.folder_watcher = None
+        logger.info("配置已加载", extra={'fields': {
+            'event': 'config',
+            'provider': self.processor.current_provider,
+            'model': self.processor.gpt_model,
+        }})
+
+    def start_status_server(self):
+        try:
+            if self.status_socket and hasattr(socket, 'AF_UNIX'):
+                if os.path.exists(self.status_socket):
+                    os.remove(self.status_socket)
+                self.status_server = ThreadingUnixStatusServer(self.status_socket, StatusRequestHandler)
+                os.chmod(self.status_socket, 0o600)
+                address = f"unix:{self.status_socket}"
+            elif self.status_port:
+                self.status_server = ThreadingTCPStatusServer(('127.0.0.1', self.status_port), StatusRequestHandler)
+                address = f"tcp:127.0.0.1:{self.status_port}"
+            else:
+                return
+        except OSError as e:
+            logger.error(f"启动状态接口失败: {e}", extra={'fields': {'event': 'status_socket'}})
+            return
+        self.status_server.daemon = self
+        threading.Thread(target=self.status_server.serve_forever, daemon=True).start()
+        logger.info("状态接口已启动", extra={'fields': {'event': 'status_socket', 'address': address}})
+
+    def request_reload(self, signum=None, frame=None):
+        self.reload_requested.set()
+
+    def request_snapshot(self, signum=None, frame=None):
+        self.snapshot_requested.set()
+
+    def request_stop(self, signum=None, frame=None):
+        self.stop_requested.set()
+
+    def run(self):
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.request_snapshot)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        self.load()
+        self.start_status_server()
+        self.processor.start()
+        self.memory_monitor.start()
+        logger.info("守护进程已启动", extra={'fields': {'event': 'start', 'pid': os.getpid()}})
+
+        stopped_at = None
+        while not self.stop_requested.wait(0.5):
+            if self.snapshot_requested.is_set():
+                self.snapshot_requested.clear()
+                logger.info("内存统计", extra={'fields': {'event': 'memory', **self.memory_monitor.stats()}})
+                for line in self.memory_monitor.snapshot_diff():
+                    logger.info(line, extra={'fields': {'event': 'tracemalloc'}})
+            if self.reload_requested.is_set():
+                self.reload_requested.clear()
+                self.processor.stop()
+                try:
+                    self.load()
+                    self.reloaded_at = time.time()
+                except Exception as e:
+                    logger.error(f"重新加载配置失败: {e}", extra={'fields': {'event': 'reload'}})
+                self.processor.start()
+                stopped_at = None
+                continue
+            # 识别出错时监听会停止，等待一段时间后自动重启
+            if not self.processor.running:
+                if stopped_at is None:
+                    stopped_at = time.monotonic()
+                elif time.monotonic() - stopped_at >= self.restart_delay:
+                    logger.info("重新启动剪贴板监听", extra={'fields': {'event': 'restart'}})
+                    self.processor.start()
+                    stopped_at = None
+        self.shutdown()
+
+    def shutdown(self):
+        self.processor.stop()
+        if self.processor.encode_pool:
+            self.processor.encode_pool.shutdown()
+        self.memory_monitor.stop()
+        if self.api_server:
+            self.api_server.stop()
+        if self.folder_watcher:
+            self.folder_watcher.stop()
+        if self.capture_spool:
+            self.capture_spool.stop()
+        if self.shadow_evaluator:
+            self.shadow_evaluator.stop()
+        self.processor.set_result_cache(None)
+        if self.status_server:
+            self.status_server.shutdown()
+            self.status_server.server_close()
+            if self.status_socket and os.path.exists(self.status_socket):
+                os.remove(self.status_socket)
+        if self.history_store:
+            self.history_store.close()
+        if self.trace_recorder:
+            self.trace_recorder.close()
+        logger.info("守护进程已退出", extra={'fields': {'event': 'stop'}})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pillocr-daemon', description='PillOCR 无界面守护进程')
+    parser.add_argument('--config', help='配置文件路径，默认与设置窗口共用')
+    parser.add_argument('--status-socket', default=None,
+                        help='状态查询 Unix socket 路径，默认为应用数据目录下的 pillocr.sock')
+    parser.add_argument('--status-port', type=int, default=0,
+                        help='不支持 Unix socket 时用于状态查询的本机端口')
+    parser.add_argument('--restart-delay', type=float, default=30,
+                        help='识别出错后重新启动监听前等待的秒数')
+    parser.add_argument('--record-trace', default='',
+                        help='将每次识别录制到该目录，供 pillocr_replay.py 重放')
+    parser.add_argument('--log-format', choices=['json', 'text'], default='json')
+    args = parser.parse_args(argv)
+
+    handler = logging.StreamHandler(sys.stderr)
+    if args.log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    config_manager = ConfigManager()
+    if args.config:
+        config_manager.config_file = os.path.abspath(args.config)
+
+    status_socket = args.status_socket
+    if status_socket is None and hasattr(socket, 'AF_UNIX'):
+        status_socket = os.path.join(get_app_data_dir(), 'pillocr.sock')
+
+    PillOCRDaemon(
+        config_manager,
+        status_socket=status_socket,
+        status_port=args.status_port,
+        restart_delay=args.restart_delay,
+        record_trace=args.record_trace
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
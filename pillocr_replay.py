@@ -0,0 +1,293 @@
+"""PillOCR 识别录制重放
+
+把 TraceRecorder 录制的识别事件按原始到达间隔（或加速）重新提交给识别引擎，
+服务商由本地模拟服务器代替：按图片的感知哈希找到录制时的返回内容，并按录制的耗时延迟返回。
+用于在可重复的真实负载下测试排队、缓存和限流相关的改动：
+
+    python pillocr_replay.py TRACE_DIR [--speed 10] [--config PATH] [--json]
+
+来源为 clipboard 的事件由单个线程依次识别（与剪贴板监听相同），其他来源的事件并发提交
+（与本地识别接口相同，启用合并请求时会被合并）。
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from processors.image_encoder import ImageEncoder
+from processors.image_to_markdown import ImageToMarkdown, CONTINUE_PROMPT
+from processors.shadow_eval import percentile
+from processors.request_packer import PACK_MARKER
+from utils.config_manager import ConfigManager
+from utils.trace_recorder import load_trace, trace_image_path
+
+# 感知哈希的汉明距离超过该值时视为录制中没有这张图片
+MAX_HASH_DISTANCE = 10
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self.send_json({'object': 'list', 'data': [{'id': 'replay', 'object': 'model'}]})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json({'error': 'not found'}, 404)
+            return
+        content, usage, delay = self.server.replay.respond(body.get('messages', []))
+        time.sleep(delay)
+        if body.get('stream'):
+            self.send_stream(body.get('model', ''), content, usage)
+        else:
+            self.send_json({
+                'id': 'replay',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', ''),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+    def send_json(self, payload, code=200):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, model, content, usage):
+        chunks = [
+            {'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': content}, 'finish_reason': None}]},
+            {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]},
+            {'choices': [], 'usage': usage},
+        ]
+        data = b''
+        for chunk in chunks:
+            chunk.update({'id': 'replay', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model})
+            data += b'data: ' + json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b'\n\n'
+        data += b'data: [DONE]\n\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockProvider:
+    """按录制内容应答 chat.completions 请求的本地模拟服务商"""
+
+    def __init__(self, events, speed=1.0):
+        self.events = [e for e in events if e.get('ahash')]
+        self.hashes = [int(e['ahash'], 16) for e in self.events]
+        self.speed = speed
+        self.image_encoder = ImageEncoder()
+        self.stats = {'requests': 0, 'misses': 0}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def lookup(self, image_url):
+        """按感知哈希找到最接近的录制事件"""
+        data = base64.b64decode(image_url.split(',', 1)[1])
+        with Image.open(io.BytesIO(data)) as image:
+            target = int(self.image_encoder.average_hash(image), 16)
+        best, distance = None, MAX_HASH_DISTANCE + 1
+        for event, value in zip(self.events, self.hashes):
+            d = bin(value ^ target).count('1')
+            if d < distance:
+                best, distance = event, d
+        return best
+
+    def respond(self, messages):
+        """返回 (内容, token 用量, 延迟秒数)"""
+        with self.lock:
+            self.stats['requests'] += 1
+        user = messages[-1] if messages else {}
+        content = user.get('content', '')
+        if isinstance(content, str):
+            # 截断续写请求返回空内容，纯文本请求（如翻译）原样返回
+            text = '' if content == CONTINUE_PROMPT else content
+            return text, self.usage(len(content) // 4, len(text) // 4), 0
+        urls = [part['image_url']['url'] for part in content if part.get('type') == 'image_url']
+        events = [self.lookup(url) for url in urls]
+        misses = sum(1 for e in events if e is None)
+        if misses:
+            with self.lock:
+                self.stats['misses'] += misses
+        outputs = [(e or {}).get('raw') or '' for e in events]
+        if len(outputs) == 1:
+            text = outputs[0]
+        else:
+            text = '\n'.join(f"{PACK_MARKER.format(index=i)}\n{output}" for i, output in enumerate(outputs, 1))
+        found = [e for e in events if e]
+        delay = max([(e.get('request_ms') or 0) / 1000 for e in found] or [0]) / self.speed
+        prompt_tokens = sum(e.get('prompt_tokens') or 0 for e in found)
+        completion_tokens = sum(e.get('completion_tokens') or 0 for e in found)
+        return text, self.usage(prompt_tokens, completion_tokens), delay
+
+    @staticmethod
+    def usage(prompt_tokens, completion_tokens):
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': 0},
+        }
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockProviderHandler)
+        self.server.daemon_threads = True
+        self.server.replay = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def replay(trace_dir, speed=1.0, config=None, log_callback=None):
+    """重放录制目录中的事件，返回统计结果"""
+    events = load_trace(trace_dir)
+    if not events:
+        raise ValueError("录制文件中没有事件")
+    provider = MockProvider(events, speed)
+    base_url = provider.start()
+
+    processor = ImageToMarkdown(log_callback=log_callback)
+    processor.apply_config(config or {})
+    processor.set_provider('自定义')
+    processor.set_base_url(base_url)
+    processor.set_api_key('replay')
+    processor.set_proxy('')
+    processor.set_gpt_model(events[0].get('model') or 'replay')
+    config = config or {}
+    processor.set_pack_images(config.get('pack_images', (config.get('api_server') or {}).get('pack_images', 1)))
+
+    latencies = []
+    waits = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(event, image, enqueued):
+        started = time.monotonic()
+        try:
+            if event.get('source') == 'clipboard':
+                processor.recognize(image, source='replay')
+            else:
+                processor.submit(image, source='replay')
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        finally:
+            image.close()
+        with lock:
+            waits.append(started - enqueued)
+            latencies.append(time.monotonic() - enqueued)
+
+    # 剪贴板事件由单个线程依次处理
+    serial = queue.Queue()
+
+    def serial_worker():
+        while True:
+            item = serial.get()
+            if item is None:
+                break
+            run(*item)
+
+    serial_thread = threading.Thread(target=serial_worker, daemon=True)
+    serial_thread.start()
+    threads = []
+    first_ts = events[0]['ts']
+    start = time.monotonic()
+    for event in events:
+        delay = start + (event['ts'] - first_ts) / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        image = Image.open(trace_image_path(trace_dir, event))
+        image.load()
+        item = (event, image, time.monotonic())
+        if event.get('source') == 'clipboard':
+            serial.put(item)
+        else:
+            thread = threading.Thread(target=run, args=item, daemon=True)
+            thread.start()
+            threads.append(thread)
+    serial.put(None)
+    serial_thread.join()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - start
+    processor.set_pack_images(1)
+    processor.set_translator(None)
+    provider.stop()
+
+    return {
+        'events': len(events),
+        'errors': len(errors),
+        'duration_s': round(duration, 3),
+        'throughput_per_s': round(len(events) / duration, 2) if duration else None,
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': to_ms(percentile(latencies, 0.5)),
+            'p95': to_ms(percentile(latencies, 0.95)),
+            'max': to_ms(max(latencies, default=None)),
+        },
+        'queue_wait_ms': {
+            'mean': to_ms(sum(waits) / len(waits)) if waits else None,
+            'p95': to_ms(percentile(waits, 0.95)),
+        },
+        'provider_requests': provider.stats['requests'],
+        'provider_misses': provider.stats['misses'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pillocr-replay', description='重放 PillOCR 识别录制')
+    parser.add_argument('trace_dir', help='录制目录（包含 trace.jsonl 和 images/）')
+    parser.add_argument('--speed', type=float, default=1.0, help='重放速度倍数，如 10 表示加速 10 倍')
+    parser.add_argument('--config', help='使用该配置文件中的 Prompt、路由、合并请求等设置（服务商由模拟服务器代替）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出统计结果')
+    parser.add_argument('--verbose', action='store_true', help='输出识别引擎日志')
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        config_manager = ConfigManager()
+        config_manager.config_file = os.path.abspath(args.config)
+        config = config_manager.load() or {}
+    log_callback = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+    result = replay(args.trace_dir, speed=max(args.speed, 0.01), config=config, log_callback=log_callback)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    print(f"事件: {result['events']}，出错: {result['errors']}，用时 {result['duration_s']} 秒，"
+          f"吞吐 {result['throughput_per_s']}/秒")
+    latency = result['latency_ms']
+    print(f"延迟(ms): 平均 {latency['mean']}，p50 {latency['p50']}，p95 {latency['p95']}，最大 {latency['max']}")
+    print(f"排队(ms): 平均 {result['queue_wait_ms']['mean']}，p95 {result['queue_wait_ms']['p95']}")
+    print(f"模拟服务商请求: {result['provider_requests']}，未匹配图片: {result['provider_misses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""PillOCR 影子评估报告
+
+汇总影子评估（配置文件中的 shadow 设置）记录的结果，比较当前模型与候选模型：
+
+    python pillocr_shadow.py [--db PATH] [--config PATH] [--days N] [--json]
+
+每个模型输出参与评估的图片数、与另一方结果一致（LaTeX 规范化后相同）的比例、平均编辑相似度、
+p95 耗时，以及每千张图片的 token 数和费用（价格取自配置中的 shadow.prices，单位为每百万 token）。
+"""
+import argparse
+import json
+import os
+import time
+from processors.shadow_eval import load_report, format_report
+from utils.config_manager import ConfigManager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pillocr-shadow', description='PillOCR 影子评估报告')
+    parser.add_argument('--db', help='评估数据库路径，默认为应用数据目录下的 shadow.db')
+    parser.add_argument('--config', help='读取 shadow.prices 的配置文件，默认与设置窗口共用')
+    parser.add_argument('--days', type=float, default=0, help='只统计最近 N 天的结果')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager()
+    if args.config:
+        config_manager.config_file = os.path.abspath(args.config)
+    prices = (config_manager.load() or {}).get('shadow', {}).get('prices', {})
+    since = time.time() - args.days * 86400 if args.days else None
+    report = load_report(args.db, prices, since)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    for line in format_report(report):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import threading
+import time
+from processors.request_packer import split_packed_output
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+try:
+    from pix2tex.cli import LatexOCR
+    PIX2TEX_AVAILABLE = True
+except ImportError:
+    PIX2TEX_AVAILABLE = False
+
+
+class RecognitionBackend:
+    """识别后端接口：输入图片，返回模型的原始输出（Markdown）
+
+    ImageToMarkdown 只通过该接口请求识别，后处理（公式包装符替换、历史记录等）仍由处理器完成。
+    """
+
+    name = ''
+    supports_streaming = False  # stream 是否真正逐段返回
+    supports_batching = False   # recognize_batch 是否在一次请求中识别多张图片
+    local = False               # 是否在本机运行（无网络请求、无 token 费用）
+
+    def available(self):
+        """返回 (是否可用, 不可用的原因)"""
+        return True, ''
+
+    def recognize(self, image, model, max_tokens, usage):
+        """识别一张图片
+
+        Args:
+            image: 待识别图片（已完成缩放等处理）
+            model: 模型名称，本地后端忽略
+            max_tokens: 输出 token 上限，本地后端忽略
+            usage: dict，累加 token 用量和 encode_ms（编码图片耗时）
+
+        Returns:
+            原始输出文本
+        """
+        raise NotImplementedError
+
+    def stream(self, image, model, max_tokens, usage):
+        """流式识别，逐段返回原始输出；不支持流式的后端一次性返回全部结果"""
+        yield self.recognize(image, model, max_tokens, usage)
+
+    def recognize_batch(self, images, model, max_tokens, usage):
+        """识别多张图片
+
+        Returns:
+            与 images 顺序一致的结果列表；合并请求的输出无法拆分时返回 None，由调用方逐张识别
+        """
+        return [self.recognize(image, model, max_tokens, usage) for image in images]
+
+    def warm_up(self):
+        """预先建立连接或加载模型"""
+
+    def close(self):
+        """释放连接或模型"""
+
+
+class ChatCompletionsBackend(RecognitionBackend):
+    """OpenAI 兼容的 chat.completions 接口（OPENAI、火山引擎、自定义服务商）
+
+    客户端、Prompt 和续写逻辑都由所属的 ImageToMarkdown 提供，服务商设置变化时无需重建后端。
+    """
+
+    name = 'api'
+    supports_streaming = True
+    supports_batching = True
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def available(self):
+        if not self.processor.client:
+            return False, "请先设置 API Key 或推理接入点"
+        return True, ''
+
+    def recognize(self, image, model, max_tokens, usage):
+        processor = self.processor
+        start = time.perf_counter()
+        messages = processor.build_messages(image)
+        usage['encode_ms'] = usage.get('encode_ms', 0) + (time.perf_counter() - start) * 1000
+        response = processor.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **processor.request_options()
+        )
+        #debug用
+        #print(response)
+        raw_output = response.choices[0].message.content or ''
+        processor.add_usage(usage, response)
+        return processor.continue_output(messages, raw_output, response.choices[0].finish_reason, usage, model)
+
+    def stream(self, image, model, max_tokens, usage):
+        processor = self.processor
+        start = time.perf_counter()
+        messages = processor.build_messages(image)
+        usage['encode_ms'] = usage.get('encode_ms', 0) + (time.perf_counter() - start) * 1000
+        stream = processor.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            **processor.request_options(stream=True)
+        )
+        raw_output = ''
+        finish_reason = None
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                # include_usage 时最后一个数据块只包含 token 用量
+                processor.add_usage(usage, chunk)
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ''
+            raw_output += delta
+            if delta:
+                yield delta
+        if finish_reason == 'length':
+            # 截断后的续写不再流式返回，拼接后作为最后一段输出
+            full_output = processor.continue_output(messages, raw_output, finish_reason, usage, model)
+            if full_output[len(raw_output):]:
+                yield full_output[len(raw_output):]
+
+    def recognize_batch(self, images, model, max_tokens, usage):
+        processor = self.processor
+        start = time.perf_counter()
+        messages = processor.build_packed_messages(images)
+        usage['encode_ms'] = usage.get('encode_ms', 0) + (time.perf_counter() - start) * 1000
+        response = processor.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **processor.request_options()
+        )
+        raw_output = response.choices[0].message.content or ''
+        processor.add_usage(usage, response)
+        raw_output = processor.continue_output(messages, raw_output, response.choices[0].finish_reason, usage, model)
+        return split_packed_output(raw_output, len(images))
+
+    def warm_up(self):
+        return self.processor.warm_up()
+
+
+class TesseractBackend(RecognitionBackend):
+    """本地 Tesseract 识别纯文本，需要安装 tesseract 程序和 pytesseract"""
+
+    name = 'tesseract'
+    local = True
+
+    def __init__(self, lang='eng', config=''):
+        """
+        Args:
+            lang: Tesseract 语言包，如 'eng'、'chi_sim+eng'
+            config: 传给 tesseract 的额外参数，如 '--psm 6'
+        """
+        self.lang = lang
+        self.config = config
+
+    def available(self):
+        if not TESSERACT_AVAILABLE:
+            return False, "未安装 pytesseract"
+        try:
+            pytesseract.get_tesseract_version()
+        except Exception as e:
+            return False, f"未找到 tesseract 程序: {e}"
+        return True, ''
+
+    def recognize(self, image, model, max_tokens, usage):
+        text = pytesseract.image_to_string(image, lang=self.lang, config=self.config)
+        # Tesseract 以单个换行分隔行、以空行分隔段落，与 Markdown 一致
+        return text.strip()
+
+
+class Pix2TexBackend(RecognitionBackend):
+    """本地 pix2tex（LaTeX-OCR）识别单个公式，需要安装 pix2tex
+
+    模型在首次使用时加载并常驻，识别结果作为行间公式返回。
+    """
+
+    name = 'pix2tex'
+    local = True
+
+    def __init__(self):
+        self.model = None
+        self.lock = threading.Lock()
+
+    def available(self):
+        if not PIX2TEX_AVAILABLE:
+            return False, "未安装 pix2tex"
+        return True, ''
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                self.model = LatexOCR()
+            return self.model
+
+    def recognize(self, image, model, max_tokens, usage):
+        latex_model = self.load()
+        with self.lock:
+            latex = latex_model(image.convert('RGB'))
+        return f"$$\n{latex.strip()}\n$$"
+
+    def warm_up(self):
+        self.load()
+
+    def close(self):
+        self.model = None
+
+
+# 可在配置中选择的本地后端
+LOCAL_BACKENDS = {
+    'tesseract': TesseractBackend,
+    'pix2tex': Pix2TexBackend,
+}
+
+
+def create_local_backend(name, options=None):
+    """根据名称和选项创建本地后端，名称未知时抛出 ValueError"""
+    if name not in LOCAL_BACKENDS:
+        raise ValueError(f"未知的识别后端: {name}")
+    return LOCAL_BACKENDS[name](**(options or {}))
@@ -0,0 +1,273 @@
+import json
+import os
+import time
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+STATE_FILE = 'batch_state.json'
+BATCH_ENDPOINT = '/v1/chat/completions'
+# 单个批量任务的上限（OpenAI 为 50,000 个请求、200 MB），留出余量
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+# 批量任务的最终状态，之后不再轮询
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def collect_images(inputs):
+    """展开输入的文件和目录（递归），返回图片路径列表"""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        paths.append(os.path.join(root, name))
+        elif os.path.isfile(path):
+            paths.append(path)
+    return [os.path.abspath(p) for p in paths]
+
+
+class BatchJob:
+    """使用服务商的 Batch API 批量识别图片，适合不需要立即得到结果的大量转换
+
+    请求写入批量 JSONL 文件，通过 Files 和 Batches 接口提交，价格通常是同步请求的一半，
+    也不占用每分钟请求数限额。任务状态保存在输出目录的 batch_state.json 中，
+    程序重启后重新运行即可继续：已提交的任务继续轮询，已完成的图片不再提交。
+    """
+
+    def __init__(self, processor, output_dir, log_callback=None):
+        """
+        Args:
+            processor: 已配置好服务商、Prompt 和公式包装符的 ImageToMarkdown 实例
+            output_dir: 输出目录，每张图片输出一个同名 .md 文件
+            log_callback: 日志回调
+        """
+        self.processor = processor
+        self.output_dir = os.path.abspath(output_dir)
+        self.work_dir = os.path.join(self.output_dir, '.batch')
+        self.state_path = os.path.join(self.output_dir, STATE_FILE)
+        self.log_callback = log_callback
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.state = self.load_state()
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'items': {}, 'batches': {}}
+
+    def save_state(self):
+        """先写临时文件再替换，程序在写入途中退出时不会损坏状态文件"""
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def add_images(self, paths):
+        """登记图片，已登记的图片保持原状态；返回新增的数量"""
+        items = self.state['items']
+        known = {item['path'] for item in items.values()}
+        outputs = {item['output'] for item in items.values()}
+        added = 0
+        for path in paths:
+            if path in known:
+                continue
+            custom_id = f"img-{len(items):06d}"
+            stem = os.path.splitext(os.path.basename(path))[0]
+            output = f"{stem}.md"
+            if output in outputs:
+                output = f"{stem}-{custom_id}.md"
+            outputs.add(output)
+            items[custom_id] = {'path': path, 'output': output, 'status': 'pending', 'batch': None}
+            added += 1
+        if added:
+            self.save_state()
+        return added
+
+    def build_request(self, custom_id, image):
+        """构造批量文件中的一行请求，模型和 max_tokens 与同步识别的规划相同"""
+        processor = self.processor
+        model, max_tokens, features = processor.plan_request(image)
+        sent = image
+        if processor.cost_aware_resize:
+            sent, _ = processor.fit_image_cost(image, model, features)
+        body = {
+            'model': model,
+            'messages': processor.build_messages(sent),
+            'max_tokens': max_tokens,
+        }
+        if sent is not image:
+            sent.close()
+        # 批量请求的请求体直接包含 prompt_cache_key 等附加参数
+        body.update(processor.request_options().get('extra_body', {}))
+        return {'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': body}
+
+    def submit_pending(self):
+        """把未提交和之前失败的图片写入批量文件并提交，超过单个任务上限时拆分为多个任务"""
+        pending = [cid for cid, item in self.state['items'].items() if item['status'] in ('pending', 'failed')]
+        if not pending:
+            return []
+        if not self.processor.client:
+            raise Exception("请先设置 API Key 或推理接入点")
+        submitted = []
+        chunk, size, file = [], 0, None
+        for custom_id in pending:
+            item = self.state['items'][custom_id]
+            try:
+                with Image.open(item['path']) as image:
+                    image.load()
+                    request = self.build_request(custom_id, image)
+                    line = json.dumps(request, ensure_ascii=False) + '\n'
+            except Exception as e:
+                self.log(f"读取图片失败，已跳过: {item['path']}: {e}")
+                item['status'], item['error'] = 'skipped', str(e)
+                continue
+            # 模型路由可能为每张图片选择不同的模型
+            item['model'] = request['body']['model']
+            data = line.encode('utf-8')
+            if chunk and (len(chunk) >= MAX_BATCH_REQUESTS or size + len(data) > MAX_BATCH_BYTES):
+                file.close()
+                submitted.append(self.create_batch(file.name, chunk))
+                chunk, size, file = [], 0, None
+            if file is None:
+                file = open(os.path.join(self.work_dir, f"input-{int(time.time() * 1000)}.jsonl"), 'wb')
+            file.write(data)
+            chunk.append(custom_id)
+            size += len(data)
+        if file is not None:
+            file.close()
+            submitted.append(self.create_batch(file.name, chunk))
+        self.save_state()
+        return submitted
+
+    def create_batch(self, input_path, custom_ids):
+        """上传批量文件并创建任务，任务 ID 立即写入状态文件"""
+        client = self.processor.client
+        with open(input_path, 'rb') as f:
+            uploaded = client.files.create(file=(os.path.basename(input_path), f), purpose='batch')
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window='24h'
+        )
+        self.state['batches'][batch.id] = {
+            'status': batch.status,
+            'input_file_id': uploaded.id,
+            'input_path': input_path,
+            'models': sorted({self.state['items'][cid]['model'] for cid in custom_ids}),
+            'created': time.time(),
+        }
+        for custom_id in custom_ids:
+            item = self.state['items'][custom_id]
+            item['status'], item['batch'] = 'submitted', batch.id
+            item.pop('error', None)
+        self.save_state()
+        self.log(f"已提交批量任务 {batch.id}，共 {len(custom_ids)} 张图片")
+        return batch.id
+
+    def open_batches(self):
+        return [bid for bid, info in self.state['batches'].items() if not info.get('collected')]
+
+    def poll(self):
+        """查询所有未收取结果的任务，已结束的任务立即收取结果；返回仍在进行的任务数"""
+        running = 0
+        for batch_id in self.open_batches():
+            batch = self.processor.client.batches.retrieve(batch_id)
+            info = self.state['batches'][batch_id]
+            counts = getattr(batch, 'request_counts', None)
+            if batch.status != info.get('status'):
+                progress = f"（{counts.completed + counts.failed}/{counts.total}）" if counts else ''
+                self.log(f"批量任务 {batch_id} 状态: {batch.status}{progress}")
+                info['status'] = batch.status
+                self.save_state()
+            if batch.status in FINAL_STATUSES:
+                self.collect(batch)
+            else:
+                running += 1
+        return running
+
+    def collect(self, batch):
+        """下载任务的输出和错误文件，写出 Markdown；没有结果的图片标记为失败，下次运行时重新提交"""
+        info = self.state['batches'][batch.id]
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(self.processor.client.files.content(file_id).text.splitlines())
+        done = failed = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            item = self.state['items'].get(entry.get('custom_id'))
+            if item is None or item['batch'] != batch.id:
+                continue
+            if self.write_result(item, entry):
+                done += 1
+            else:
+                failed += 1
+        for item in self.state['items'].values():
+            if item['batch'] == batch.id and item['status'] == 'submitted':
+                item['status'], item['error'] = 'failed', f"批量任务 {batch.status}，没有返回结果"
+                failed += 1
+        info['collected'] = True
+        self.save_state()
+        self.log(f"批量任务 {batch.id} 已收取结果: 成功 {done}，失败 {failed}")
+
+    def write_result(self, item, entry):
+        """把一条批量结果经 MarkdownProcessor 处理后写入输出文件"""
+        response = entry.get('response') or {}
+        body = response.get('body') or {}
+        if entry.get('error') or response.get('status_code') != 200 or not body.get('choices'):
+            error = entry.get('error') or body.get('error') or f"HTTP {response.get('status_code')}"
+            item['status'], item['error'] = 'failed', json.dumps(error, ensure_ascii=False)
+            return False
+        choice = body['choices'][0]
+        raw_output = choice.get('message', {}).get('content') or ''
+        if choice.get('finish_reason') == 'length':
+            # 批量模式无法自动续写，保留截断的结果并提示
+            self.log(f"输出被截断，结果可能不完整: {item['output']}")
+        output_path = os.path.join(self.output_dir, item['output'])
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(self.processor.postprocess(raw_output))
+        usage = body.get('usage') or {}
+        item['status'] = 'done'
+        item['prompt_tokens'] = usage.get('prompt_tokens')
+        item['completion_tokens'] = usage.get('completion_tokens')
+        item.pop('error', None)
+        return True
+
+    def summary(self):
+        counts = {}
+        for item in self.state['items'].values():
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return counts
+
+    def run(self, poll_interval=30, wait=True, retry_failed=True):
+        """提交未完成的图片并轮询到所有任务结束，返回各状态的图片数
+
+        Args:
+            poll_interval: 轮询间隔（秒）
+            wait: 为 False 时只提交和查询一次，不等待任务结束
+            retry_failed: 任务结束后是否把失败的图片重新提交一次
+        """
+        self.submit_pending()
+        retried = False
+        while True:
+            running = self.poll()
+            if running == 0:
+                failed = self.summary().get('failed', 0)
+                if failed and retry_failed and not retried:
+                    retried = True
+                    self.log(f"{failed} 张图片识别失败，重新提交")
+                    self.submit_pending()
+                    continue
+                break
+            if not wait:
+                break
+            time.sleep(poll_interval)
+        return self.summary()
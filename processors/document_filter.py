@@ -0,0 +1,108 @@
+from PIL import Image, ImageFilter
+from processors.image_features import cached_features, gray_thumbnail
+
+# 计算颜色和边缘特征时图片的最长边
+FILTER_MAX_SIDE = 256
+# 饱和度超过该值的像素视为彩色
+SATURATION_THRESHOLD = 80
+# 边缘强度超过 WEAK 视为边缘，超过 STRONG 视为清晰的笔画边缘
+EDGE_WEAK = 24
+EDGE_STRONG = 96
+# 最短边小于该值的图片（图标、分隔线等）直接视为非文档
+MIN_SIDE = 12
+DEFAULT_THRESHOLD = 0.45
+
+
+def color_ratio(image: Image.Image):
+    """彩色像素占比：文档截图以灰度为主，照片、表情包色彩丰富"""
+    thumbnail = image.convert('RGB')
+    if max(thumbnail.size) > FILTER_MAX_SIDE:
+        thumbnail.thumbnail((FILTER_MAX_SIDE, FILTER_MAX_SIDE), Image.Resampling.BOX)
+    saturation = thumbnail.convert('HSV').getchannel('S').histogram()
+    return sum(saturation[SATURATION_THRESHOLD:]) / max(1, thumbnail.width * thumbnail.height)
+
+
+def edge_sharpness(image: Image.Image):
+    """清晰边缘在所有边缘中的占比：文字笔画边缘锐利，照片中多为渐变的弱边缘"""
+    gray = gray_thumbnail(image, FILTER_MAX_SIDE * 2)
+    hist = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    edges = sum(hist[EDGE_WEAK:])
+    if not edges:
+        return 0.0
+    return sum(hist[EDGE_STRONG:]) / edges
+
+
+class DocumentFilter:
+    """识别前的本地过滤：判断剪贴板图片是否可能包含文字或公式
+
+    综合干净背景占比、彩色像素占比、文本行结构（水平投影）和边缘清晰度打分（0-1），
+    低于阈值的图片（照片、图标、表情包等）不发送给服务商，或先询问用户。
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, action='skip', log_callback=None):
+        """
+        Args:
+            threshold: 得分低于该值的图片视为非文档
+            action: 'skip' 直接跳过，'ask' 询问是否仍要识别（没有界面时按跳过处理）
+            log_callback: 过滤决策日志回调
+        """
+        self.threshold = threshold
+        self.action = action
+        self.log_callback = log_callback
+        self.decisions = {'passed': 0, 'skipped': 0, 'confirmed': 0}
+
+    @classmethod
+    def from_config(cls, prefilter, log_callback=None):
+        """根据配置中的 prefilter 设置创建过滤器，未启用时返回 None"""
+        if not prefilter or not prefilter.get('enabled'):
+            return None
+        return cls(
+            threshold=float(prefilter.get('threshold', DEFAULT_THRESHOLD)),
+            action=prefilter.get('action', 'skip'),
+            log_callback=log_callback
+        )
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def score(self, image, features=None):
+        """返回 (得分, 说明)"""
+        if min(image.size) < MIN_SIDE:
+            return 0.0, f"尺寸过小 {image.width}x{image.height}"
+        if features is None:
+            features = cached_features(image)
+        colors = color_ratio(image)
+        sharpness = edge_sharpness(image)
+        background = min(1.0, features['background_ratio'] / 0.7)
+        colorless = 1 - min(1.0, colors / 0.3)
+        # 有文本行且笔迹稀疏：图标、照片的笔迹掩码会连成覆盖大半张图的一整块
+        structured = 1.0 if features['line_count'] and 0.002 <= features['ink_density'] <= 0.4 else 0.0
+        # 干净的背景是文档截图最可靠的特征，照片（包括黑白照片）的得分不会超过其背景占比
+        score = background * (0.4 + 0.6 * (0.4 * colorless + 0.3 * structured + 0.3 * sharpness))
+        reason = (f"背景 {features['background_ratio']:.2f}，彩色 {colors:.2f}，"
+                  f"{features['line_count']} 行，笔迹密度 {features['ink_density']:.2f}，边缘清晰度 {sharpness:.2f}")
+        return score, reason
+
+    def check(self, image, confirm=None):
+        """判断是否发送图片，记录并返回决策
+
+        Args:
+            image: 剪贴板图片
+            confirm: action 为 'ask' 时调用的确认函数，以 (score, reason) 调用，返回是否仍要识别
+
+        Returns:
+            bool: 是否发送给服务商
+        """
+        score, reason = self.score(image)
+        if score >= self.threshold:
+            self.decisions['passed'] += 1
+            self.log(f"图片像文档，继续识别（得分 {score:.2f}：{reason}）")
+            return True
+        if self.action == 'ask' and confirm is not None and confirm(score, reason):
+            self.decisions['confirmed'] += 1
+            self.log(f"图片不像文档（得分 {score:.2f}），已按确认继续识别")
+            return True
+        self.decisions['skipped'] += 1
+        self.log(f"图片不像文档，已跳过（得分 {score:.2f}：{reason}）")
+        return False
@@ -0,0 +1,75 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from PIL import Image
+from processors.image_encoder import ImageEncoder, apply_preprocess
+
+# 像素数达到该值的图片才交给进程池编码，小图片在本进程编码比跨进程传递更快
+POOL_MIN_PIXELS = 1_000_000
+# 可以直接按原始字节在进程间传递的图片模式
+SHARED_MODES = ('RGB', 'RGBA', 'L')
+
+
+def _encode_shared(name, mode, size, preprocess):
+    """在子进程中从共享内存读取像素，预处理后编码为 base64 PNG"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        image = Image.frombytes(mode, size, shm.buf)
+    finally:
+        shm.close()
+    return ImageEncoder().encode_image(apply_preprocess(image, preprocess))
+
+
+class EncodePool:
+    """在独立进程中完成大图片的预处理和 PNG 编码，避免阻塞界面线程
+
+    像素通过共享内存交给子进程（只复制一次，不经过 pickle），子进程只返回编码后的字符串。
+    进程在第一次提交大图片时才启动。
+    """
+
+    def __init__(self, max_workers=2, min_pixels=POOL_MIN_PIXELS):
+        """
+        Args:
+            max_workers: 子进程数
+            min_pixels: 交给进程池的最小像素数
+        """
+        self.max_workers = max_workers
+        self.min_pixels = min_pixels
+        self.executor = None
+
+    def should_offload(self, image):
+        return image.mode in SHARED_MODES and image.width * image.height >= self.min_pixels
+
+    def submit(self, image, preprocess):
+        """提交一张图片，返回结果为 base64 字符串的 Future"""
+        if self.executor is None:
+            # 使用 spawn，避免在有多个线程的进程中 fork
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        data = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            shm.buf[:len(data)] = data
+            del data
+            future = self.executor.submit(_encode_shared, shm.name, image.mode, image.size, dict(preprocess))
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+
+        future.add_done_callback(release)
+        return future
+
+    def encode(self, image, preprocess):
+        return self.submit(image, preprocess).result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
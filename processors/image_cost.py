@@ -0,0 +1,160 @@
+import math
+from processors.image_features import FEATURE_MAX_SIDE
+
+# 识别所需的最小文本行高（像素），缩小图片时保证最矮的文本行不低于该值
+MIN_TEXT_LINE_HEIGHT = 14
+
+
+class TileCostModel:
+    """按 512px 分块计费（OpenAI gpt-4o 等）
+
+    detail 为 high 时服务商先把图片缩放到 2048x2048 以内，再把短边缩放到 768 以内，
+    费用为 base + per_tile × 分块数；detail 为 low 时缩放到 512x512 以内，固定为 base。
+    """
+
+    supports_detail = True
+
+    def __init__(self, base, per_tile, tile=512, max_side=2048, short_side=768, low_side=512):
+        self.base = base
+        self.per_tile = per_tile
+        self.tile = tile
+        self.max_side = max_side
+        self.short_side = short_side
+        self.low_side = low_side
+
+    def billed_size(self, width, height, detail='high'):
+        """服务商实际处理的尺寸"""
+        if detail == 'low':
+            scale = min(1.0, self.low_side / max(width, height))
+        else:
+            scale = min(1.0, self.max_side / max(width, height))
+            scale = min(scale, self.short_side / max(1, min(width, height) * scale) * scale)
+        return max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+
+    def tokens(self, width, height, detail='high'):
+        if detail == 'low':
+            return self.base
+        width, height = self.billed_size(width, height)
+        return self.base + self.per_tile * math.ceil(width / self.tile) * math.ceil(height / self.tile)
+
+    def boundaries(self, width, height):
+        """缩放后分块数可能变化的缩放比例"""
+        scales = []
+        for side in (width, height):
+            scales += [k * self.tile / side for k in range(1, math.ceil(side / self.tile) + 1)]
+        return scales
+
+
+class PatchCostModel:
+    """按小块（patch）计费，每个 patch 计 multiplier 个 token（OpenAI gpt-4.1-mini 等、火山引擎豆包）
+
+    像素数超出 [min_pixels, max_pixels] 时服务商会等比缩放到范围内；max_patches 为 patch 数上限。
+    low_max_pixels 不为 0 时支持 detail，low 使用较小的像素上限。
+    """
+
+    def __init__(self, patch, multiplier=1.0, max_patches=0, min_pixels=0, max_pixels=0, low_max_pixels=0):
+        self.patch = patch
+        self.multiplier = multiplier
+        self.max_patches = max_patches
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+        self.low_max_pixels = low_max_pixels
+        self.supports_detail = bool(low_max_pixels)
+
+    def billed_size(self, width, height, detail='high'):
+        max_pixels = self.low_max_pixels if detail == 'low' and self.low_max_pixels else self.max_pixels
+        pixels = width * height
+        scale = 1.0
+        if max_pixels and pixels > max_pixels:
+            scale = math.sqrt(max_pixels / pixels)
+        elif self.min_pixels and pixels < self.min_pixels:
+            scale = math.sqrt(self.min_pixels / pixels)
+        width, height = max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+        if self.max_patches:
+            patches = math.ceil(width / self.patch) * math.ceil(height / self.patch)
+            if patches > self.max_patches:
+                scale = math.sqrt(self.max_patches * self.patch ** 2 / (width * height))
+                width, height = max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+        return width, height
+
+    def tokens(self, width, height, detail='high'):
+        width, height = self.billed_size(width, height, detail)
+        patches = math.ceil(width / self.patch) * math.ceil(height / self.patch)
+        return math.ceil(patches * self.multiplier)
+
+    def boundaries(self, width, height):
+        scales = []
+        for side in (width, height):
+            scales += [k * self.patch / side for k in range(1, math.ceil(side / self.patch) + 1)]
+        return scales
+
+
+# 按模型名前缀匹配，越具体的前缀越靠前
+OPENAI_COST_MODELS = [
+    ('gpt-4o-mini', TileCostModel(2833, 5667)),
+    ('gpt-4.1-mini', PatchCostModel(32, 1.62, max_patches=1536)),
+    ('gpt-4.1-nano', PatchCostModel(32, 2.46, max_patches=1536)),
+    ('gpt-5-mini', PatchCostModel(32, 1.62, max_patches=1536)),
+    ('gpt-5-nano', PatchCostModel(32, 2.46, max_patches=1536)),
+    ('o4-mini', PatchCostModel(32, 1.72, max_patches=1536)),
+    ('gpt-5', TileCostModel(70, 140)),
+    ('o1', TileCostModel(75, 150)),
+    ('o3', TileCostModel(75, 150)),
+    ('gpt-4o', TileCostModel(85, 170)),
+    ('gpt-4.1', TileCostModel(85, 170)),
+    ('gpt-4.5', TileCostModel(85, 170)),
+]
+# 豆包视觉模型：28px patch，每个 patch 1 个 token；detail 为 low 时像素上限约 1M，high 约 4M
+DOUBAO_COST_MODEL = PatchCostModel(28, 1.0, min_pixels=3136, max_pixels=4014080, low_max_pixels=1048576)
+
+
+def cost_model_for(provider, model):
+    """返回服务商和模型对应的计费模型，未知时返回 None"""
+    model = (model or '').lower()
+    if provider == '火山引擎' or model.startswith('doubao'):
+        return DOUBAO_COST_MODEL
+    for prefix, cost_model in OPENAI_COST_MODELS:
+        if model.startswith(prefix):
+            return cost_model
+    return None
+
+
+def text_line_height(features):
+    """返回原图中较矮文本行的高度（取 25% 分位数），没有检测到文本行时返回 None"""
+    heights = sorted(features.get('line_heights') or []) if features else []
+    if not heights:
+        return None
+    # 特征在最长边不超过 FEATURE_MAX_SIDE 的缩略图上计算
+    scale = max(1.0, max(features['width'], features['height']) / FEATURE_MAX_SIDE)
+    return heights[len(heights) // 4] * scale
+
+
+def plan_resize(cost_model, width, height, line_height=None, min_line_height=MIN_TEXT_LINE_HEIGHT):
+    """选择 token 最少、且最矮文本行经服务商缩放后仍不低于 min_line_height 的发送尺寸和 detail
+
+    只考虑缩小，候选比例为分块（patch）边界；费用相同时选择较大的尺寸。
+    没有检测到文本行时无法判断能缩小多少，保持原图。
+
+    Returns:
+        (width, height, detail, tokens)，不支持 detail 的计费模型 detail 为 None
+    """
+    detail = 'high' if cost_model.supports_detail else None
+    best = (cost_model.tokens(width, height, detail), -1.0, width, height, detail)
+    if line_height:
+        details = ('high', 'low') if cost_model.supports_detail else (None,)
+        scales = [1.0] + [s for s in cost_model.boundaries(width, height) if s < 1.0]
+        for scale in scales:
+            w, h = max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+            for option in details:
+                billed_width, _ = cost_model.billed_size(w, h, option)
+                if line_height * billed_width / width < min_line_height:
+                    continue
+                tokens = cost_model.tokens(w, h, option)
+                if (tokens, -scale) < best[:2]:
+                    best = (tokens, -scale, w, h, option)
+    tokens, _, w, h, detail = best
+    # 服务商还会再缩小的图片直接按其处理的尺寸发送，节省编码和上传
+    billed_width, billed_height = cost_model.billed_size(w, h, detail)
+    if billed_width <= w and billed_height <= h:
+        w, h = billed_width, billed_height
+    return w, h, detail, tokens
@@ -1,11 +1,48 @@
 import base64
+import hashlib
 import io
 from PIL import Image
 
+
+def apply_preprocess(image: Image.Image, settings) -> Image.Image:
+    """按预处理设置（'grayscale' 转为灰度、'max_side' 最长边上限）返回发送用的图片，未设置时返回原图"""
+    grayscale = settings.get('grayscale', False)
+    max_side = int(settings.get('max_side', 0) or 0)
+    if not grayscale and not (max_side and max(image.size) > max_side):
+        return image
+    image = image.convert('L') if grayscale else image.copy()
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return image
+
+
 class ImageEncoder:
     def encode_image(self, image: Image.Image) -> str:
         """将图片编码为base64字符串"""
         img_byte_arr = io.BytesIO()
         image.save(img_byte_arr, format='PNG')
         img_byte_arr = img_byte_arr.getvalue()
-        return base64.b64encode(img_byte_arr).decode('utf-8')
\ No newline at end of file
+        return base64.b64encode(img_byte_arr).decode('utf-8')
+
+    def fingerprint(self, image: Image.Image) -> str:
+        """计算图片像素内容的指纹，用于判重和历史记录"""
+        digest = hashlib.sha1()
+        digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode('ascii'))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def thumbnail(self, image: Image.Image, max_size=160) -> bytes:
+        """生成用于历史记录的小尺寸 JPEG 缩略图"""
+        thumb = image.convert('RGB')
+        thumb.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        img_byte_arr = io.BytesIO()
+        thumb.save(img_byte_arr, format='JPEG', quality=70)
+        return img_byte_arr.getvalue()
+
+    def average_hash(self, image: Image.Image, hash_size=8) -> str:
+        """计算感知哈希（缩放到 8x8 灰度后与均值比较），缩放或重新编码后基本不变"""
+        small = image.convert('L').resize((hash_size, hash_size), Image.Resampling.BOX)
+        pixels = list(small.getdata())
+        mean = sum(pixels) / len(pixels)
+        bits = ''.join('1' if p > mean else '0' for p in pixels)
+        return f"{int(bits, 2):0{hash_size * hash_size // 4}x}"
@@ -0,0 +1,136 @@
+from PIL import Image
+
+# 与背景灰度相差超过该值的像素视为笔迹
+INK_THRESHOLD = 64
+# 与背景灰度相差不超过该值的像素视为干净背景（截图背景几乎都等于背景色，拍照/扫描则有噪声）
+BACKGROUND_TOLERANCE = 8
+# 计算特征时图片的最长边，投影轮廓只依赖比例，缩小后结果基本不变
+FEATURE_MAX_SIDE = 1024
+# 已提取的特征保存在 image.info 中的键
+FEATURES_INFO_KEY = 'pillocr_features'
+
+
+def gray_thumbnail(image: Image.Image, max_side=FEATURE_MAX_SIDE) -> Image.Image:
+    gray = image.convert('L')
+    if max(gray.size) > max_side:
+        gray.thumbnail((max_side, max_side), Image.Resampling.BOX)
+    return gray
+
+
+def background_level(hist):
+    """直方图中出现最多的灰度即背景色"""
+    return max(range(256), key=hist.__getitem__)
+
+
+def ink_mask(image: Image.Image, max_side=FEATURE_MAX_SIDE) -> Image.Image:
+    """将图片转为笔迹掩码（笔迹为 255，背景为 0），兼容深色背景"""
+    gray = image if image.mode == 'L' and max(image.size) <= max_side else gray_thumbnail(image, max_side)
+    background = background_level(gray.histogram())
+    lut = [255 if abs(v - background) > INK_THRESHOLD else 0 for v in range(256)]
+    return gray.point(lut)
+
+
+def row_profile(mask: Image.Image):
+    """水平投影：每行笔迹像素占比（0-255）"""
+    return list(mask.resize((1, mask.height), Image.Resampling.BOX).getdata())
+
+
+def column_profile(mask: Image.Image):
+    """垂直投影：每列笔迹像素占比（0-255）"""
+    return list(mask.resize((mask.width, 1), Image.Resampling.BOX).getdata())
+
+
+def text_lines(mask: Image.Image, min_height=2):
+    """根据水平投影切分文本行，返回 [(top, bottom, left, right), ...]"""
+    lines = []
+    top = None
+    profile = row_profile(mask)
+    for y, value in enumerate(profile + [0]):
+        if value and top is None:
+            top = y
+        elif not value and top is not None:
+            if y - top >= min_height:
+                columns = column_profile(mask.crop((0, top, mask.width, y)))
+                inked = [x for x, v in enumerate(columns) if v]
+                if inked:
+                    lines.append((top, y, inked[0], inked[-1] + 1))
+            top = None
+    return lines
+
+
+def coefficient_of_variation(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    if not mean:
+        return 0.0
+    variance = sum((v - mean) ** 2 for v in values) / len(values)
+    return variance ** 0.5 / mean
+
+
+def extract_features(image: Image.Image):
+    """提取用于估算输出长度和路由判断的廉价本地特征"""
+    gray = gray_thumbnail(image)
+    gray_hist = gray.histogram()
+    background = background_level(gray_hist)
+    clean_pixels = sum(gray_hist[max(0, background - BACKGROUND_TOLERANCE):background + BACKGROUND_TOLERANCE + 1])
+    background_ratio = clean_pixels / max(1, gray.width * gray.height)
+
+    mask = ink_mask(gray)
+    hist = mask.histogram()
+    lines = text_lines(mask)
+    line_heights = [bottom - top for top, bottom, _, _ in lines]
+    line_lefts = [left for _, _, left, _ in lines]
+    line_height_cv = coefficient_of_variation(line_heights)
+    ink_density = hist[255] / max(1, mask.width * mask.height)
+    # 既不是干净背景也不是笔迹的中间灰度，截图中只有抗锯齿边缘，拍照/扫描中则大量存在
+    noise_ratio = max(0.0, 1 - background_ratio - ink_density)
+    # 手写特征：背景有噪声（拍照/扫描），或行高、行首位置参差不齐
+    handwriting_score = (
+        0.5 * min(1.0, noise_ratio / 0.3)
+        + 0.3 * min(1.0, line_height_cv / 0.6)
+        + 0.2 * min(1.0, coefficient_of_variation(line_lefts) / 0.5)
+    ) if lines else 0.0
+    # 按字符宽度约为行高 0.55 倍估算每行字符数
+    est_chars = sum(
+        (right - left) / max(1.0, (bottom - top) * 0.55)
+        for top, bottom, left, right in lines
+    )
+    return {
+        'width': image.width,
+        'height': image.height,
+        'ink_density': ink_density,
+        'line_count': len(lines),
+        'line_heights': line_heights,
+        'line_height_cv': line_height_cv,
+        'background_ratio': background_ratio,
+        'noise_ratio': noise_ratio,
+        'handwriting_score': handwriting_score,
+        'est_chars': est_chars,
+    }
+
+
+def cached_features(image: Image.Image):
+    """返回图片的特征，结果保存在 image.info 中，同一张截图的预过滤、路由和 max_tokens 估算只提取一次
+
+    裁剪、缩放得到的新图片会复制 info，尺寸与记录的不一致时重新提取。
+    """
+    features = image.info.get(FEATURES_INFO_KEY)
+    if features is None or (features['width'], features['height']) != image.size:
+        features = extract_features(image)
+        image.info[FEATURES_INFO_KEY] = features
+    return features
+
+
+def estimate_max_tokens(features, cap=1000, floor=128, tokens_per_char=1.0, margin=1.5):
+    """根据估算的字符数预测输出 token 上限
+
+    Args:
+        features: extract_features 的返回值
+        cap: 上限（用户设置的 max_tokens）
+        floor: 下限，避免短公式因估算误差被截断
+        tokens_per_char: 每个字符对应的 token 数（LaTeX 较密集）
+        margin: 安全系数
+    """
+    estimate = int(features['est_chars'] * tokens_per_char * margin) + 32
+    return max(floor, min(cap, estimate))
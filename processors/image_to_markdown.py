@@ -0,0 +1,1101 @@
+import contextlib
+import hashlib
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pyperclip
+import httpx
+from openai import OpenAI
+from PIL import Image, ImageGrab
+from processors.image_encoder import ImageEncoder, apply_preprocess
+from processors.markdown_processor import MarkdownProcessor
+from processors.image_features import cached_features, estimate_max_tokens
+from processors.model_router import ModelRouter
+from processors.document_filter import DocumentFilter
+from processors.scroll_stitch import ScrollStitcher
+from processors.result_cache import ResultCache, cache_key, prompt_hash, settings_hash
+from processors.scheduler import RequestScheduler
+from processors.image_cost import cost_model_for, plan_resize, text_line_height
+from processors.output_checks import check_output
+from processors.backends import ChatCompletionsBackend, create_local_backend
+from processors.request_packer import RequestPacker, PACK_INSTRUCTION, PACK_MARKER
+from processors.translator import Translator
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful assistant that converts images to markdown format. "
+    "If the image contains mathematical formulas, use LaTeX syntax for them. "
+    "Return only the markdown content of the image, without any additional words or explanations."
+)
+DEFAULT_USER_PROMPT = "Here is my image."
+VOLCENGINE_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue exactly where it stopped. "
+    "Output only the remaining content, without repeating anything already written."
+)
+# 渐进式识别：第一轮按该比例缩小图片，但最长边不小于 PROGRESSIVE_MIN_SIDE
+PROGRESSIVE_SCALE = 0.5
+PROGRESSIVE_MIN_SIDE = 640
+
+
+class ImageToMarkdown:
+    """剪贴板图片识别引擎，不依赖任何界面库
+
+    界面或守护进程通过 log_callback 接收日志，通过 status_callback 接收
+    'processing' / 'success' / 'error' 状态变化，通过 apply_config 或各 set_* 方法下发配置。
+    """
+
+    def __init__(self, log_callback=None, status_callback=None):
+        self.log_callback = log_callback
+        self.status_callback = status_callback
+        self.status = 'idle'
+        self.processed_count = 0
+        self.last_error = None
+        self.running = False
+        self.watch_generation = 0  # 每次 start 递增，旧的监听线程据此退出
+        self.client = None
+        self.api_backend = ChatCompletionsBackend(self)
+        self.backend = self.api_backend  # 当前识别后端，见 set_backend
+        self.backend_config = ('', {})
+        self.gpt_model = 'gpt-4o'
+        self.image_encoder = ImageEncoder()
+        self.markdown_processor = MarkdownProcessor()
+        self.current_provider = 'OPENAI'
+        self.screenshot_hotkey_isNull = True # 用于标记是否注册了截图快捷键
+        self.screenshot_hotkey_triggered = False # 用于标记是否触发了截图快捷键
+        self.screenshot_event = threading.Event() # 截图快捷键触发或停止监听时唤醒剪贴板线程
+        self.process_pre_exist_image=True # 用于标记是否处理软件启动时已经存在的剪贴板图片
+        # 只保留启动时剪贴板图片的指纹，不常驻整张图片；在首次 start 时获取
+        self.initial_fingerprint = None
+        self.initial_captured = False
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
+        self.user_prompt = DEFAULT_USER_PROMPT
+        self.prompt_cache_key = self.make_prompt_cache_key()
+        self.max_tokens = 1000
+        self.adaptive_max_tokens = False  # 是否根据图片内容预测 max_tokens
+        self.max_continuations = 3  # 输出被截断时最多自动续写的次数
+        self.progressive_resolution = False  # 是否先发送缩小的图片，结果可疑时再发送原图
+        self.progressive_stats = {'requests': 0, 'escalations': 0, 'full_pixels': 0, 'sent_pixels': 0}
+        self.cost_aware_resize = False  # 是否按服务商的图片计费方式缩放图片并设置 detail
+        self.image_cost_stats = {'requests': 0, 'predicted': 0, 'billed': 0, 'min_overhead': None, 'max_overhead': None}
+        self.stats_lock = threading.Lock()
+        self.pack_images = 1  # 合并请求时每次最多的图片数，为 1 时不合并
+        self.packer = None  # RequestPacker 实例，pack_images 大于 1 时创建
+        self.translator = None  # Translator 实例，启用识别后翻译时创建
+        self.base_url = ''  # 自定义服务商的 Base URL
+        self.api_key = ''
+        self.preprocess_settings = {}  # 发送前的图片预处理，见 set_preprocess
+        self.profile_manager = None  # ProfileManager 实例，启用配置方案时由其识别
+        self.router = None  # ModelRouter 实例，为 None 时所有图片使用 gpt_model
+        self.history = None  # HistoryStore 实例，为 None 时不记录历史
+        self.trace = None  # TraceRecorder 实例，为 None 时不录制
+        self.encode_pool = None  # EncodePool 实例，为 None 时在当前线程编码图片
+        self.spool = None  # CaptureSpool 实例，为 None 时截图在内存中直接识别
+        self.prefilter = None  # DocumentFilter 实例，为 None 时剪贴板图片全部识别
+        self.confirm_callback = None  # 过滤器要求询问时以 (score, reason) 调用，返回是否仍要识别
+        self.scroll_stitcher = None  # ScrollStitcher 实例，为 None 时每张截图单独识别
+        self.shadow = None  # ShadowEvaluator 实例，为 None 时不做影子评估
+        self.result_cache = None  # ResultCache 实例，为 None 时不缓存识别结果
+        self.result_cache_settings = None  # 创建 result_cache 时使用的设置，未变化时不重建
+        self.scheduler = None  # RequestScheduler 实例，为 None 时请求不排队
+        self.scheduler_settings = None  # 创建 scheduler 时使用的设置，未变化时不重建
+        self.memory_monitor = None  # MemoryMonitor 实例，用于统计存活的客户端和图片
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def update_status(self, status):
+        """记录并通知当前状态"""
+        self.status = status
+        if self.status_callback:
+            self.status_callback(status)
+
+    def apply_config(self, config):
+        """按配置文件内容（与设置窗口保存的格式相同）配置处理器"""
+        provider = config.get('current_provider', 'OPENAI')
+        settings = config.get('provider_settings', {}).get(provider, {})
+        self.set_provider(provider)
+        self.set_base_url(settings.get('url', ''))
+        self.set_api_key(settings.get('api_key', ''))
+        self.set_proxy(settings.get('proxy', ''))
+        self.set_gpt_model(settings.get('model', 'gpt-4o' if provider == 'OPENAI' else ''))
+
+        prompts = settings.get('prompt_settings', {})
+        self.set_prompts(
+            prompts.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+            prompts.get('user_prompt', DEFAULT_USER_PROMPT)
+        )
+        self.set_max_tokens(int(prompts.get('max_tokens', 1000)))
+        self.set_adaptive_max_tokens(prompts.get('adaptive_max_tokens', False))
+        self.set_progressive_resolution(prompts.get('progressive_resolution', False))
+        self.set_cost_aware_resize(prompts.get('cost_aware_resize', False))
+        self.set_router(ModelRouter.from_config(settings.get('routing', {}), self.log_callback))
+        self.set_backend(settings.get('backend', ''), settings.get('backend_options', {}))
+        self.set_translator(Translator.from_config(self, settings.get('translation', {})))
+
+        latex_cfg = config.get('latex_settings', {})
+        self.set_wrappers(
+            latex_cfg.get('inline_wrapper', '$ $'),
+            latex_cfg.get('block_wrapper', '$$ $$')
+        )
+        self.process_pre_exist_image = config.get('process_pre_exist_image', False)
+        self.set_prefilter(DocumentFilter.from_config(config.get('prefilter', {}), self.log_callback))
+        self.set_scroll_stitch(config.get('scroll_stitch', False))
+        self.apply_result_cache_settings(config.get('result_cache', {}))
+        self.apply_scheduler_settings(config.get('scheduler', {}))
+        # 旧版本的设置保存在 api_server.pack_images 中
+        self.set_pack_images(config.get('pack_images', (config.get('api_server') or {}).get('pack_images', 1)))
+
+    def set_memory_monitor(self, memory_monitor):
+        """设置内存统计，之后创建的客户端和图片都会被登记"""
+        self.memory_monitor = memory_monitor
+        if self.client:
+            memory_monitor.track('clients', self.client)
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def track(self, kind, obj):
+        if self.memory_monitor:
+            self.memory_monitor.track(kind, obj)
+
+    def set_prompts(self, system_prompt, user_prompt):
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.prompt_cache_key = self.make_prompt_cache_key()
+
+    def make_prompt_cache_key(self):
+        """由系统 Prompt 和用户 Prompt 计算缓存键，Prompt 不变时所有请求共用同一前缀缓存"""
+        digest = hashlib.sha1(f"{self.system_prompt}\0{self.user_prompt}".encode('utf-8'))
+        return f"pillocr-{digest.hexdigest()[:16]}"
+
+    def request_options(self, stream=False):
+        """chat.completions.create 的服务商相关参数
+
+        OpenAI 会自动缓存相同的请求前缀，prompt_cache_key 让相同 Prompt 的请求尽量命中同一缓存；
+        流式请求需要 include_usage 才会在最后返回 token 用量。其他服务商不一定支持这些参数，因此不传。
+        """
+        if self.current_provider != 'OPENAI':
+            return {}
+        options = {'extra_body': {'prompt_cache_key': self.prompt_cache_key}}
+        if stream:
+            options['stream_options'] = {'include_usage': True}
+        return options
+
+    def set_max_tokens(self, max_tokens):
+        self.max_tokens = max_tokens
+
+    def set_adaptive_max_tokens(self, enabled):
+        """启用后按图片尺寸和笔迹密度预测 max_tokens，以 max_tokens 设置为上限"""
+        self.adaptive_max_tokens = bool(enabled)
+
+    def set_progressive_resolution(self, enabled):
+        """启用后先发送缩小的图片，结果未通过 check_output 检查时再发送原图"""
+        self.progressive_resolution = bool(enabled)
+
+    def set_cost_aware_resize(self, enabled):
+        """启用后按计费模型选择 token 最少且文字仍清晰的发送尺寸，并设置 detail"""
+        self.cost_aware_resize = bool(enabled)
+
+    def set_backend(self, name, options=None):
+        """选择识别后端
+
+        Args:
+            name: 为空或 'api' 时使用服务商的 chat.completions 接口，否则为 LOCAL_BACKENDS 中的本地后端
+            options: 传给本地后端构造函数的参数，如 Tesseract 的 {'lang': 'chi_sim+eng'}
+        """
+        name = '' if name in (None, 'api') else name
+        options = dict(options or {})
+        if (name, options) == self.backend_config:
+            return
+        if self.backend is not self.api_backend:
+            self.backend.close()
+        self.backend = self.api_backend
+        self.backend_config = ('', {})
+        if not name:
+            return
+        try:
+            backend = create_local_backend(name, options)
+        except (ValueError, TypeError) as e:
+            self.log(f"创建识别后端失败: {e}")
+            return
+        available, reason = backend.available()
+        if not available:
+            self.log(f"本地识别后端 {name} 不可用（{reason}），改用服务商接口")
+            return
+        self.backend = backend
+        self.backend_config = (name, options)
+
+    def set_pack_images(self, count):
+        """设置同时提交的图片合并为一次请求时每次最多的图片数，不大于 1 时不合并"""
+        self.pack_images = max(1, int(count or 1))
+        if self.pack_images > 1:
+            if self.packer is None:
+                self.packer = RequestPacker(self)
+            self.packer.max_images = self.pack_images
+        elif self.packer is not None:
+            self.packer.stop()
+            self.packer = None
+
+    def set_translator(self, translator):
+        """设置识别后的翻译阶段，为 None 时不翻译"""
+        if self.translator is not None:
+            self.translator.stop()
+        self.translator = translator
+
+    def active_translator(self):
+        """当前配置方案（或默认设置）使用的翻译器"""
+        pipeline = self.profile_manager.active_pipeline() if self.profile_manager else None
+        return pipeline.translator if pipeline is not None else self.translator
+
+    def on_translated(self, markdown_content, error):
+        """翻译阶段完成的回调，出错时仍复制未翻译的识别结果"""
+        if error is not None:
+            self.log(f"翻译失败，已复制未翻译的结果: {error}")
+        else:
+            self.log("翻译后的内容已复制到剪贴板。")
+        pyperclip.copy(markdown_content)
+        self.update_status('success')
+
+    def set_router(self, router):
+        """设置模型路由器，为 None 时不路由"""
+        self.router = router
+
+    def plan_request(self, image):
+        """确定本次请求使用的模型和 max_tokens，图片特征最多只提取一次（预过滤已提取时直接使用）
+
+        Returns:
+            (model, max_tokens, features)，未启用任何依赖特征的功能时 features 为 None
+        """
+        features = None
+        if self.adaptive_max_tokens or self.router or self.progressive_resolution or self.cost_aware_resize:
+            features = cached_features(image)
+        model = self.gpt_model
+        if self.router:
+            model = self.router.route(image, self.gpt_model, features)
+        max_tokens = self.max_tokens
+        if self.adaptive_max_tokens:
+            max_tokens = estimate_max_tokens(features, cap=self.max_tokens)
+        return model, max_tokens, features
+
+    def set_provider(self, provider):
+        """设置当前服务商"""
+        self.current_provider = provider
+
+    def set_base_url(self, base_url):
+        """设置自定义服务商的 Base URL"""
+        self.base_url = (base_url or '').strip()
+
+    def set_api_key(self, api_key):
+        if not api_key:
+            self.log("API Key不能为空")
+        # 保存在实例上而不是写入环境变量，多个配置方案可以使用不同的 Key
+        self.api_key = api_key or ''
+
+    def set_proxy(self, proxy):
+        """根据服务商设置代理和client"""
+        old_client = self.client
+        try:
+            if self.current_provider == 'OPENAI':
+                base_url = None
+            elif self.current_provider == '火山引擎':
+                base_url = VOLCENGINE_BASE_URL
+            elif self.current_provider == '自定义':
+                base_url = self.base_url
+                if not base_url:
+                    self.log("自定义URL不能为空")
+            else:
+                return
+            http_client = None
+            if proxy:
+                http_client = httpx.Client(
+                    transport=httpx.HTTPTransport(proxy=proxy)
+                )
+            self.client = OpenAI(
+                api_key=self.api_key,
+                base_url=base_url,
+                http_client=http_client
+            )
+        except Exception as e:
+            self.log(f"设置客户端时出错: {str(e)}")
+        # 关闭被替换的客户端，释放其连接池
+        if old_client is not None and old_client is not self.client:
+            try:
+                old_client.close()
+            except Exception:
+                pass
+        if self.client is not None:
+            self.track('clients', self.client)
+
+    def set_gpt_model(self, model_name):
+        if not model_name:
+            self.log("模型不能为空")
+            return
+        self.gpt_model = model_name
+
+    def set_history(self, history):
+        """设置识别历史存储"""
+        self.history = history
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def set_trace(self, trace):
+        """设置识别录制，为 None 时停止录制"""
+        self.trace = trace
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def set_encode_pool(self, encode_pool):
+        """设置编码大图片的进程池，为 None 时在当前线程编码"""
+        self.encode_pool = encode_pool
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def set_shadow(self, shadow):
+        """设置影子评估，为 None 时停止抽样"""
+        self.shadow = shadow
+
+    def offer_shadow(self, image, result, source):
+        """把识别结果交给影子评估抽样，评估出错不影响正常识别"""
+        if self.shadow is None or source == 'shadow':
+            return
+        try:
+            self.shadow.offer(image, result, source)
+        except Exception as e:
+            self.log(f"影子评估抽样失败: {e}")
+
+    def set_spool(self, spool):
+        """设置截图的磁盘缓冲区，为 None 时截图直接识别"""
+        self.spool = spool
+
+    def set_prefilter(self, prefilter):
+        """设置剪贴板图片的识别前过滤器，为 None 时不过滤"""
+        self.prefilter = prefilter
+
+    def apply_result_cache_settings(self, settings):
+        """按设置创建结果缓存，设置未变化时保留现有缓存（和其中的本地结果）"""
+        settings = dict(settings or {})
+        if settings == self.result_cache_settings:
+            return
+        self.result_cache_settings = settings
+        self.set_result_cache(ResultCache.from_config(settings, self.log_callback))
+
+    def set_result_cache(self, result_cache):
+        """设置结果缓存，配置方案的管线共用同一缓存"""
+        if self.result_cache is not None and self.result_cache is not result_cache:
+            self.result_cache.close()
+        self.result_cache = result_cache
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def apply_scheduler_settings(self, settings):
+        """按设置创建请求调度器，设置未变化时保留现有调度器（和其中的排队统计）"""
+        settings = dict(settings or {})
+        if settings == self.scheduler_settings:
+            return
+        self.scheduler_settings = settings
+        self.set_scheduler(RequestScheduler.from_config(settings, self.log_callback))
+
+    def set_scheduler(self, scheduler):
+        """设置请求调度器，配置方案的管线和影子评估的候选管线共用同一调度器和限速额度"""
+        self.scheduler = scheduler
+        if self.profile_manager:
+            self.profile_manager.share_from(self)
+
+    def throttle(self):
+        """同一任务内的后续请求也计入每分钟请求数"""
+        if self.scheduler is not None:
+            self.scheduler.throttle()
+
+    def scheduled(self, source, local=False):
+        """请求服务商前按来源排队；本地后端不占用服务商额度，不排队"""
+        if self.scheduler is None or local:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(source)
+
+    def set_scroll_stitch(self, enabled):
+        """启用或关闭连续截图拼接"""
+        if enabled and self.scroll_stitcher is None:
+            self.scroll_stitcher = ScrollStitcher(log_callback=self.log_callback)
+        elif not enabled:
+            self.scroll_stitcher = None
+
+    def encode(self, image):
+        """预处理并编码图片为 base64 PNG，大图片交给进程池"""
+        if self.encode_pool and self.encode_pool.should_offload(image):
+            return self.encode_pool.encode(image, self.preprocess_settings)
+        return self.image_encoder.encode_image(self.preprocess(image))
+
+    def encode_many(self, images):
+        """并行编码多张图片
+
+        未使用进程池时用线程并行：Pillow 在 PNG 压缩期间会释放 GIL，多核机器上线程即可并行编码。
+        """
+        if len(images) <= 1:
+            return [self.encode(image) for image in images]
+        if self.encode_pool:
+            futures = [
+                self.encode_pool.submit(image, self.preprocess_settings)
+                if self.encode_pool.should_offload(image) else None
+                for image in images
+            ]
+            return [
+                future.result() if future is not None else self.image_encoder.encode_image(self.preprocess(image))
+                for image, future in zip(images, futures)
+            ]
+        with ThreadPoolExecutor(max_workers=len(images)) as executor:
+            return list(executor.map(self.encode, images))
+
+    def set_preprocess(self, settings):
+        """设置发送前的图片预处理
+
+        Args:
+            settings: dict，支持 'grayscale'（转为灰度）和 'max_side'（最长边上限，0 为不缩放）
+        """
+        self.preprocess_settings = dict(settings or {})
+
+    def preprocess(self, image):
+        """按预处理设置返回发送用的图片，未设置时返回原图"""
+        return apply_preprocess(image, self.preprocess_settings)
+
+    def sent_size(self, image):
+        """原图经过预处理后实际发送的尺寸"""
+        width, height = image.size
+        max_side = int(self.preprocess_settings.get('max_side', 0) or 0)
+        if max_side and max(width, height) > max_side:
+            ratio = max_side / max(width, height)
+            width, height = max(1, round(width * ratio)), max(1, round(height * ratio))
+        return width, height
+
+    def fit_image_cost(self, image, model, features):
+        """按服务商的计费模型缩放图片，返回 (发送的图片, 预测的图片 token 数)
+
+        选择的 detail 保存在图片的 info['image_detail'] 中，由 build_messages 读取。
+        没有对应的计费模型时返回 (原图, None)。
+        """
+        cost_model = cost_model_for(self.current_provider, model)
+        if cost_model is None:
+            return image, None
+        width, height = self.sent_size(image)
+        line_height = text_line_height(features)
+        if line_height:
+            line_height *= width / image.width
+        target_width, target_height, detail, tokens = plan_resize(cost_model, width, height, line_height)
+        if (target_width, target_height) != image.size:
+            image = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+            self.track('images', image)
+            self.log(f"按计费方式缩放图片: {width}x{height} -> {target_width}x{target_height}，detail={detail}")
+        if detail:
+            image.info['image_detail'] = detail
+        return image, tokens
+
+    def predict_image_tokens(self, image, model):
+        """按计费模型预测发送该图片的 token 数，detail 沿用 fit_image_cost 的选择；没有对应的计费模型时返回 None"""
+        cost_model = cost_model_for(self.current_provider, model)
+        if cost_model is None:
+            return None
+        return cost_model.tokens(*self.sent_size(image), image.info.get('image_detail') or 'high')
+
+    def record_image_cost(self, predicted, usage, billed_before=0):
+        """记录预测的图片 token 与实际计费的输入 token，两者之差（Prompt 文本）应基本不变
+
+        usage 累加了同一次识别中的多个请求时，billed_before 为之前请求已计入的输入 token 数。
+        """
+        billed = usage.get('prompt_tokens')
+        if billed is None:
+            self.log(f"预测图片 token: {predicted}（服务商未返回用量）")
+            return
+        billed -= billed_before
+        overhead = billed - predicted
+        with self.stats_lock:
+            stats = self.image_cost_stats
+            stats['requests'] += 1
+            stats['predicted'] += predicted
+            stats['billed'] += billed
+            stats['min_overhead'] = overhead if stats['min_overhead'] is None else min(stats['min_overhead'], overhead)
+            stats['max_overhead'] = overhead if stats['max_overhead'] is None else max(stats['max_overhead'], overhead)
+        self.log(f"预测图片 token: {predicted}，实际输入 token: {billed}（差值 {overhead} 为 Prompt 文本等）")
+
+    def image_cost_summary(self):
+        """返回图片 token 预测的统计，差值范围越小说明计费模型越准确"""
+        with self.stats_lock:
+            return dict(self.image_cost_stats)
+
+    def reduce_resolution(self, image):
+        """返回渐进式识别第一轮发送的缩小图片，图片本身已足够小时返回 None"""
+        long_side = max(self.sent_size(image))
+        target = max(PROGRESSIVE_MIN_SIDE, int(long_side * PROGRESSIVE_SCALE))
+        if target >= long_side * 0.9:
+            return None
+        reduced = image.copy()
+        reduced.thumbnail((target, target), Image.Resampling.LANCZOS)
+        self.track('images', reduced)
+        return reduced
+
+    def record_progressive(self, full_size, reduced_size, escalated):
+        """累计渐进式识别的升级次数和节省的像素"""
+        full_pixels = full_size[0] * full_size[1]
+        sent_pixels = reduced_size[0] * reduced_size[1] + (full_pixels if escalated else 0)
+        with self.stats_lock:
+            stats = self.progressive_stats
+            stats['requests'] += 1
+            stats['escalations'] += 1 if escalated else 0
+            stats['full_pixels'] += full_pixels
+            stats['sent_pixels'] += sent_pixels
+        summary = self.progressive_summary()
+        self.log(
+            f"渐进式识别: 升级率 {summary['escalation_rate']:.0%}，"
+            f"累计节省图片像素 {summary['pixel_savings']:.0%}"
+        )
+
+    def progressive_summary(self):
+        """返回渐进式识别的统计：请求数、升级次数、升级率和节省的像素比例"""
+        with self.stats_lock:
+            stats = dict(self.progressive_stats)
+        stats['escalation_rate'] = stats['escalations'] / stats['requests'] if stats['requests'] else 0.0
+        stats['pixel_savings'] = 1 - stats['sent_pixels'] / stats['full_pixels'] if stats['full_pixels'] else 0.0
+        return stats
+
+    def warm_up(self, timeout=10):
+        """预先建立到服务商的连接，使首次识别无需等待 TCP/TLS 握手"""
+        if not self.client:
+            return False
+        try:
+            self.client.with_options(timeout=timeout, max_retries=0).models.list()
+        except Exception:
+            # 部分服务商不支持 models 接口，只要连接已建立即可
+            pass
+        return True
+
+    def set_profile_manager(self, profile_manager):
+        """设置配置方案管理器，启用某个配置方案后识别由对应管线完成"""
+        self.profile_manager = profile_manager
+        if profile_manager:
+            profile_manager.share_from(self)
+
+    def build_messages(self, image):
+        """构造发送给模型的消息"""
+        base64_img = f"data:image/png;base64,{self.encode(image)}"
+        return self.build_messages_for_url(base64_img, image.info.get('image_detail'))
+
+    def build_messages_for_url(self, image_url, detail=None):
+        """系统 Prompt 和用户 Prompt 在前、图片在最后，使所有请求共享可被缓存的相同前缀"""
+        image_part = {"url": image_url}
+        if detail:
+            image_part["detail"] = detail
+        return [
+            {
+                "role": "system",
+                "content": self.system_prompt
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": self.user_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": image_part
+                    }
+                ],
+            }
+        ]
+
+    def build_packed_messages(self, images):
+        """构造一次识别多张图片的消息，每张图片前附带分隔标记"""
+        # 说明文字与图片数无关，合并请求之间也共享相同前缀
+        content = [{"type": "text", "text": f"{self.user_prompt}\n{PACK_INSTRUCTION}"}]
+        for index, encoded in enumerate(self.encode_many(images), 1):
+            content.append({"type": "text", "text": PACK_MARKER.format(index=index)})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/png;base64,{encoded}"}
+            })
+        return [
+            {
+                "role": "system",
+                "content": self.system_prompt
+            },
+            {
+                "role": "user",
+                "content": content,
+            }
+        ]
+
+    def postprocess(self, markdown_content):
+        """去除 markdown 代码块包裹并替换公式包装符"""
+        markdown_content = re.sub(r'^```markdown\s*\n(.*?)\n```\s*$', r'\1', markdown_content, flags=re.DOTALL)
+        return self.markdown_processor.modify_wrappers(markdown_content)
+
+    def process_image(self, image, source='api'):
+        return self.recognize(image, source)['markdown']
+
+    def recognize(self, image, source='api'):
+        """识别图片，返回包含原始输出、处理后结果、token 用量和耗时的 dict"""
+        pipeline = self.profile_manager.active_pipeline() if self.profile_manager else None
+        if pipeline is not None:
+            result = pipeline.recognize(image, source)
+            self.offer_shadow(image, result, source)
+            return result
+        backend = self.backend
+        available, reason = backend.available()
+        if not available:
+            raise Exception(reason)
+
+        start = time.perf_counter()
+        if backend.local:
+            # 本地后端没有网络和 token 费用，不做模型路由和渐进式识别
+            model, max_tokens, features = backend.name, self.max_tokens, None
+        else:
+            model, max_tokens, features = self.plan_request(image)
+        key = None
+        if self.result_cache is not None and not backend.local:
+            key = self.result_cache_key(image, model)
+            raw_output, tier = self.result_cache.get(key)
+            if raw_output is not None:
+                return self.cached_result(image, raw_output, model, tier, start, source)
+        queued = time.perf_counter()
+        with self.scheduled(source, backend.local):
+            queue_ms = (time.perf_counter() - queued) * 1000
+            sent, predicted = image, None
+            if self.cost_aware_resize and not backend.local:
+                sent, predicted = self.fit_image_cost(image, model, features)
+            planned = time.perf_counter()
+            usage = {}
+            reduced = self.reduce_resolution(sent) if self.progressive_resolution and not backend.local else None
+            if reduced is not None:
+                full_predicted = predicted
+                predicted = self.predict_image_tokens(reduced, model) if full_predicted is not None else None
+                raw_output = backend.recognize(reduced, model, max_tokens, usage)
+                if predicted is not None:
+                    self.record_image_cost(predicted, usage)
+                problems = check_output(raw_output, features)
+                if problems:
+                    self.log(f"缩小图片的识别结果可疑（{'，'.join(problems)}），改用原图重新识别")
+                    self.throttle()
+                    billed_before = usage.get('prompt_tokens', 0)
+                    raw_output = backend.recognize(sent, model, max_tokens, usage)
+                    if full_predicted is not None:
+                        self.record_image_cost(full_predicted, usage, billed_before)
+                        # 结果中的 image_tokens 与 prompt_tokens 一样包含两次请求
+                        predicted += full_predicted
+                self.record_progressive(self.sent_size(sent), reduced.size, bool(problems))
+                reduced.close()
+            else:
+                raw_output = backend.recognize(sent, model, max_tokens, usage)
+                if predicted is not None:
+                    self.record_image_cost(predicted, usage)
+            if sent is not image:
+                sent.close()
+        finished = time.perf_counter()
+        encode_ms = (planned - start) * 1000 - queue_ms + usage.get('encode_ms', 0)
+        result = {
+            'raw': raw_output,
+            'markdown': self.postprocess(raw_output),
+            'provider': 'local' if backend.local else self.current_provider,
+            'model': model,
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+            'total_tokens': usage.get('total_tokens'),
+            'cached_tokens': usage.get('cached_tokens'),
+            'image_tokens': predicted,
+            'encode_ms': encode_ms,
+            'queue_ms': queue_ms,
+            'truncated': usage.get('truncated', False),
+            'request_ms': (finished - start) * 1000 - encode_ms - queue_ms,
+            'total_ms': (time.perf_counter() - start) * 1000,
+        }
+        self.log_usage(usage)
+        if key is not None and raw_output.strip():
+            if result['truncated']:
+                self.log("输出不完整，不写入结果缓存")
+            else:
+                self.result_cache.put(key, raw_output, self.current_provider, model)
+        self.record_history(image, result, source)
+        self.offer_shadow(image, result, source)
+        return result
+
+    def result_cache_key(self, image, model):
+        """结果缓存的键：同一模型名可能来自不同的服务商，预处理和缩放设置不同时实际发送的图片也不同"""
+        endpoint = f"{self.current_provider}|{self.base_url if self.current_provider == '自定义' else ''}"
+        sent = settings_hash({
+            'preprocess': self.preprocess_settings,
+            'cost_aware_resize': self.cost_aware_resize,
+            'progressive_resolution': self.progressive_resolution,
+        })
+        return cache_key(self.image_encoder.fingerprint(image), endpoint, model,
+                         prompt_hash(self.system_prompt, self.user_prompt), sent)
+
+    def cached_result(self, image, raw_output, model, tier, start, source):
+        """由缓存的模型输出构造识别结果，没有 token 用量；不参与影子评估"""
+        self.log(f"命中{'本地' if tier == 'local' else '团队'}缓存，未请求服务商")
+        elapsed = (time.perf_counter() - start) * 1000
+        result = {
+            'raw': raw_output,
+            'markdown': self.postprocess(raw_output),
+            'provider': self.current_provider,
+            'model': model,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_tokens': 0,
+            'cached_tokens': None,
+            'image_tokens': None,
+            'encode_ms': elapsed,
+            'request_ms': 0.0,
+            'total_ms': elapsed,
+            'result_cache': tier,
+        }
+        self.record_history(image, result, source)
+        return result
+
+    def submit(self, image, source='api'):
+        """识别图片；启用合并请求时，与同一时间提交的其他图片合并为一次请求"""
+        if self.packer is not None:
+            return self.packer.submit(image, source)
+        return self.recognize(image, source)
+
+    def recognize_many(self, images, source='api', pack_size=None):
+        """识别多张图片，返回与 images 顺序一致的结果列表
+
+        使用相同模型的图片每 pack_size 张合并为一次请求，共享系统 Prompt 和请求开销；
+        后端不支持合并或输出无法按分隔标记拆分时，逐张单独识别。
+
+        Args:
+            images: 图片列表
+            source: 来源，可以是字符串或与 images 等长的列表
+            pack_size: 每次请求最多合并的图片数，默认为 pack_images
+        """
+        pipeline = self.profile_manager.active_pipeline() if self.profile_manager else None
+        if pipeline is not None:
+            return pipeline.recognize_many(images, source, pack_size or self.pack_images)
+        sources = source if isinstance(source, (list, tuple)) else [source] * len(images)
+        pack_size = pack_size or self.pack_images
+        backend = self.backend
+        if pack_size <= 1 or len(images) <= 1 or not backend.supports_batching:
+            return [self.recognize(image, src) for image, src in zip(images, sources)]
+        available, reason = backend.available()
+        if not available:
+            raise Exception(reason)
+
+        plans = [self.plan_request(image) for image in images]
+        groups = {}
+        for index, (model, _, _) in enumerate(plans):
+            groups.setdefault(model, []).append(index)
+        results = [None] * len(images)
+        for model, indexes in groups.items():
+            for offset in range(0, len(indexes), pack_size):
+                chunk = indexes[offset:offset + pack_size]
+                if len(chunk) == 1:
+                    results[chunk[0]] = self.recognize(images[chunk[0]], sources[chunk[0]])
+                    continue
+                start = time.perf_counter()
+                usage = {}
+                max_tokens = sum(plans[i][1] for i in chunk)
+                with self.scheduled([sources[i] for i in chunk]):
+                    outputs = backend.recognize_batch([images[i] for i in chunk], model, max_tokens, usage)
+                if outputs is None:
+                    self.log(f"合并请求的结果无法拆分，改为逐张识别 {len(chunk)} 张图片")
+                    for i in chunk:
+                        results[i] = self.recognize(images[i], sources[i])
+                    continue
+                self.log(f"已合并 {len(chunk)} 张图片为一次请求")
+                self.log_usage(usage)
+                total_ms = (time.perf_counter() - start) * 1000
+                encode_ms = usage.get('encode_ms', 0)
+                for i, raw_output in zip(chunk, outputs):
+                    # token 用量按图片数平均分摊
+                    result = {
+                        'raw': raw_output,
+                        'markdown': self.postprocess(raw_output),
+                        'provider': self.current_provider,
+                        'model': model,
+                        'prompt_tokens': usage['prompt_tokens'] // len(chunk) if 'prompt_tokens' in usage else None,
+                        'completion_tokens': usage['completion_tokens'] // len(chunk) if 'completion_tokens' in usage else None,
+                        'total_tokens': usage['total_tokens'] // len(chunk) if 'total_tokens' in usage else None,
+                        'cached_tokens': usage['cached_tokens'] // len(chunk) if 'cached_tokens' in usage else None,
+                        'encode_ms': encode_ms,
+                        'request_ms': total_ms - encode_ms,
+                        'total_ms': total_ms,
+                        'packed': len(chunk),
+                    }
+                    self.record_history(images[i], result, sources[i])
+                    results[i] = result
+        return results
+
+    @staticmethod
+    def add_usage(usage, response):
+        """累加响应中的 token 用量，cached_tokens 为命中前缀缓存的输入 token 数"""
+        response_usage = getattr(response, 'usage', None)
+        for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            value = getattr(response_usage, key, None)
+            if value is not None:
+                usage[key] = usage.get(key, 0) + value
+        details = getattr(response_usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None)
+        if cached is not None:
+            usage['cached_tokens'] = usage.get('cached_tokens', 0) + cached
+
+    def log_usage(self, usage):
+        """输出本次请求缓存命中和未命中的输入 token 数"""
+        if usage.get('prompt_tokens') is None:
+            return
+        cached = usage.get('cached_tokens', 0)
+        self.log(
+            f"token 用量: 输入 {usage['prompt_tokens']}（缓存命中 {cached}，未命中 {usage['prompt_tokens'] - cached}），"
+            f"输出 {usage.get('completion_tokens', 0)}"
+        )
+
+    def continue_output(self, messages, raw_output, finish_reason, usage, model=None):
+        """输出因 max_tokens 被截断时自动请求续写，并拼接结果
+
+        续写次数用完后仍被截断时 usage['truncated'] 为 True；同一次识别再次请求（如用原图重试）时按最后一次结果覆盖。
+        """
+        rounds = 0
+        while finish_reason == 'length' and rounds < self.max_continuations:
+            rounds += 1
+            self.log(f"输出被截断，正在自动续写（第 {rounds} 次）")
+            self.throttle()
+            response = self.client.chat.completions.create(
+                model=model or self.gpt_model,
+                messages=messages + [
+                    {"role": "assistant", "content": raw_output},
+                    {"role": "user", "content": CONTINUE_PROMPT},
+                ],
+                max_tokens=self.max_tokens,
+                **self.request_options()
+            )
+            self.add_usage(usage, response)
+            continuation = response.choices[0].message.content or ''
+            raw_output = self.markdown_processor.merge_continuation(raw_output, continuation)
+            finish_reason = response.choices[0].finish_reason
+        usage['truncated'] = finish_reason == 'length'
+        if usage['truncated']:
+            self.log("续写次数已达上限，输出可能不完整")
+        return raw_output
+
+    def record_history(self, image, result, source):
+        """将识别结果提交到历史记录（后台批量写入），开启录制时同时写入录制文件"""
+        if self.trace:
+            try:
+                self.trace.record(image, result, source)
+            except Exception as e:
+                self.log(f"写入录制文件失败: {e}")
+        if not self.history:
+            return
+        try:
+            record = dict(result)
+            record['raw_output'] = record.pop('raw')
+            record['source'] = source
+            record['fingerprint'] = self.image_encoder.fingerprint(image)
+            record['thumbnail'] = self.image_encoder.thumbnail(image)
+            self.history.add(record)
+        except Exception as e:
+            self.log(f"记录历史失败: {e}")
+
+    def iter_markdown(self, image):
+        """流式识别，按完整段落逐段返回处理后的 Markdown"""
+        pipeline = self.profile_manager.active_pipeline() if self.profile_manager else None
+        if pipeline is not None:
+            yield from pipeline.iter_markdown(image)
+            return
+        backend = self.backend
+        available, reason = backend.available()
+        if not available:
+            raise Exception(reason)
+
+        start = time.perf_counter()
+        # 流式输出无法在返回前检查结果，始终发送原图
+        if backend.local:
+            model, max_tokens = backend.name, self.max_tokens
+        else:
+            model, max_tokens, _ = self.plan_request(image)
+        fence = '```markdown'
+        raw_output = ''
+        fenced = None  # 是否被 ```markdown 代码块包裹，未确定前为 None
+        buffer = ''
+        usage = {}
+        with self.scheduled('api', backend.local):
+            for delta in backend.stream(image, model, max_tokens, usage):
+                raw_output += delta
+                buffer += delta
+                if fenced is None:
+                    head = buffer.lstrip()
+                    if len(head) <= len(fence) and fence.startswith(head):
+                        continue
+                    fenced = head.startswith(fence)
+                    if fenced:
+                        buffer = re.sub(r'^\s*```markdown\s*\n', '', buffer)
+                cut = self._stream_cut(buffer)
+                if cut and not (fenced and buffer[:cut].rstrip().endswith('```')):
+                    yield self.markdown_processor.modify_wrappers(buffer[:cut])
+                    buffer = buffer[cut:]
+        if fenced:
+            buffer = re.sub(r'\n?```\s*$', '', buffer)
+        if buffer:
+            yield self.markdown_processor.modify_wrappers(buffer)
+        self.record_history(image, {
+            'raw': raw_output,
+            'markdown': self.postprocess(raw_output),
+            'provider': 'local' if backend.local else self.current_provider,
+            'model': model,
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+            'total_tokens': usage.get('total_tokens'),
+            'cached_tokens': usage.get('cached_tokens'),
+            'total_ms': (time.perf_counter() - start) * 1000,
+        }, 'api')
+        self.log_usage(usage)
+
+    @staticmethod
+    def _stream_cut(buffer):
+        """返回可安全输出的段落边界位置，公式块未闭合时返回 0"""
+        cut = buffer.rfind('\n\n')
+        if cut < 0:
+            return 0
+        cut += 2
+        head = buffer[:cut]
+        if head.count('$$') % 2 or head.count('\\[') != head.count('\\]'):
+            return 0
+        return cut
+
+    def process_clipboard_image(self, generation=None):
+        if  not self.process_pre_exist_image:
+            last_fingerprint = self.initial_fingerprint
+        else:
+            last_fingerprint = None
+        while self.running and generation in (None, self.watch_generation):
+            if not self.screenshot_hotkey_isNull and not self.screenshot_hotkey_triggered:
+                # 绑定了截图快捷键时等待快捷键触发，空闲时不读取剪贴板
+                self.screenshot_event.wait()
+                self.screenshot_event.clear()
+                continue
+            try:
+                if self.screenshot_hotkey_isNull or self.screenshot_hotkey_triggered:
+                    image = ImageGrab.grabclipboard()
+                    if isinstance(image, Image.Image):
+                        self.track('images', image)
+                        fingerprint = self.image_encoder.fingerprint(image)
+                        if fingerprint != last_fingerprint:
+                            self.log("检测到新的剪贴板图像。")
+                            if self.prefilter is None or self.prefilter.check(image, self.confirm_callback):
+                                self.capture(image, 'clipboard')
+                            last_fingerprint = fingerprint
+                            self.screenshot_hotkey_triggered = False
+                        # 任务完成后立即释放图片缓冲区
+                        image.close()
+            except Exception as e:
+                self.log(f"发生错误: {e}")
+                self.last_error = str(e)
+                self.update_status('error')
+                self.running = False
+                break
+            time.sleep(1)
+
+    def set_screenshot_hotkey(self, registered):
+        """标记是否注册了截图快捷键，取消时唤醒剪贴板线程恢复轮询"""
+        self.screenshot_hotkey_isNull = not registered
+        self.screenshot_event.set()
+
+    def trigger_screenshot(self):
+        """截图快捷键触发后由热键线程调用，唤醒剪贴板线程读取下一张截图"""
+        self.screenshot_hotkey_triggered = True
+        self.screenshot_event.set()
+
+    def capture(self, image, source):
+        """处理一张截图：启用缓冲区时写入缓冲区后立即返回，否则直接识别"""
+        if self.spool is not None:
+            self.spool.append(image, source)
+            return
+        self.handle_image(image, source)
+
+    def handle_spooled(self, image, source):
+        """CaptureSpool 的识别函数，出错时记录状态后继续抛出，由缓冲区决定重试或丢弃"""
+        try:
+            self.handle_image(image, source)
+        except Exception as e:
+            self.last_error = str(e)
+            self.update_status('error')
+            raise
+
+    def handle_image(self, image, source):
+        """识别一张图片并将结果复制到剪贴板（启用翻译时翻译完成后再复制）"""
+        self.update_status('processing')
+        stitcher = self.scroll_stitcher
+        plan = stitcher.plan(image) if stitcher is not None else None
+        if plan is not None and plan.empty:
+            stitcher.touch(plan)
+            self.log("与上一张截图相比没有新的内容，已跳过。")
+            self.update_status('success')
+            return
+        sent = plan.strip if plan is not None and plan.strip is not None else image
+        try:
+            markdown_content = self.process_image(sent, source=source)
+        except Exception:
+            if sent is not image:
+                sent.close()
+            raise
+        new_content = markdown_content
+        if plan is not None:
+            # 剪贴板中是拼接后的完整结果
+            markdown_content, new_content = stitcher.commit(plan, markdown_content)
+        translator = self.active_translator()
+        if translator is not None:
+            # 翻译在后台进行，监听线程立即继续识别下一张图片；拼接时只翻译新增的部分
+            self.log("识别完成，正在翻译……")
+            translator.submit(new_content, self.on_translated, source)
+        else:
+            pyperclip.copy(markdown_content)
+            self.log("识别后的内容已复制到剪贴板。")
+
+        self.processed_count += 1
+        if translator is None:
+            self.update_status('success')
+
+    def process_region_image(self, image):
+        """在后台线程中识别内置区域截图得到的图片，不经过剪贴板读取和重新解码"""
+        if self.spool is not None:
+            try:
+                self.spool.append(image, 'region')
+            finally:
+                image.close()
+            return
+
+        def run():
+            try:
+                self.handle_image(image, 'region')
+            except Exception as e:
+                self.log(f"发生错误: {e}")
+                self.last_error = str(e)
+                self.update_status('error')
+            finally:
+                image.close()
+
+        self.track('images', image)
+        threading.Thread(target=run, daemon=True).start()
+
+    def capture_initial_clipboard(self):
+        """记录首次启动监听时剪贴板中已有图片的指纹"""
+        self.initial_captured = True
+        try:
+            initial_image = ImageGrab.grabclipboard()
+            if isinstance(initial_image, Image.Image):
+                self.initial_fingerprint = self.image_encoder.fingerprint(initial_image)
+                initial_image.close()
+        except:
+            pass
+
+    def start(self):
+        if not self.initial_captured:
+            self.capture_initial_clipboard()
+        self.running = True
+        self.watch_generation += 1
+        # 唤醒上一代仍在等待快捷键的线程，使其退出
+        self.screenshot_event.set()
+        threading.Thread(target=self.process_clipboard_image, args=(self.watch_generation,), daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.screenshot_event.set()
+
+    def set_wrappers(self, inline_wrapper: str, block_wrapper: str):
+        """代理到 markdown_processor 的 set_wrappers 方法"""
+        self.markdown_processor.set_wrappers(inline_wrapper, block_wrapper)
@@ -38,4 +38,14 @@ class MarkdownProcessor:
             # 清理单个 $ 和内容之间的空格
             text = re.sub(r'\$\s+([^\$]+?)\s+\$', r'$\1$', text)
         
-        return text
\ No newline at end of file
+        return text
+
+    def merge_continuation(self, previous: str, continuation: str,
+                           max_overlap: int = 200, min_overlap: int = 4) -> str:
+        """拼接续写输出，去除续写开头与已有输出结尾重复的部分"""
+        continuation = re.sub(r'^\s*```markdown\s*\n', '', continuation)
+        limit = min(max_overlap, len(previous), len(continuation))
+        for size in range(limit, min_overlap - 1, -1):
+            if previous.endswith(continuation[:size]):
+                return previous + continuation[size:]
+        return previous + continuation
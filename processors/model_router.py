@@ -0,0 +1,74 @@
+from processors.image_features import cached_features
+
+# 判定为“简单图片”的阈值，任一项超出即交给强模型
+DEFAULT_THRESHOLDS = {
+    'max_simple_lines': 1,          # 简单图片最多的文本行数
+    'max_simple_ink': 0.12,         # 简单图片最大的笔迹像素占比
+    'max_simple_pixels': 600000,    # 简单图片最大的像素数
+    'handwriting_score': 0.45,      # 手写特征得分达到该值视为手写
+}
+
+
+class ModelRouter:
+    """根据图片的本地特征在廉价快速模型和强模型之间选择
+
+    单行、稀疏的小截图交给快速模型（如 qwen-vl-ocr、gpt-4o-mini），
+    多行、密集或疑似手写的图片交给强模型（如 qwen-vl-max、gpt-4o）。
+    """
+
+    def __init__(self, fast_model='', strong_model='', thresholds=None, log_callback=None):
+        """
+        Args:
+            fast_model: 快速模型名称，为空时不路由
+            strong_model: 强模型名称，为空时使用处理器当前的模型
+            thresholds: 覆盖 DEFAULT_THRESHOLDS 中的阈值
+            log_callback: 路由决策日志回调
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        self.thresholds.update(thresholds or {})
+        self.log_callback = log_callback
+        self.decisions = {'fast': 0, 'strong': 0}
+
+    @classmethod
+    def from_config(cls, routing, log_callback=None):
+        """根据服务商设置中的 routing 配置创建路由器，未启用时返回 None"""
+        if not routing or not routing.get('enabled') or not routing.get('fast_model'):
+            return None
+        return cls(
+            fast_model=routing.get('fast_model', ''),
+            strong_model=routing.get('strong_model', ''),
+            thresholds=routing.get('thresholds', {}),
+            log_callback=log_callback
+        )
+
+    def classify(self, features):
+        """返回 ('fast' 或 'strong', 原因)"""
+        t = self.thresholds
+        if features['handwriting_score'] >= t['handwriting_score']:
+            return 'strong', f"疑似手写({features['handwriting_score']:.2f})"
+        if features['line_count'] > t['max_simple_lines']:
+            return 'strong', f"{features['line_count']} 行"
+        if features['ink_density'] > t['max_simple_ink']:
+            return 'strong', f"笔迹密度 {features['ink_density']:.2f}"
+        if features['width'] * features['height'] > t['max_simple_pixels']:
+            return 'strong', f"尺寸 {features['width']}x{features['height']}"
+        return 'fast', f"{features['line_count']} 行，笔迹密度 {features['ink_density']:.2f}"
+
+    def route(self, image, default_model, features=None):
+        """返回本次请求使用的模型
+
+        Args:
+            image: 待识别图片
+            default_model: 未设置强模型时使用的模型
+            features: 已提取的特征，为 None 时在此提取
+        """
+        if features is None:
+            features = cached_features(image)
+        tier, reason = self.classify(features)
+        self.decisions[tier] += 1
+        model = self.fast_model if tier == 'fast' else (self.strong_model or default_model)
+        if self.log_callback:
+            self.log_callback(f"模型路由: {model}（{reason}）")
+        return model
@@ -0,0 +1,54 @@
+import re
+
+# 模型无法识别时常见的回复
+REFUSAL_PATTERN = re.compile(
+    r"I'?m sorry|I am sorry|I cannot|I can'?t|unable to (?:read|see|recogni[sz]e|transcribe)"
+    r"|too (?:blurry|small|low[- ]resolution)|not (?:legible|readable|clear enough)"
+    r"|抱歉|无法识别|无法辨认|看不清",
+    re.IGNORECASE
+)
+# 模型对看不清的字符给出的占位符
+PLACEHOLDER_PATTERN = re.compile(r'\\text\{\s*\?+\s*\}|\?\?\?|\ufffd')
+# 按图片估算字符数判断输出是否过短：估算不少于 MIN_CHARS_FOR_LENGTH_CHECK 个字符时，
+# 输出的非空白字符数不应少于估算值的 MIN_LENGTH_RATIO 倍
+MIN_CHARS_FOR_LENGTH_CHECK = 20
+MIN_LENGTH_RATIO = 0.3
+
+
+def unbalanced_braces(text):
+    """检查 {} 是否配对，忽略转义的 \\{ 和 \\}"""
+    depth = 0
+    for char in re.sub(r'\\[{}]', '', text):
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0:
+                return True
+    return depth != 0
+
+
+def check_output(raw_output, features=None):
+    """对识别结果做廉价的合理性检查，返回发现的问题列表，为空表示结果可信
+
+    Args:
+        raw_output: 模型返回的原始文本
+        features: image_features.extract_features 的返回值，为 None 时不检查长度
+    """
+    problems = []
+    text = raw_output.strip()
+    if not text:
+        return ['结果为空']
+    if REFUSAL_PATTERN.search(text):
+        problems.append('模型表示无法识别')
+    if PLACEHOLDER_PATTERN.search(text):
+        problems.append('包含无法识别的占位符')
+    if unbalanced_braces(text):
+        problems.append('花括号不配对')
+    if text.count('$$') % 2 or text.count('\\[') != text.count('\\]'):
+        problems.append('公式块未闭合')
+    if features and features['est_chars'] >= MIN_CHARS_FOR_LENGTH_CHECK:
+        length = len(re.sub(r'\s', '', text))
+        if length < features['est_chars'] * MIN_LENGTH_RATIO:
+            problems.append(f"结果过短（{length} 字符，估算约 {int(features['est_chars'])} 字符）")
+    return problems
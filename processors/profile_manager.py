@@ -0,0 +1,182 @@
+import json
+import threading
+from processors.image_to_markdown import ImageToMarkdown, DEFAULT_SYSTEM_PROMPT, DEFAULT_USER_PROMPT
+
+# 配置方案中可设置的字段及默认值，未设置 api_key/url/proxy 时沿用对应服务商的设置
+PROFILE_DEFAULTS = {
+    'provider': 'OPENAI',
+    'url': '',
+    'api_key': '',
+    'proxy': '',
+    'model': '',
+    'system_prompt': DEFAULT_SYSTEM_PROMPT,
+    'user_prompt': DEFAULT_USER_PROMPT,
+    'max_tokens': 1000,
+    'adaptive_max_tokens': False,
+    'progressive_resolution': False,
+    'cost_aware_resize': False,
+    'inline_wrapper': '$ $',
+    'block_wrapper': '$$ $$',
+    'preprocess': {},
+    'routing': {},
+    'backend': '',
+    'backend_options': {},
+    'translation': {},
+    'hotkey': '',
+}
+
+
+class ProfileManager:
+    """命名配置方案（服务商、模型、Prompt、包装符、预处理）的管理器
+
+    每个配置方案在加载时即创建好独立的识别管线（ImageToMarkdown 及其客户端）并预热连接，
+    切换配置方案只是改变当前使用的管线，不会重建客户端。
+    """
+
+    def __init__(self, log_callback=None):
+        self.log_callback = log_callback
+        self.profiles = {}   # 名称 -> 配置方案 dict
+        self.pipelines = {}  # 名称 -> ImageToMarkdown
+        self.signatures = {}  # 名称 -> 构建管线时使用的完整配置，用于判断是否需要重建
+        self.active = None
+        self.shared_history = None
+        self.shared_memory_monitor = None
+        self.shared_trace = None
+        self.shared_encode_pool = None
+        self.shared_result_cache = None
+        self.shared_scheduler = None
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def share_from(self, processor):
+        """让所有管线共用主处理器的历史记录、录制、编码进程池、结果缓存、请求调度器和内存统计"""
+        self.shared_history = processor.history
+        self.shared_trace = processor.trace
+        self.shared_encode_pool = processor.encode_pool
+        self.shared_result_cache = processor.result_cache
+        self.shared_scheduler = processor.scheduler
+        self.shared_memory_monitor = processor.memory_monitor
+        with self.lock:
+            pipelines = list(self.pipelines.values())
+        for pipeline in pipelines:
+            self.share_into(pipeline)
+
+    def share_into(self, pipeline):
+        pipeline.history = self.shared_history
+        pipeline.trace = self.shared_trace
+        pipeline.encode_pool = self.shared_encode_pool
+        pipeline.result_cache = self.shared_result_cache
+        pipeline.scheduler = self.shared_scheduler
+        if self.shared_memory_monitor:
+            pipeline.set_memory_monitor(self.shared_memory_monitor)
+
+    def resolve(self, profile, provider_settings):
+        """补全配置方案中未设置的字段"""
+        resolved = dict(PROFILE_DEFAULTS)
+        resolved.update(profile)
+        inherited = provider_settings.get(resolved['provider'], {})
+        for key in ('api_key', 'url', 'proxy', 'model'):
+            if not resolved[key]:
+                resolved[key] = inherited.get(key, '')
+        return resolved
+
+    def build(self, name, profile):
+        """根据补全后的配置方案创建识别管线"""
+        pipeline = ImageToMarkdown(log_callback=self.log_callback)
+        pipeline.apply_config({
+            'current_provider': profile['provider'],
+            'provider_settings': {
+                profile['provider']: {
+                    'url': profile['url'],
+                    'api_key': profile['api_key'],
+                    'proxy': profile['proxy'],
+                    'model': profile['model'],
+                    'routing': profile['routing'],
+                    'backend': profile['backend'],
+                    'backend_options': profile['backend_options'],
+                    'translation': profile['translation'],
+                    'prompt_settings': {
+                        'system_prompt': profile['system_prompt'],
+                        'user_prompt': profile['user_prompt'],
+                        'max_tokens': profile['max_tokens'],
+                        'adaptive_max_tokens': profile['adaptive_max_tokens'],
+                        'progressive_resolution': profile['progressive_resolution'],
+                        'cost_aware_resize': profile['cost_aware_resize'],
+                    },
+                },
+            },
+            'latex_settings': {
+                'inline_wrapper': profile['inline_wrapper'],
+                'block_wrapper': profile['block_wrapper'],
+            },
+        })
+        pipeline.set_preprocess(profile['preprocess'])
+        self.share_into(pipeline)
+        return pipeline
+
+    def load(self, config):
+        """从配置加载所有配置方案，未变化的管线保持不变，新建的管线在后台预热"""
+        profiles = config.get('profiles', {}) or {}
+        provider_settings = config.get('provider_settings', {}) or {}
+        built = []
+        with self.lock:
+            for name in list(self.pipelines):
+                if name not in profiles:
+                    self.close_pipeline(self.pipelines.pop(name))
+                    self.signatures.pop(name, None)
+            for name, profile in profiles.items():
+                resolved = self.resolve(profile, provider_settings)
+                signature = json.dumps(resolved, sort_keys=True, ensure_ascii=False)
+                if self.signatures.get(name) == signature:
+                    continue
+                old = self.pipelines.get(name)
+                self.pipelines[name] = self.build(name, resolved)
+                self.signatures[name] = signature
+                built.append(self.pipelines[name])
+                if old:
+                    self.close_pipeline(old)
+            self.profiles = {name: dict(profile) for name, profile in profiles.items()}
+            if self.active not in self.pipelines:
+                self.active = None
+        for pipeline in built:
+            threading.Thread(target=pipeline.backend.warm_up, daemon=True).start()
+
+    @staticmethod
+    def close_pipeline(pipeline):
+        pipeline.set_backend('')
+        pipeline.set_translator(None)
+        if pipeline.client:
+            try:
+                pipeline.client.close()
+            except Exception:
+                pass
+
+    def names(self):
+        return list(self.profiles)
+
+    def hotkeys(self):
+        """返回 {名称: 热键}，仅包含设置了热键的配置方案"""
+        return {name: p.get('hotkey', '') for name, p in self.profiles.items() if p.get('hotkey')}
+
+    def activate(self, name):
+        """切换当前配置方案，name 为 None 或空时使用默认设置"""
+        if name and name not in self.pipelines:
+            self.log(f"配置方案不存在: {name}")
+            return False
+        self.active = name or None
+        return True
+
+    def active_pipeline(self):
+        if not self.active:
+            return None
+        return self.pipelines.get(self.active)
+
+    def set_profile(self, name, profile):
+        """新增或覆盖一个配置方案（需再次调用 load 才会生效）"""
+        self.profiles[name] = dict(profile)
+
+    def remove_profile(self, name):
+        self.profiles.pop(name, None)
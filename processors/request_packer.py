@@ -0,0 +1,118 @@
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 合并请求时要求模型在每张图片的结果前输出的分隔行
+PACK_INSTRUCTION = (
+    "There are several images below, each preceded by its marker line. "
+    "Convert each image separately. Before the content of image k, output a line "
+    "containing only <<<IMAGE k>>>, and output nothing else between the images."
+)
+PACK_MARKER = "<<<IMAGE {index}>>>"
+PACK_MARKER_PATTERN = re.compile(r'^[ \t]*<<<IMAGE (\d+)>>>[ \t]*$', re.MULTILINE)
+
+
+def split_packed_output(raw_output, count):
+    """按分隔行拆分合并请求的输出，分隔行缺失、重复或顺序不对时返回 None"""
+    raw_output = re.sub(r'^\s*```markdown\s*\n(.*?)\n```\s*$', r'\1', raw_output, flags=re.DOTALL)
+    parts = PACK_MARKER_PATTERN.split(raw_output)
+    if parts[0].strip():
+        return None
+    indexes = parts[1::2]
+    if indexes != [str(index) for index in range(1, count + 1)]:
+        return None
+    return [text.strip() for text in parts[2::2]]
+
+
+class RequestPacker:
+    """把短时间内同时提交的多张图片合并为一次多图请求
+
+    提交的线程会阻塞到对应图片的结果返回；后台线程在 window 秒内凑齐最多 max_images 张图片，
+    交给线程池中的 ImageToMarkdown.recognize_many 识别，之前的合并请求返回前可以继续凑下一批。
+    """
+
+    def __init__(self, processor, max_images=4, window=0.2, max_workers=4):
+        """
+        Args:
+            processor: ImageToMarkdown 实例
+            max_images: 每次请求最多合并的图片数
+            window: 收到第一张图片后等待其他图片的最长时间（秒）
+            max_workers: 同时进行的合并请求数上限
+        """
+        self.processor = processor
+        self.max_images = max_images
+        self.window = window
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='packer')
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image, source='api'):
+        """提交一张图片并等待识别结果（与 recognize 的返回值相同）
+
+        停止后（如关闭合并请求时仍持有旧的 packer）不再排队，直接单独识别。
+        """
+        item = {'image': image, 'source': source, 'done': threading.Event(), 'result': None, 'error': None}
+        with self.lock:
+            queued = not self.stopped
+            if queued:
+                self.pending.put(item)
+        if not queued:
+            return self.processor.recognize(image, source)
+        item['done'].wait()
+        if item['error'] is not None:
+            raise item['error']
+        return item['result']
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_images:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.pool.submit(self._recognize, batch)
+            if stop:
+                break
+        self.pool.shutdown(wait=False)
+
+    def _recognize(self, batch):
+        try:
+            results = self.processor.recognize_many(
+                [i['image'] for i in batch],
+                [i['source'] for i in batch],
+                pack_size=self.max_images
+            )
+            for i, result in zip(batch, results):
+                i['result'] = result
+        except Exception as e:
+            for i in batch:
+                i['error'] = e
+        for i in batch:
+            i['done'].set()
+
+    def stop(self):
+        """停止接收新图片；已提交的图片仍会识别完成，之后提交的图片直接单独识别"""
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            # 标记和结束信号在同一把锁内写入，结束信号之后不会再有排队的图片
+            self.pending.put(None)
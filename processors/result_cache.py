@@ -0,0 +1,168 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+import httpx
+
+# 查询团队缓存的超时（秒），超时后直接请求服务商
+DEFAULT_TIMEOUT = 0.3
+# 团队缓存不可用后暂停查询的秒数，避免每次识别都等待超时
+BACKOFF_SECONDS = 60
+# 本地缓存保留的结果数
+LOCAL_CACHE_SIZE = 256
+# 等待上传的结果数上限，超出时丢弃
+MAX_PENDING_PUBLISH = 64
+# 关闭时等待剩余结果上传完成的最长秒数
+CLOSE_TIMEOUT = 3
+
+
+def cache_key(fingerprint, endpoint, model, prompt_hash, settings_hash):
+    """图片指纹、服务商地址、模型、Prompt 和影响实际发送图片的设置共同决定识别结果"""
+    return hashlib.sha256(
+        f"{fingerprint}\n{endpoint}\n{model}\n{prompt_hash}\n{settings_hash}".encode('utf-8')
+    ).hexdigest()
+
+
+def prompt_hash(system_prompt, user_prompt):
+    return hashlib.sha256(f"{system_prompt}\0{user_prompt}".encode('utf-8')).hexdigest()
+
+
+def settings_hash(settings):
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """识别结果缓存：进程内的本地缓存，之后是可选的团队共享缓存服务（utils/cache_server.py）
+
+    缓存未经后处理的模型输出，公式包装符等仍按本机设置处理。查询团队缓存使用很短的超时，
+    失败后暂停查询一段时间；识别结果在后台线程中上传，不阻塞识别。只发送缓存键（哈希）和文本，不上传图片。
+    """
+
+    def __init__(self, url='', token='', timeout=DEFAULT_TIMEOUT, publish=True, log_callback=None):
+        """
+        Args:
+            url: 团队缓存服务地址，如 http://cache.example.com:8790，为空时只使用本地缓存
+            token: 团队缓存服务的访问令牌
+            timeout: 查询团队缓存的超时（秒）
+            publish: 是否把本机的识别结果上传到团队缓存
+            log_callback: 日志回调
+        """
+        self.url = url.rstrip('/')
+        self.publish_enabled = publish
+        self.log_callback = log_callback
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'remote_hits': 0, 'misses': 0, 'published': 0, 'errors': 0}
+        self.disabled_until = 0
+        self.client = None
+        self.pending = None
+        self.thread = None
+        if self.url:
+            headers = {'Authorization': f"Bearer {token}"} if token else {}
+            self.client = httpx.Client(base_url=self.url, headers=headers, timeout=timeout, trust_env=False)
+            self.pending = queue.Queue(maxsize=MAX_PENDING_PUBLISH)
+            self.thread = threading.Thread(target=self._publish_loop, daemon=True)
+            self.thread.start()
+
+    @classmethod
+    def from_config(cls, settings, log_callback=None):
+        """根据配置中的 result_cache 设置创建缓存，未启用时返回 None"""
+        if not settings or not settings.get('enabled'):
+            return None
+        return cls(
+            url=settings.get('url', ''),
+            token=settings.get('token', ''),
+            timeout=float(settings.get('timeout', DEFAULT_TIMEOUT)),
+            publish=settings.get('publish', True),
+            log_callback=log_callback
+        )
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def remote_available(self):
+        return self.client is not None and time.monotonic() >= self.disabled_until
+
+    def remote_failed(self, error):
+        self.stats['errors'] += 1
+        if time.monotonic() >= self.disabled_until:
+            self.log(f"团队缓存暂时不可用，{BACKOFF_SECONDS} 秒内不再查询: {error}")
+        self.disabled_until = time.monotonic() + BACKOFF_SECONDS
+
+    def get(self, key):
+        """返回 (缓存的模型输出, 'local' 或 'remote')，未命中时返回 (None, None)"""
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                self.local.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return entry['raw'], 'local'
+        if self.remote_available():
+            try:
+                response = self.client.get(f"/v1/cache/{key}")
+                if response.status_code == 200:
+                    entry = response.json()
+                    self.store_local(key, entry)
+                    self.stats['remote_hits'] += 1
+                    return entry['raw'], 'remote'
+                if response.status_code != 404:
+                    self.remote_failed(f"HTTP {response.status_code}")
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                self.remote_failed(e)
+        self.stats['misses'] += 1
+        return None, None
+
+    def store_local(self, key, entry):
+        with self.lock:
+            self.local[key] = entry
+            self.local.move_to_end(key)
+            while len(self.local) > LOCAL_CACHE_SIZE:
+                self.local.popitem(last=False)
+
+    def put(self, key, raw, provider, model):
+        """保存识别结果，开启上传时在后台上传到团队缓存"""
+        entry = {'raw': raw, 'provider': provider, 'model': model}
+        self.store_local(key, entry)
+        if self.pending is not None and self.publish_enabled:
+            try:
+                self.pending.put_nowait((key, entry))
+            except queue.Full:
+                pass
+
+    def _publish_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            key, entry = item
+            if not self.remote_available():
+                continue
+            try:
+                response = self.client.put(f"/v1/cache/{key}", json=entry)
+                if response.status_code == 200:
+                    self.stats['published'] += 1
+                else:
+                    self.remote_failed(f"HTTP {response.status_code}")
+            except (httpx.HTTPError, RuntimeError) as e:
+                # RuntimeError: 关闭时连接已被关闭
+                self.remote_failed(e)
+
+    def summary(self):
+        return dict(self.stats, remote=self.url or None, local_entries=len(self.local))
+
+    def close(self):
+        """上传剩余的结果（最多等待 CLOSE_TIMEOUT 秒）后停止上传线程并关闭连接"""
+        if self.pending is not None:
+            deadline = time.monotonic() + CLOSE_TIMEOUT
+            try:
+                self.pending.put(None, timeout=CLOSE_TIMEOUT)
+            except queue.Full:
+                pass
+            self.thread.join(timeout=max(0, deadline - time.monotonic()))
+            if self.thread.is_alive():
+                self.log("团队缓存上传超时，剩余的结果未上传")
+        if self.client is not None:
+            self.client.close()
@@ -0,0 +1,194 @@
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from processors.shadow_eval import percentile
+
+# 任务类别，数字越小越优先
+PRIORITIES = {'interactive': 0, 'api': 1, 'background': 2}
+CLASS_NAMES = {'interactive': '交互截图', 'api': '识别接口', 'background': '后台任务'}
+# 识别来源对应的任务类别，未列出的来源按后台任务处理
+SOURCE_CLASSES = {
+    'clipboard': 'interactive',
+    'region': 'interactive',
+    'replay': 'interactive',
+    'api': 'api',
+    'folder': 'background',
+    'shadow': 'background',
+}
+# 每类任务同时进行的请求数上限
+DEFAULT_CAPS = {'interactive': 2, 'api': 2, 'background': 1}
+# 令牌桶最多积攒的秒数，限速后允许的突发请求数为 rate_limit / 60 * BURST_SECONDS
+BURST_SECONDS = 5
+# 排队超过该秒数时记录日志
+LONG_WAIT_SECONDS = 5
+# 每类保留的最近排队耗时数，用于计算 p95
+RECENT_WAITS = 200
+
+
+def job_class(source):
+    """识别来源对应的任务类别；合并请求传入来源列表时取其中最优先的类别"""
+    if isinstance(source, (list, tuple)):
+        return min((job_class(s) for s in source), key=PRIORITIES.get, default='background')
+    return SOURCE_CLASSES.get(source, 'background')
+
+
+class RequestScheduler:
+    """请求调度：交互截图、识别接口和后台任务（监视文件夹、影子评估）按优先级共用服务商的请求额度
+
+    每类任务有各自的并发上限，所有类别共用一个按每分钟请求数限速的令牌桶。
+    有空闲额度时总是先放行排队中优先级最高的任务，交互截图到达时排在已排队的后台任务之前；
+    已经发出的请求不会被中断。
+    """
+
+    def __init__(self, caps=None, rate_limit=0, log_callback=None):
+        """
+        Args:
+            caps: {类别: 同时进行的请求数上限}，未设置的类别使用 DEFAULT_CAPS
+            rate_limit: 所有类别合计每分钟最多发出的请求数，0 为不限
+            log_callback: 日志回调
+        """
+        self.caps = dict(DEFAULT_CAPS)
+        self.caps.update({k: max(1, int(v)) for k, v in (caps or {}).items() if k in PRIORITIES})
+        self.rate_limit = max(0, int(rate_limit or 0))
+        self.capacity = max(1.0, self.rate_limit / 60 * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+        self.log_callback = log_callback
+        self.condition = threading.Condition()
+        self.waiting = []  # 排队中的 (优先级, 序号, 类别)
+        self.sequence = itertools.count()
+        self.running = {name: 0 for name in PRIORITIES}
+        self.stats = {name: {'requests': 0, 'waited': 0, 'wait_ms': 0.0, 'max_wait_ms': 0.0}
+                      for name in PRIORITIES}
+        self.recent = {name: deque(maxlen=RECENT_WAITS) for name in PRIORITIES}
+        self.throttled = 0
+
+    @classmethod
+    def from_config(cls, settings, log_callback=None):
+        """根据配置中的 scheduler 设置创建调度器，未启用时返回 None"""
+        if not settings or not settings.get('enabled'):
+            return None
+        return cls(
+            caps=settings.get('caps', {}),
+            rate_limit=settings.get('rate_limit', 0),
+            log_callback=log_callback
+        )
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def refill(self, now):
+        if self.rate_limit:
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate_limit / 60)
+        self.refilled_at = now
+
+    def next_waiter(self):
+        """排队中所属类别还有并发额度、优先级最高的任务"""
+        eligible = [entry for entry in self.waiting if self.running[entry[2]] < self.caps[entry[2]]]
+        return min(eligible, default=None)
+
+    def acquire(self, source):
+        """等待轮到该来源的请求，返回 release 时使用的类别"""
+        name = job_class(source)
+        entry = (PRIORITIES[name], next(self.sequence), name)
+        queued_at = time.monotonic()
+        with self.condition:
+            self.waiting.append(entry)
+            limited = False
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                timeout = None
+                if self.next_waiter() is entry:
+                    if not self.rate_limit or self.tokens >= 1:
+                        break
+                    timeout = (1 - self.tokens) * 60 / self.rate_limit
+                    limited = True
+                self.condition.wait(timeout)
+            self.waiting.remove(entry)
+            if self.rate_limit:
+                self.tokens -= 1
+            if limited:
+                self.throttled += 1
+            self.running[name] += 1
+            wait_ms = (time.monotonic() - queued_at) * 1000
+            stats = self.stats[name]
+            stats['requests'] += 1
+            stats['wait_ms'] += wait_ms
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+            if wait_ms >= 1:
+                stats['waited'] += 1
+            self.recent[name].append(wait_ms)
+            # 其他类别的任务可能因此成为队首
+            self.condition.notify_all()
+        if wait_ms >= LONG_WAIT_SECONDS * 1000:
+            self.log(f"{CLASS_NAMES[name]}排队等待了 {wait_ms / 1000:.1f} 秒")
+        return name
+
+    def throttle(self):
+        """已占用额度的任务再次请求服务商（续写、用原图重试）前调用，按限速额外消耗一个令牌"""
+        if not self.rate_limit:
+            return
+        with self.condition:
+            limited = False
+            while True:
+                self.refill(time.monotonic())
+                if self.tokens >= 1:
+                    break
+                limited = True
+                self.condition.wait((1 - self.tokens) * 60 / self.rate_limit)
+            self.tokens -= 1
+            if limited:
+                self.throttled += 1
+
+    def release(self, name):
+        with self.condition:
+            self.running[name] -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, source):
+        """在 with 块内占用一个请求额度"""
+        name = self.acquire(source)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def summary(self):
+        """每类任务的排队和并发情况，排队耗时单位为毫秒"""
+        with self.condition:
+            queued = {name: 0 for name in PRIORITIES}
+            for _, _, name in self.waiting:
+                queued[name] += 1
+            classes = {}
+            for name, stats in self.stats.items():
+                p95 = percentile(list(self.recent[name]), 0.95)
+                classes[name] = {
+                    'running': self.running[name],
+                    'queued': queued[name],
+                    'cap': self.caps[name],
+                    'requests': stats['requests'],
+                    'waited': stats['waited'],
+                    'mean_wait_ms': round(stats['wait_ms'] / stats['requests'], 1) if stats['requests'] else None,
+                    'p95_wait_ms': round(p95, 1) if p95 is not None else None,
+                    'max_wait_ms': round(stats['max_wait_ms'], 1),
+                }
+        return {'rate_limit': self.rate_limit or None, 'throttled': self.throttled, 'classes': classes}
+
+
+def format_summary(summary):
+    """把 RequestScheduler.summary 的结果格式化为文本行"""
+    limit = f"每分钟 {summary['rate_limit']} 次" if summary['rate_limit'] else '不限速'
+    lines = [f"请求调度: {limit}，因限速等待 {summary['throttled']} 次"]
+    for name, entry in summary['classes'].items():
+        mean = f"{entry['mean_wait_ms']} ms" if entry['mean_wait_ms'] is not None else '-'
+        p95 = f"{entry['p95_wait_ms']} ms" if entry['p95_wait_ms'] is not None else '-'
+        lines.append(
+            f"[{CLASS_NAMES[name]}] 并发 {entry['running']}/{entry['cap']}，排队 {entry['queued']}，"
+            f"已放行 {entry['requests']} 次，平均等待 {mean}，p95 等待 {p95}"
+        )
+    return lines
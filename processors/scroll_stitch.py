@@ -0,0 +1,226 @@
+import difflib
+import threading
+import time
+import zlib
+from processors.image_features import background_level
+
+# 与背景灰度相差超过该值的像素视为内容，行签名只覆盖两端内容之间的部分
+CONTENT_THRESHOLD = 32
+# 判定为连续截图所需的最少匹配内容行数（约两行文字）
+MIN_MATCHED_ROWS = 16
+# 重叠区域中签名一致的行所占的最低比例
+MIN_MATCH_RATIO = 0.95
+# 新增部分少于该行数时视为没有新内容
+MIN_STRIP_ROWS = 8
+# 与上一张截图间隔超过该秒数时不再拼接
+SEQUENCE_TIMEOUT = 600
+# 合并 Markdown 时检查接缝处重复的最多行数
+SEAM_LINES = 3
+# 用于对齐的锚点行数，和每个锚点最多检查的候选位置数
+ANCHOR_ROWS = 8
+MAX_CANDIDATES = 16
+
+
+def row_signatures(image):
+    """计算每行的签名：只对该行两端内容之间的像素求 CRC32，左右截取范围略有不同时签名不变
+
+    Returns:
+        (签名列表, 每行第一个内容像素的横坐标)，没有内容的空白行签名和横坐标为 None
+    """
+    gray = image.convert('L')
+    background = background_level(gray.histogram())
+    width = gray.width
+    data = gray.tobytes()
+    # 内容像素掩码：按行查找首尾内容像素
+    mask = bytes(255 if abs(v - background) > CONTENT_THRESHOLD else 0 for v in range(256))
+    marked = data.translate(mask)
+    signatures, lefts = [], []
+    for y in range(gray.height):
+        start = y * width
+        row = marked[start:start + width]
+        left = row.find(b'\xff')
+        if left < 0:
+            signatures.append(None)
+            lefts.append(None)
+            continue
+        right = row.rfind(b'\xff') + 1
+        signatures.append(zlib.crc32(data[start + left:start + right]) ^ (right - left) << 32)
+        lefts.append(left)
+    gray.close()
+    return signatures, lefts
+
+
+def find_overlap(previous, current, previous_lefts=None, current_lefts=None):
+    """查找 current 顶部与 previous 的对齐位置（current 是向下滚动后的截图）
+
+    Args:
+        previous, current: row_signatures 得到的签名列表
+        previous_lefts, current_lefts: 每行第一个内容像素的横坐标，用于确认所有匹配行的水平偏移一致
+
+    Returns:
+        重叠的行数（current 的前若干行已经包含在 previous 中），没有可靠的重叠时返回 0
+    """
+    index = {}
+    for y, signature in enumerate(previous):
+        if signature is not None:
+            index.setdefault(signature, []).append(y)
+    offsets = set()
+    anchors = [y for y, signature in enumerate(current) if signature is not None][:ANCHOR_ROWS]
+    for y in anchors:
+        for position in index.get(current[y], [])[:MAX_CANDIDATES]:
+            if position >= y:
+                offsets.add(position - y)
+    best, best_matched = 0, 0
+    for offset in offsets:
+        overlap = len(previous) - offset
+        if overlap >= len(current):
+            continue
+        matched = compared = 0
+        shifts = set()
+        for y in range(overlap):
+            a, b = previous[offset + y], current[y]
+            if a is None and b is None:
+                continue
+            compared += 1
+            if a == b:
+                matched += 1
+                if previous_lefts and current_lefts:
+                    shifts.add(current_lefts[y] - previous_lefts[offset + y])
+        if matched < MIN_MATCHED_ROWS or matched < compared * MIN_MATCH_RATIO or len(shifts) > 1:
+            continue
+        if matched > best_matched:
+            best, best_matched = overlap, matched
+    return best
+
+
+def seam_cut(signatures, overlap):
+    """把切分位置上移到重叠边界所在文本行之前的空白行，被上一张截图截断的那一行完整地重新识别"""
+    cut = overlap
+    while cut > 0 and signatures[cut - 1] is not None:
+        cut -= 1
+    return cut
+
+
+def normalize_line(line):
+    return ''.join(line.split())
+
+
+def merge_markdown(previous, addition):
+    """把新增部分的识别结果追加到之前的结果后，去掉接缝处重复的行
+
+    Returns:
+        (合并后的结果, 去重后新增的部分)
+    """
+    previous_lines = previous.rstrip('\n').split('\n')
+    addition_lines = addition.strip('\n').split('\n')
+    # 新增部分开头与之前结尾完全相同的行
+    tail = [normalize_line(line) for line in previous_lines if line.strip()][-SEAM_LINES:]
+    for size in range(min(len(tail), len(addition_lines)), 0, -1):
+        if tail[-size:] == [normalize_line(line) for line in addition_lines[:size]]:
+            addition_lines = addition_lines[size:]
+            break
+    else:
+        # 上一张截图底部被截断的行通常只识别出开头一部分，用完整识别的版本替换；
+        # 只比较等长的开头，避免把内容相近的相邻两行（如连续的公式）误当成重复
+        last = normalize_line(previous_lines[-1]) if previous_lines else ''
+        first = normalize_line(addition_lines[0]) if addition_lines else ''
+        if last and first and len(last) < len(first) \
+                and difflib.SequenceMatcher(None, last, first[:len(last)]).ratio() >= 0.8:
+            previous_lines = previous_lines[:-1]
+    addition = '\n'.join(addition_lines).strip('\n')
+    merged = '\n'.join(previous_lines).rstrip('\n')
+    if addition:
+        merged = f"{merged}\n{addition}" if merged else addition
+    return merged, addition
+
+
+class StitchPlan:
+    """一次截图的拼接计划"""
+
+    def __init__(self, signatures, lefts, strip=None, cut=0, empty=False):
+        self.signatures = signatures
+        self.lefts = lefts
+        self.strip = strip  # 只需识别的新增部分，为 None 时识别整张截图
+        self.cut = cut
+        self.empty = empty  # 与上一张截图相比没有新内容
+
+
+class ScrollStitcher:
+    """连续截图拼接：阅读长文档时逐段截取相互重叠的区域，只识别与上一张截图不重叠的部分
+
+    每行按内容像素计算签名，用签名对齐上一张截图的底部和当前截图的顶部，
+    对齐成功时只发送下方新增的部分，识别结果追加到之前的结果后并去掉接缝处的重复行。
+    只保留上一张截图的行签名和累计的识别结果，不保留图片。
+    """
+
+    def __init__(self, timeout=SEQUENCE_TIMEOUT, log_callback=None):
+        self.timeout = timeout
+        self.log_callback = log_callback
+        self.lock = threading.Lock()
+        self.previous = None  # {'signatures', 'lefts', 'markdown', 'time'}
+        self.stats = {'captures': 0, 'stitched': 0, 'rows_total': 0, 'rows_sent': 0}
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def plan(self, image):
+        """计算当前截图需要识别的部分"""
+        signatures, lefts = row_signatures(image)
+        plan = StitchPlan(signatures, lefts)
+        with self.lock:
+            previous = self.previous
+            if previous and time.time() - previous['time'] > self.timeout:
+                previous = self.previous = None
+        overlap = 0
+        if previous is not None:
+            overlap = find_overlap(previous['signatures'], signatures, previous['lefts'], lefts)
+        if overlap:
+            plan.cut = seam_cut(signatures, overlap)
+            if len(signatures) - overlap < MIN_STRIP_ROWS \
+                    or all(signature is None for signature in signatures[overlap:]):
+                plan.empty = True
+            else:
+                # 重叠区域中没有空白行（如密集的段落、公式块）时直接在重叠边界切分，
+                # 接缝处被截断的行由 merge_markdown 合并，不能发送整张截图后覆盖之前的结果
+                plan.cut = plan.cut or overlap
+                plan.strip = image.crop((0, plan.cut, image.width, image.height))
+                self.log(f"与上一张截图重叠 {overlap} 行，只识别新增的 {image.height - plan.cut} 行")
+        self.stats['captures'] += 1
+        self.stats['rows_total'] += image.height
+        if not plan.empty:
+            self.stats['rows_sent'] += image.height - plan.cut
+        return plan
+
+    def commit(self, plan, markdown):
+        """记录本次识别结果，返回 (复制到剪贴板的结果, 新增的部分)"""
+        with self.lock:
+            addition = markdown
+            if plan.strip is not None and self.previous is not None:
+                markdown, addition = merge_markdown(self.previous['markdown'], markdown)
+                self.stats['stitched'] += 1
+            self.previous = {
+                'signatures': plan.signatures,
+                'lefts': plan.lefts,
+                'markdown': markdown,
+                'time': time.time(),
+            }
+        if plan.strip is not None:
+            plan.strip.close()
+        return markdown, addition
+
+    def touch(self, plan):
+        """没有新内容的截图：更新对齐用的签名，累计结果不变"""
+        with self.lock:
+            if self.previous is not None:
+                self.previous.update(signatures=plan.signatures, lefts=plan.lefts, time=time.time())
+
+    def reset(self):
+        with self.lock:
+            self.previous = None
+
+    def summary(self):
+        stats = dict(self.stats)
+        if stats['rows_total']:
+            stats['sent_ratio'] = round(stats['rows_sent'] / stats['rows_total'], 3)
+        return stats
@@ -0,0 +1,300 @@
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from utils.path_tools import get_app_data_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow (
+    id                          INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at                  REAL NOT NULL,
+    source                      TEXT,
+    primary_provider            TEXT,
+    primary_model               TEXT,
+    primary_markdown            TEXT,
+    primary_ms                  REAL,
+    primary_prompt_tokens       INTEGER,
+    primary_completion_tokens   INTEGER,
+    candidate_provider          TEXT,
+    candidate_model             TEXT,
+    candidate_markdown          TEXT,
+    candidate_ms                REAL,
+    candidate_prompt_tokens     INTEGER,
+    candidate_completion_tokens INTEGER,
+    candidate_error             TEXT,
+    similarity                  REAL,
+    normalized_equal            INTEGER
+);
+"""
+# 比较前去掉的 LaTeX 排版命令，不影响公式含义
+LATEX_NOISE = re.compile(r'\\(?:left|right|displaystyle|textstyle|big|Big|bigg|Bigg)(?![a-zA-Z])|\\[,;:!]|\\quad|\\qquad')
+# 超过该长度的结果只比较开头部分，避免编辑距离计算过慢
+MAX_COMPARE_CHARS = 4000
+
+
+def normalize_latex(markdown):
+    """统一公式包装符和空白、去掉不影响含义的排版命令，用于判断两个结果是否等价"""
+    text = re.sub(r'^\s*```markdown\s*\n(.*?)\n```\s*$', r'\1', markdown or '', flags=re.DOTALL)
+    text = re.sub(r'\\\[(.*?)\\\]', r'$$\1$$', text, flags=re.DOTALL)
+    text = re.sub(r'\\\((.*?)\\\)', r'$\1$', text, flags=re.DOTALL)
+    text = LATEX_NOISE.sub('', text)
+    # \frac12 与 \frac{1}{2} 等只差花括号的写法视为相同
+    text = re.sub(r'[{}]', '', text)
+    return re.sub(r'\s+', '', text)
+
+
+def edit_distance(a, b):
+    """Levenshtein 编辑距离"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b):
+    """1 - 编辑距离 / 较长文本的长度，两个空结果视为完全相同"""
+    a, b = a[:MAX_COMPARE_CHARS], b[:MAX_COMPARE_CHARS]
+    if not a and not b:
+        return 1.0
+    return 1 - edit_distance(a, b) / max(len(a), len(b))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ShadowEvaluator:
+    """影子评估：按比例把截图同时交给候选配置方案识别，比较两者的结果、耗时和 token 用量
+
+    候选结果只写入评估数据库（应用数据目录下的 shadow.db），不会复制到剪贴板，
+    也不写入识别历史。候选识别在单个后台线程中进行，队列已满时跳过，不影响正常识别。
+    """
+
+    def __init__(self, candidate, candidate_name, fraction=0.1, db_path=None, log_callback=None, max_pending=4):
+        """
+        Args:
+            candidate: 候选配置方案的识别管线（ImageToMarkdown）
+            candidate_name: 候选配置方案名称，仅用于日志
+            fraction: 参与评估的截图比例（0-1）
+            db_path: 评估数据库路径，默认为应用数据目录下的 shadow.db
+            log_callback: 日志回调
+            max_pending: 等待候选识别的截图数上限
+        """
+        self.candidate = candidate
+        self.candidate_name = candidate_name
+        self.fraction = max(0.0, min(1.0, float(fraction)))
+        self.db_path = db_path or os.path.join(get_app_data_dir(), 'shadow.db')
+        self.log_callback = log_callback
+        self.stats = {'sampled': 0, 'skipped': 0, 'compared': 0, 'failed': 0}
+        self.pending = queue.Queue(maxsize=max(1, max_pending))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def offer(self, image, result, source):
+        """主识别完成后调用，按比例抽样提交给候选配置方案"""
+        if random.random() >= self.fraction:
+            return
+        copy = image.copy()
+        try:
+            self.pending.put_nowait((copy, result, source))
+            self.stats['sampled'] += 1
+        except queue.Full:
+            copy.close()
+            self.stats['skipped'] += 1
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            image, primary, source = item
+            candidate, error = None, None
+            try:
+                candidate = self.candidate.recognize(image, source='shadow')
+            except Exception as e:
+                error = str(e)
+            finally:
+                image.close()
+            try:
+                self.store(primary, candidate, error, source)
+            except sqlite3.Error as e:
+                self.log(f"写入影子评估结果失败: {e}")
+
+    def store(self, primary, candidate, error, source):
+        row = {
+            'created_at': time.time(),
+            'source': source,
+            'primary_provider': primary.get('provider'),
+            'primary_model': primary.get('model'),
+            'primary_markdown': primary.get('markdown'),
+            'primary_ms': primary.get('total_ms'),
+            'primary_prompt_tokens': primary.get('prompt_tokens'),
+            'primary_completion_tokens': primary.get('completion_tokens'),
+            'candidate_error': error,
+        }
+        if candidate is not None:
+            row.update({
+                'candidate_provider': candidate.get('provider'),
+                'candidate_model': candidate.get('model'),
+                'candidate_markdown': candidate.get('markdown'),
+                'candidate_ms': candidate.get('total_ms'),
+                'candidate_prompt_tokens': candidate.get('prompt_tokens'),
+                'candidate_completion_tokens': candidate.get('completion_tokens'),
+            })
+            a, b = normalize_latex(primary.get('raw') or ''), normalize_latex(candidate.get('raw') or '')
+            row['normalized_equal'] = int(a == b)
+            row['similarity'] = similarity(a, b)
+            self.stats['compared'] += 1
+        else:
+            self.stats['failed'] += 1
+            self.log(f"影子评估（{self.candidate_name}）识别失败: {error}")
+        columns = list(row)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO shadow ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [row[c] for c in columns]
+            )
+
+    def report(self, prices=None, since=None):
+        return shadow_report(self.conn, prices, since, self.lock)
+
+    def stop(self):
+        """丢弃尚未识别的截图，关闭数据库和候选管线的客户端"""
+        while True:
+            try:
+                image, _, _ = self.pending.get_nowait()
+                image.close()
+            except queue.Empty:
+                break
+        self.pending.put(None)
+        self.thread.join(timeout=1)
+        with self.lock:
+            self.conn.close()
+        if self.candidate.client:
+            try:
+                self.candidate.client.close()
+            except Exception:
+                pass
+
+
+def shadow_report(conn, prices=None, since=None, lock=None):
+    """汇总影子评估结果，每个模型一行
+
+    Args:
+        conn: 评估数据库连接
+        prices: {模型: [每百万输入 token 价格, 每百万输出 token 价格]}，未设置价格的模型只统计 token
+        since: 只统计该时间戳之后的结果
+
+    Returns:
+        [{'role', 'model', 'images', 'agreement', 'similarity', 'p95_ms', 'tokens_per_1k', 'cost_per_1k'}, ...]
+        agreement 为与另一方 LaTeX 规范化后完全相同的比例，similarity 为平均编辑相似度
+    """
+    prices = prices or {}
+    query = "SELECT * FROM shadow WHERE candidate_error IS NULL AND created_at >= ?"
+    if lock:
+        with lock:
+            rows = [dict(r) for r in conn.execute(query, (since or 0,)).fetchall()]
+    else:
+        rows = [dict(r) for r in conn.execute(query, (since or 0,)).fetchall()]
+    groups = {}
+    for row in rows:
+        for role in ('primary', 'candidate'):
+            key = (role, row[f'{role}_provider'], row[f'{role}_model'])
+            groups.setdefault(key, []).append(row)
+    report = []
+    for (role, provider, model), items in groups.items():
+        prompt = [r[f'{role}_prompt_tokens'] or 0 for r in items]
+        completion = [r[f'{role}_completion_tokens'] or 0 for r in items]
+        price = prices.get(model)
+        cost = None
+        if price:
+            cost = round(sum(p * price[0] + c * price[1] for p, c in zip(prompt, completion))
+                         / 1e6 / len(items) * 1000, 4)
+        p95 = percentile([r[f'{role}_ms'] for r in items if r[f'{role}_ms'] is not None], 0.95)
+        report.append({
+            'role': role,
+            'provider': provider,
+            'model': model,
+            'images': len(items),
+            'agreement': sum(r['normalized_equal'] for r in items) / len(items),
+            'similarity': sum(r['similarity'] for r in items) / len(items),
+            'p95_ms': round(p95, 1) if p95 is not None else None,
+            'tokens_per_1k': round((sum(prompt) + sum(completion)) / len(items) * 1000),
+            'cost_per_1k': cost,
+        })
+    return report
+
+
+def format_report(report):
+    """把 shadow_report 的结果格式化为文本行"""
+    if not report:
+        return ["还没有影子评估结果"]
+    lines = []
+    for entry in report:
+        role = '当前' if entry['role'] == 'primary' else '候选'
+        cost = f"，每千张费用 {entry['cost_per_1k']}" if entry['cost_per_1k'] is not None else ''
+        lines.append(
+            f"[{role}] {entry['provider']}/{entry['model']}: {entry['images']} 张，"
+            f"结果一致 {entry['agreement']:.0%}，平均相似度 {entry['similarity']:.2f}，"
+            f"p95 耗时 {entry['p95_ms']} ms，每千张 {entry['tokens_per_1k']} token{cost}"
+        )
+    return lines
+
+
+def create_shadow_evaluator(config, profile_manager, log_callback=None):
+    """根据配置中的 shadow 设置创建影子评估，未启用或候选配置方案不存在时返回 None
+
+    候选管线独立于配置方案的管线创建，不共用识别历史和录制。
+    """
+    shadow = config.get('shadow', {}) or {}
+    name = shadow.get('profile', '')
+    if not shadow.get('enabled') or not name:
+        return None
+    profile = (config.get('profiles', {}) or {}).get(name)
+    if profile is None:
+        if log_callback:
+            log_callback(f"影子评估的候选配置方案不存在: {name}")
+        return None
+    resolved = profile_manager.resolve(profile, config.get('provider_settings', {}) or {})
+    candidate = profile_manager.build(name, resolved)
+    candidate.history = None
+    candidate.trace = None
+    # 候选管线每次都真正请求服务商，耗时和 token 用量才有可比性
+    candidate.result_cache = None
+    evaluator = ShadowEvaluator(candidate, name, shadow.get('fraction', 0.1), log_callback=log_callback)
+    evaluator.signature = json.dumps([resolved, shadow], sort_keys=True, ensure_ascii=False)
+    return evaluator
+
+
+def load_report(db_path=None, prices=None, since=None):
+    """从评估数据库读取汇总，数据库不存在时返回空列表"""
+    db_path = db_path or os.path.join(get_app_data_dir(), 'shadow.db')
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        return shadow_report(conn, prices, since)
+    finally:
+        conn.close()
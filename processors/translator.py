@@ -0,0 +1,136 @@
+import queue
+import re
+import threading
+import time
+
+DEFAULT_TRANSLATION_PROMPT = (
+    "Translate the following Markdown into {language}. Keep the Markdown structure unchanged. "
+    "Placeholders such as ⟦M0⟧ stand for formulas or code: copy them exactly and do not translate them. "
+    "Return only the translated Markdown."
+)
+# 公式和代码在翻译前替换为占位符，避免被模型改动
+PROTECTED_PATTERN = re.compile(
+    r'```.*?```|`[^`\n]+`|\$\$.*?\$\$|\\\[.*?\\\]|\\\(.*?\\\)|(?<![\\$])\$[^$\n]+?\$',
+    re.DOTALL
+)
+PLACEHOLDER = '⟦M{index}⟧'
+
+
+def mask_protected(markdown):
+    """将公式和代码替换为占位符，返回 (替换后的文本, 被替换的原文列表)"""
+    spans = []
+
+    def replace(match):
+        spans.append(match.group(0))
+        return PLACEHOLDER.format(index=len(spans) - 1)
+
+    return PROTECTED_PATTERN.sub(replace, markdown), spans
+
+
+def unmask_protected(text, spans):
+    """还原占位符，有占位符丢失或重复时返回 None"""
+    for index, span in enumerate(spans):
+        placeholder = PLACEHOLDER.format(index=index)
+        if text.count(placeholder) != 1:
+            return None
+        text = text.replace(placeholder, span)
+    return text
+
+
+class Translator:
+    """识别后的第二阶段：用廉价的文本模型翻译识别结果
+
+    与识别共用同一个客户端（连接池）和 token 统计。翻译在后台线程中按提交顺序进行，
+    剪贴板监听线程提交后立即继续识别下一张图片，两个阶段流水线式重叠。
+    """
+
+    def __init__(self, processor, model='', language='简体中文', prompt=''):
+        """
+        Args:
+            processor: 提供客户端的 ImageToMarkdown 实例
+            model: 翻译使用的模型，为空时使用识别模型
+            language: 目标语言
+            prompt: 自定义翻译 Prompt，可包含 {language}，为空时使用 DEFAULT_TRANSLATION_PROMPT
+        """
+        self.processor = processor
+        self.model = model
+        self.language = language
+        self.prompt = prompt or DEFAULT_TRANSLATION_PROMPT
+        self.stats = {'requests': 0, 'failures': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, processor, translation):
+        """根据服务商设置中的 translation 配置创建翻译器，未启用时返回 None"""
+        if not translation or not translation.get('enabled'):
+            return None
+        return cls(
+            processor,
+            model=translation.get('model', ''),
+            language=translation.get('language', '') or '简体中文',
+            prompt=translation.get('prompt', '')
+        )
+
+    def translate(self, markdown, source='background'):
+        """同步翻译一段 Markdown，公式和代码保持原样；占位符丢失时抛出异常
+
+        翻译请求与识别请求共用请求调度的额度，source 为原识别任务的来源。
+        """
+        processor = self.processor
+        if not processor.client:
+            raise Exception("请先设置 API Key 或推理接入点")
+        masked, spans = mask_protected(markdown)
+        start = time.perf_counter()
+        usage = {}
+        translated = ''
+        self.stats['requests'] += 1
+        try:
+            with processor.scheduled(source):
+                stream = processor.client.chat.completions.create(
+                    model=self.model or processor.gpt_model,
+                    messages=[
+                        {"role": "system", "content": self.prompt.format(language=self.language)},
+                        {"role": "user", "content": masked},
+                    ],
+                    max_tokens=processor.max_tokens,
+                    stream=True,
+                    **processor.request_options(stream=True)
+                )
+                for chunk in stream:
+                    if getattr(chunk, 'usage', None):
+                        processor.add_usage(usage, chunk)
+                    if chunk.choices:
+                        translated += chunk.choices[0].delta.content or ''
+        except Exception:
+            # 网络和服务商错误也计入失败次数
+            self.stats['failures'] += 1
+            raise
+        self.stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        self.stats['completion_tokens'] += usage.get('completion_tokens', 0)
+        processor.log(f"翻译完成，用时 {time.perf_counter() - start:.1f} 秒")
+        processor.log_usage(usage)
+        result = unmask_protected(translated.strip(), spans)
+        if result is None:
+            self.stats['failures'] += 1
+            raise Exception("翻译结果中的公式占位符不完整")
+        return result
+
+    def submit(self, markdown, callback, source='background'):
+        """提交一段 Markdown 到后台翻译，完成后以 (翻译结果, 错误) 调用 callback"""
+        self.pending.put((markdown, callback, source))
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            markdown, callback, source = item
+            try:
+                callback(self.translate(markdown, source), None)
+            except Exception as e:
+                callback(markdown, e)
+
+    def stop(self):
+        self.pending.put(None)
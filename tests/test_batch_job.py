@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from PIL import Image, ImageDraw
+from processors.batch_job import BatchJob, collect_images
+from processors.image_to_markdown import ImageToMarkdown
+
+
+class MockBatchHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 /v1/files 和 /v1/batches 接口"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        api = self.server.api
+        if self.path == '/v1/files':
+            message = BytesParser(policy=policy.HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('ascii') + body)
+            part = next(p for p in message.iter_parts() if p.get_param('name', header='content-disposition') == 'file')
+            self.send_json(api.add_file(part.get_payload(decode=True).decode('utf-8'), part.get_filename()))
+        elif self.path == '/v1/batches':
+            self.send_json(api.create_batch(json.loads(body)))
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_GET(self):
+        api = self.server.api
+        parts = self.path.strip('/').split('/')
+        if parts[:2] == ['v1', 'batches'] and len(parts) == 3:
+            self.send_json(api.retrieve_batch(parts[2]))
+        elif parts[:2] == ['v1', 'files'] and parts[-1] == 'content':
+            data = api.files[parts[2]]['content'].encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/jsonl')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def send_json(self, payload, code=200):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockBatchAPI:
+    """批量任务第一次查询时为 in_progress，第二次查询时完成；fail_ids 中的请求在第一次提交时返回错误行"""
+
+    def __init__(self, fail_ids=()):
+        self.files = {}
+        self.batches = {}
+        self.fail_ids = set(fail_ids)
+        self.failed_once = set()
+        self.lock = threading.Lock()
+
+    def add_file(self, content, filename, purpose='batch'):
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = {'content': content}
+        return {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename or 'input.jsonl', 'purpose': purpose, 'status': 'processed'}
+
+    def create_batch(self, body):
+        with self.lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            self.batches[batch_id] = {'input_file_id': body['input_file_id'], 'polls': 0,
+                                      'output_file_id': None, 'error_file_id': None}
+        return self.batch_object(batch_id, 'validating')
+
+    def retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        if batch['polls'] < 2:
+            return self.batch_object(batch_id, 'in_progress')
+        if batch['output_file_id'] is None:
+            self.complete(batch)
+        return self.batch_object(batch_id, 'completed')
+
+    def complete(self, batch):
+        outputs, errors = [], []
+        for line in self.files[batch['input_file_id']]['content'].splitlines():
+            request = json.loads(line)
+            custom_id = request['custom_id']
+            if custom_id in self.fail_ids and custom_id not in self.failed_once:
+                self.failed_once.add(custom_id)
+                errors.append({'id': f"req-{custom_id}", 'custom_id': custom_id, 'response': {
+                    'status_code': 400, 'body': {'error': {'message': 'invalid image', 'type': 'invalid_request_error'}}
+                }, 'error': None})
+                continue
+            outputs.append({'id': f"req-{custom_id}", 'custom_id': custom_id, 'error': None, 'response': {
+                'status_code': 200,
+                'body': {
+                    'model': request['body']['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                        'role': 'assistant', 'content': f"result of {custom_id} \\(x^2\\)"}}],
+                    'usage': {'prompt_tokens': 100, 'completion_tokens': 10, 'total_tokens': 110},
+                },
+            }})
+        batch['output_file_id'] = self.add_file('\n'.join(json.dumps(o) for o in outputs), 'output.jsonl')['id']
+        if errors:
+            batch['error_file_id'] = self.add_file('\n'.join(json.dumps(e) for e in errors), 'errors.jsonl')['id']
+
+    def batch_object(self, batch_id, status):
+        batch = self.batches[batch_id]
+        return {
+            'id': batch_id, 'object': 'batch', 'endpoint': '/v1/chat/completions',
+            'input_file_id': batch['input_file_id'], 'completion_window': '24h', 'status': status,
+            'created_at': int(time.time()), 'output_file_id': batch['output_file_id'],
+            'error_file_id': batch['error_file_id'],
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        }
+
+
+@pytest.fixture
+def mock_api():
+    api = MockBatchAPI(fail_ids={'img-000001'})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockBatchHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api.url = f"http://127.0.0.1:{server.server_port}/v1"
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+def make_processor(url):
+    processor = ImageToMarkdown()
+    processor.apply_config({
+        'current_provider': '自定义',
+        'provider_settings': {'自定义': {'url': url, 'api_key': 'test', 'model': 'vision-model'}},
+        'latex_settings': {'inline_wrapper': '$ $'},
+    })
+    return processor
+
+
+def read_state(output_dir):
+    with open(os.path.join(output_dir, 'batch_state.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_batch_survives_restart_and_retries_failed_requests(tmp_path, mock_api):
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    for index in range(3):
+        image = Image.new('RGB', (200, 50), 'white')
+        ImageDraw.Draw(image).text((10, 15), f"page {index}", fill='black')
+        image.save(image_dir / f"page{index}.png")
+    output_dir = str(tmp_path / 'out')
+
+    job = BatchJob(make_processor(mock_api.url), output_dir)
+    assert job.add_images(collect_images([str(image_dir)])) == 3
+    assert [i['status'] for i in read_state(output_dir)['items'].values()] == ['pending'] * 3
+    assert job.submit_pending() == ['batch-1']
+    state = read_state(output_dir)
+    assert [i['status'] for i in state['items'].values()] == ['submitted'] * 3
+    assert all(i['model'] == 'vision-model' for i in state['items'].values())
+
+    # 模拟程序在提交后、轮询前退出：新的实例从状态文件继续，不重复提交
+    restarted = BatchJob(make_processor(mock_api.url), output_dir)
+    assert restarted.add_images(collect_images([str(image_dir)])) == 0
+    transitions = []
+    save_state = restarted.save_state
+
+    def track_state():
+        save_state()
+        status = read_state(output_dir)['items']['img-000001']['status']
+        if not transitions or transitions[-1] != status:
+            transitions.append(status)
+
+    restarted.save_state = track_state
+    summary = restarted.run(poll_interval=0)
+
+    assert summary == {'done': 3}
+    # 第一个任务中的错误行被标记为失败后重新提交了一次
+    assert list(mock_api.batches) == ['batch-1', 'batch-2']
+    assert transitions == ['submitted', 'failed', 'submitted', 'done']
+    state = read_state(output_dir)
+    assert all(info['collected'] for info in state['batches'].values())
+    assert state['items']['img-000001']['batch'] == 'batch-2'
+    assert 'error' not in state['items']['img-000001']
+    for index, custom_id in enumerate(sorted(state['items'])):
+        with open(os.path.join(output_dir, f"page{index}.md"), encoding='utf-8') as f:
+            assert f.read() == f"result of {custom_id} $x^2$"
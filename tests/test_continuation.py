@@ -0,0 +1,48 @@
+from PIL import Image
+from conftest import fake_client, fake_response
+from processors.image_to_markdown import ImageToMarkdown
+
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key), 'local' if key in self.entries else None
+
+    def put(self, key, raw, provider, model):
+        self.entries[key] = raw
+
+    def close(self):
+        pass
+
+
+def make_processor(finish_reasons):
+    processor = ImageToMarkdown()
+    processor.set_api_key('test')
+    processor.max_continuations = 2
+    processor.set_result_cache(MemoryCache())
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return fake_response(f"part{len(calls)}", finish_reason=finish_reasons[len(calls) - 1])
+
+    processor.client = fake_client(create)
+    return processor, calls
+
+
+def test_truncated_output_is_reported_and_not_cached():
+    processor, calls = make_processor(['length', 'length', 'length'])
+    result = processor.recognize(Image.new('RGB', (200, 100), 'white'))
+    assert len(calls) == 3
+    assert result['truncated'] is True
+    assert processor.result_cache.entries == {}
+
+
+def test_completed_continuation_is_cached():
+    processor, calls = make_processor(['length', 'stop'])
+    result = processor.recognize(Image.new('RGB', (200, 100), 'white'))
+    assert len(calls) == 2
+    assert result['truncated'] is False
+    assert list(processor.result_cache.entries.values()) == [result['raw']]
@@ -0,0 +1,48 @@
+from PIL import Image, ImageDraw
+from processors import image_features
+from processors.document_filter import DocumentFilter
+from processors.image_to_markdown import ImageToMarkdown
+
+
+def document_image():
+    image = Image.new('RGB', (600, 200), 'white')
+    draw = ImageDraw.Draw(image)
+    for row in range(5):
+        draw.text((10, 10 + row * 35), f"line {row}: a^2 + b^2 = c^2", fill='black')
+    return image
+
+
+def count_extractions(monkeypatch):
+    calls = []
+    extract = image_features.extract_features
+
+    def counted(image):
+        calls.append(image.size)
+        return extract(image)
+
+    monkeypatch.setattr(image_features, 'extract_features', counted)
+    return calls
+
+
+def test_prefilter_features_are_reused_by_plan_request(monkeypatch):
+    calls = count_extractions(monkeypatch)
+    logs = []
+    image = document_image()
+    assert DocumentFilter(threshold=0.1, log_callback=logs.append).check(image)
+    assert len(logs) == 1 and '得分' in logs[0]
+
+    processor = ImageToMarkdown()
+    processor.set_adaptive_max_tokens(True)
+    model, max_tokens, features = processor.plan_request(image)
+    assert calls == [(600, 200)]
+    assert features['line_count'] > 0
+
+
+def test_resized_image_features_are_extracted_again(monkeypatch):
+    calls = count_extractions(monkeypatch)
+    image = document_image()
+    image_features.cached_features(image)
+    resized = image.resize((300, 100))
+    features = image_features.cached_features(resized)
+    assert (features['width'], features['height']) == (300, 100)
+    assert calls == [(600, 200), (300, 100)]
@@ -0,0 +1,180 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+import pytest
+
+evdev = pytest.importorskip('evdev')
+from evdev import ecodes
+from utils import hotkey_manager
+from utils.hotkey_manager import EvdevHotkeyListener, LinuxHotkeyManager
+
+
+class PipeKeyboard:
+    """代替 /dev/input 设备：写入管道后 read() 返回排队的按键事件"""
+
+    def __init__(self):
+        self.fd, self.write_fd = os.pipe()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def send(self, code, value):
+        with self.lock:
+            self.events.append(evdev.InputEvent(0, 0, ecodes.EV_KEY, code, value))
+        os.write(self.write_fd, b'x')
+
+    def read(self):
+        os.read(self.fd, 4096)
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def close(self):
+        for fd in (self.fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+@pytest.fixture
+def manager():
+    keyboard = PipeKeyboard()
+    manager = LinuxHotkeyManager()
+    manager.listener = EvdevHotkeyListener(devices=[keyboard])
+    manager.keyboard = keyboard
+    yield manager
+    manager.close()
+    keyboard.close()
+
+
+def press(listener, *codes):
+    """依次按下 codes，最后一个键按下、自动重复两次后松开，再按相反顺序松开修饰键"""
+    for code in codes:
+        listener.feed(code, 1)
+    listener.feed(codes[-1], 2)
+    listener.feed(codes[-1], 2)
+    for code in reversed(codes):
+        listener.feed(code, 0)
+
+
+def test_callbacks_fire_once_per_press_with_exact_modifiers(manager):
+    fired = []
+    manager.set_callback(lambda: fired.append('toggle'))
+    assert manager.register_hotkey('ctrl+shift+o')
+    assert manager.register_screenshot_listener('alt+print', lambda: fired.append('screenshot'))
+    assert manager.register_named_hotkey('profile', 'ctrl+1', lambda: fired.append('profile'))
+    listener = manager.listener
+
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_O)
+    press(listener, ecodes.KEY_RIGHTALT, ecodes.KEY_SYSRQ)
+    press(listener, ecodes.KEY_RIGHTCTRL, ecodes.KEY_1)
+    assert fired == ['toggle', 'screenshot', 'profile']
+
+    fired.clear()
+    # 修饰键多一个或少一个都不触发
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_O)
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_LEFTALT, ecodes.KEY_O)
+    press(listener, ecodes.KEY_SYSRQ)
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_1)
+    press(listener, ecodes.KEY_1)
+    assert fired == []
+
+    # 松开的修饰键不再计入
+    listener.feed(ecodes.KEY_LEFTSHIFT, 1)
+    listener.feed(ecodes.KEY_LEFTSHIFT, 0)
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_1)
+    assert fired == ['profile']
+
+
+def test_unregister_stops_dispatch(manager):
+    fired = []
+    manager.set_callback(lambda: fired.append('toggle'))
+    manager.register_hotkey('ctrl+shift+o')
+    manager.register_screenshot_listener('alt+print', lambda: fired.append('screenshot'))
+    manager.register_named_hotkey('profile', 'ctrl+1', lambda: fired.append('profile'))
+    listener = manager.listener
+
+    manager.unregister_hotkey()
+    manager.unregister_screenshot_listener()
+    manager.unregister_named_hotkey('profile')
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_O)
+    press(listener, ecodes.KEY_LEFTALT, ecodes.KEY_SYSRQ)
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_1)
+    assert fired == []
+    assert listener.hotkeys == {}
+    assert not manager.is_active and not manager.screenshot_active and manager.named_hotkeys == {}
+
+    # 同一 slot 重新注册时替换旧的热键
+    manager.register_hotkey('ctrl+shift+o')
+    manager.register_hotkey('ctrl+shift+p')
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_O)
+    press(listener, ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTSHIFT, ecodes.KEY_P)
+    assert fired == ['toggle']
+
+
+def test_invalid_hotkeys_are_rejected(manager):
+    assert not manager.register_hotkey('ctrl+shift')
+    assert not manager.register_hotkey('ctrl+a+b')
+    assert not manager.register_named_hotkey('profile', 'ctrl+nosuchkey', lambda: None)
+    assert manager.listener.hotkeys == {}
+
+
+def test_listener_thread_reads_device_events(manager):
+    fired = threading.Event()
+    manager.register_screenshot_listener('ctrl+alt+a', fired.set)
+    keyboard = manager.keyboard
+    for code in (ecodes.KEY_LEFTCTRL, ecodes.KEY_LEFTALT, ecodes.KEY_A):
+        keyboard.send(code, 1)
+    assert fired.wait(timeout=2)
+
+
+@pytest.fixture
+def xvfb(monkeypatch):
+    if not hotkey_manager.XLIB_AVAILABLE or not shutil.which('Xvfb'):
+        pytest.skip('需要 python-xlib 和 Xvfb')
+    display = ':87'
+    server = subprocess.Popen(['Xvfb', display, '-nolisten', 'tcp'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    monkeypatch.setenv('DISPLAY', display)
+    from Xlib import display as xdisplay
+    for _ in range(50):
+        try:
+            xdisplay.Display(display).close()
+            break
+        except Exception:
+            time.sleep(0.1)
+    else:
+        server.kill()
+        pytest.skip('Xvfb 启动失败')
+    yield display
+    server.terminate()
+    server.wait(timeout=5)
+
+
+def test_x11_grab_covers_lock_masks(xvfb):
+    from Xlib import X, XK, display as xdisplay, error as xerror
+    listener = hotkey_manager.X11HotkeyListener()
+    other = xdisplay.Display(xvfb)
+    try:
+        assert listener.add('toggle', 'ctrl+shift+o', lambda: None)
+        keycode = other.keysym_to_keycode(XK.string_to_keysym('o'))
+        root = other.screen().root
+        # 抓取了 CapsLock、NumLock 打开时的组合，其他客户端抓取这些组合都会失败
+        for lock_mask in (0, X.LockMask, X.Mod2Mask, X.LockMask | X.Mod2Mask):
+            catcher = xerror.CatchError(xerror.BadAccess)
+            root.grab_key(keycode, X.ControlMask | X.ShiftMask | lock_mask, True,
+                          X.GrabModeAsync, X.GrabModeAsync, onerror=catcher)
+            other.sync()
+            assert catcher.get_error() is not None
+
+        assert listener.remove('toggle')
+        catcher = xerror.CatchError(xerror.BadAccess)
+        root.grab_key(keycode, X.ControlMask | X.ShiftMask | X.LockMask, True,
+                      X.GrabModeAsync, X.GrabModeAsync, onerror=catcher)
+        other.sync()
+        assert catcher.get_error() is None
+    finally:
+        other.close()
+        listener.close()
@@ -0,0 +1,55 @@
+from PIL import Image
+from conftest import fake_client, fake_response
+from processors.image_cost import cost_model_for
+from processors.image_to_markdown import ImageToMarkdown
+
+
+def make_processor(outputs):
+    processor = ImageToMarkdown()
+    processor.set_api_key('test')
+    processor.set_gpt_model('gpt-4o')
+    processor.set_cost_aware_resize(True)
+    processor.set_progressive_resolution(True)
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs)
+        return fake_response(outputs[len(sent) - 1], prompt_tokens=1000 * len(sent))
+
+    processor.client = fake_client(create)
+    return processor, sent
+
+
+def expected_tokens(processor, image):
+    """按计费方式缩放后的原图和渐进式识别第一轮缩小图片的预测 token 数"""
+    sent, full_tokens = processor.fit_image_cost(image, 'gpt-4o', None)
+    reduced = processor.reduce_resolution(sent)
+    return full_tokens, cost_model_for('OPENAI', 'gpt-4o').tokens(*reduced.size, sent.info['image_detail'])
+
+
+def test_escalation_records_prediction_for_each_image_sent():
+    processor, sent = make_processor(['', 'x + y'])
+    image = Image.new('RGB', (1600, 1200), 'white')
+    result = processor.recognize(image, source='clipboard')
+
+    assert len(sent) == 2
+    full_tokens, reduced_tokens = expected_tokens(processor, image)
+    stats = processor.image_cost_summary()
+    assert stats['requests'] == 2
+    assert stats['predicted'] == reduced_tokens + full_tokens
+    # 第一次请求计费 1000，第二次请求计费 2000，分别与各自发送的图片比较
+    assert stats['billed'] == 1000 + 2000
+    assert result['image_tokens'] == reduced_tokens + full_tokens
+    assert result['prompt_tokens'] == 3000
+
+
+def test_reduced_image_prediction_without_escalation():
+    processor, sent = make_processor(['x + y'])
+    image = Image.new('RGB', (1600, 1200), 'white')
+    result = processor.recognize(image, source='clipboard')
+
+    assert len(sent) == 1
+    full_tokens, reduced_tokens = expected_tokens(processor, image)
+    assert reduced_tokens < full_tokens
+    assert result['image_tokens'] == reduced_tokens
+    assert processor.image_cost_summary()['requests'] == 1
@@ -0,0 +1,55 @@
+import gc
+from PIL import Image, ImageDraw
+from conftest import fake_client, fake_response
+from processors import image_to_markdown
+from processors.image_to_markdown import ImageToMarkdown
+from utils.memory_monitor import MemoryMonitor, get_rss_bytes
+
+CAPTURES = 3000
+WARM_UP = 200
+# 预热后允许的 RSS 增长
+MAX_RSS_GROWTH_MB = 40
+
+
+def make_capture(index):
+    """每张截图内容和尺寸都不同，避免命中任何按指纹去重的路径"""
+    image = Image.new('RGB', (320 + index % 7 * 16, 80 + index % 5 * 12), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 10), f"capture {index}: a^2 + b^2 = c^{index % 9}", fill='black')
+    draw.line((10, 40, 10 + index % 300, 40), fill='black')
+    return image
+
+
+def test_captures_do_not_leak(monkeypatch):
+    copied = []
+    monkeypatch.setattr(image_to_markdown.pyperclip, 'copy', lambda text: copied.append(len(text)))
+    monitor = MemoryMonitor()
+    processor = ImageToMarkdown()
+    processor.apply_config({
+        'current_provider': 'OPENAI',
+        'provider_settings': {'OPENAI': {'api_key': 'test', 'model': 'gpt-4o'}},
+    })
+    processor.set_memory_monitor(monitor)
+    processor.client = fake_client(lambda **kwargs: fake_response('$x^2$ recognized text'))
+
+    def run(start, count):
+        for index in range(start, start + count):
+            # 与剪贴板监听线程相同：登记、处理、立即释放
+            image = make_capture(index)
+            processor.track('images', image)
+            processor.capture(image, 'clipboard')
+            image.close()
+            del image
+
+    run(0, WARM_UP)
+    gc.collect()
+    baseline = get_rss_bytes()
+    run(WARM_UP, CAPTURES)
+    gc.collect()
+
+    assert len(copied) == WARM_UP + CAPTURES
+    assert processor.processed_count == WARM_UP + CAPTURES
+    assert monitor.counts().get('images', 0) == 0
+    if baseline is not None:
+        growth_mb = (get_rss_bytes() - baseline) / 1024 / 1024
+        assert growth_mb < MAX_RSS_GROWTH_MB, f"RSS 增长了 {growth_mb:.1f} MB"
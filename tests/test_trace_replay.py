@@ -0,0 +1,55 @@
+import time
+from PIL import Image, ImageDraw
+from conftest import fake_client, fake_response
+from processors.image_to_markdown import ImageToMarkdown
+from pillocr_replay import replay
+from utils.trace_recorder import TraceRecorder, load_trace, trace_image_path
+
+
+def make_image(index):
+    image = Image.new('RGB', (240, 60), 'white')
+    ImageDraw.Draw(image).text((10, 20), f"x_{index} = {index * 3}", fill='black')
+    return image
+
+
+def test_record_is_written_in_background_and_replays(tmp_path):
+    recorder = TraceRecorder(str(tmp_path))
+    processor = ImageToMarkdown()
+    processor.apply_config({'current_provider': 'OPENAI', 'provider_settings': {'OPENAI': {'api_key': 'test'}}})
+    processor.client = fake_client(lambda **kwargs: fake_response('x'))
+    processor.set_trace(recorder)
+    for index in range(5):
+        with make_image(index) as image:
+            processor.recognize(image, 'clipboard')
+    recorder.close()
+
+    events = load_trace(str(tmp_path))
+    assert len(events) == 5
+    assert all(event['raw'] == 'x' and event['source'] == 'clipboard' for event in events)
+    with Image.open(trace_image_path(str(tmp_path), events[0])) as image:
+        assert image.size == (240, 60)
+
+    result = replay(str(tmp_path), speed=100)
+    assert result['events'] == 5
+    assert result['errors'] == 0
+    assert result['provider_misses'] == 0
+    assert result['latency_ms']['p95'] is not None
+
+
+def test_record_does_not_encode_on_the_caller(tmp_path, monkeypatch):
+    recorder = TraceRecorder(str(tmp_path))
+    written = []
+    original = recorder.write
+
+    def slow_write(*args):
+        time.sleep(0.2)
+        written.append(original(*args))
+
+    monkeypatch.setattr(recorder, 'write', slow_write)
+    started = time.perf_counter()
+    with make_image(1) as image:
+        recorder.record(image, {'raw': 'x', 'total_ms': 1.0}, 'clipboard')
+    assert time.perf_counter() - started < 0.1
+    recorder.close()
+    assert len(written) == 1
+    assert len(load_trace(str(tmp_path))) == 1
@@ -0,0 +1,43 @@
+import pytest
+from types import SimpleNamespace
+from conftest import fake_client
+from processors.image_to_markdown import ImageToMarkdown
+from processors.translator import Translator
+
+
+def make_translator(create):
+    processor = ImageToMarkdown()
+    processor.client = fake_client(create)
+    translator = Translator(processor)
+    translator.stop()
+    return translator
+
+
+def stream_of(text):
+    return iter([SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])])
+
+
+def test_formulas_are_kept():
+    translator = make_translator(lambda **kwargs: stream_of('面积为 ⟦M0⟧'))
+    assert translator.translate('The area is $\\pi r^2$') == '面积为 $\\pi r^2$'
+    assert translator.stats['requests'] == 1
+    assert translator.stats['failures'] == 0
+
+
+def test_request_errors_are_counted():
+    def create(**kwargs):
+        raise ConnectionError('network down')
+
+    translator = make_translator(create)
+    with pytest.raises(ConnectionError):
+        translator.translate('hello')
+    assert translator.stats['requests'] == 1
+    assert translator.stats['failures'] == 1
+
+
+def test_lost_placeholders_are_counted():
+    translator = make_translator(lambda **kwargs: stream_of('面积'))
+    with pytest.raises(Exception):
+        translator.translate('The area is $x$')
+    assert translator.stats['requests'] == 1
+    assert translator.stats['failures'] == 1
@@ -0,0 +1,256 @@
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+# 单次请求允许的最大图片体积
+MAX_BODY_SIZE = 32 * 1024 * 1024
+# 允许的 Host 请求头，防止网页通过 DNS 重绑定调用本地接口
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+class RecognitionRequestHandler(BaseHTTPRequestHandler):
+    """本地识别接口的请求处理器
+
+    POST /v1/recognize      请求体为图片字节，返回 Markdown
+    POST /v1/recognize?stream=1   以 chunked 方式流式返回 Markdown
+    GET  /v1/health         返回服务状态
+    """
+    # HTTP/1.1 以支持 keep-alive
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PillOCR'
+
+    def address_string(self):
+        # Unix socket 的 client_address 为空字符串
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def log_message(self, format, *args):
+        # 不向 stderr 打印访问日志
+        pass
+
+    def host_allowed(self):
+        """Host 请求头必须是本机地址（或监听的地址）；Unix socket 和不带 Host 的请求不检查"""
+        if not isinstance(self.client_address, tuple):
+            return True
+        host = self.headers.get('Host')
+        if not host:
+            return True
+        host = host.strip().lower()
+        if host.startswith('['):
+            host = host[1:host.find(']')] if ']' in host else host[1:]
+        elif host.count(':') == 1:
+            host = host.split(':', 1)[0]
+        return host in LOCAL_HOSTS or host == str(self.server.recognition.host).lower()
+
+    def content_length(self):
+        """请求体长度，Content-Length 无法解析时返回 None"""
+        try:
+            return int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return None
+
+    def reject_host(self):
+        self.close_connection = True
+        self.send_json(403, {'error': 'Host 不是本机地址'})
+
+    def do_GET(self):
+        if not self.host_allowed():
+            self.reject_host()
+            return
+        path = urlparse(self.path).path
+        if path == '/v1/health':
+            processor = self.server.recognition.processor
+            self.send_json(200, {
+                'status': 'ok',
+                'model': processor.gpt_model,
+                'provider': processor.current_provider,
+                'client_ready': processor.client is not None,
+                'progressive': processor.progressive_summary(),
+                'image_cost': processor.image_cost_summary(),
+                'scheduler': processor.scheduler.summary() if processor.scheduler else None,
+            })
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if not self.host_allowed():
+            self.reject_host()
+            return
+        url = urlparse(self.path)
+        length = self.content_length()
+        if length is None or length < 0:
+            self.close_connection = True
+            self.send_json(400, {'error': 'Content-Length 无效'})
+            return
+        if url.path != '/v1/recognize':
+            self.discard_body()
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        if length <= 0:
+            self.send_json(400, {'error': '请求体为空'})
+            return
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self.send_json(413, {'error': '图片过大'})
+            return
+
+        body = self.rfile.read(length)
+        try:
+            image = Image.open(io.BytesIO(body))
+            image.load()
+        except Exception as e:
+            self.send_json(400, {'error': f'无法解析图片: {e}'})
+            return
+
+        query = parse_qs(url.query)
+        stream = query.get('stream', ['0'])[0] in ('1', 'true', 'yes')
+        service = self.server.recognition
+        try:
+            with service.workers:
+                if stream:
+                    self.send_stream(service.processor.iter_markdown(image))
+                else:
+                    markdown_content = service.processor.submit(image)['markdown']
+                    self.send_text(200, markdown_content)
+        except Exception as e:
+            service.log(f"本地接口识别出错: {e}")
+            if not self.headers_sent():
+                self.send_json(502, {'error': str(e)})
+            else:
+                self.close_connection = True
+        finally:
+            image.close()
+
+    def headers_sent(self):
+        return getattr(self, '_headers_sent', False)
+
+    def discard_body(self):
+        length = self.content_length() or 0
+        if 0 < length <= MAX_BODY_SIZE:
+            self.rfile.read(length)
+        elif length:
+            self.close_connection = True
+
+    def send_text(self, code, text, content_type='text/markdown; charset=utf-8'):
+        data = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self._headers_sent = True
+        self.wfile.write(data)
+
+    def send_json(self, code, payload):
+        self.send_text(code, json.dumps(payload, ensure_ascii=False),
+                       content_type='application/json; charset=utf-8')
+
+    def send_stream(self, chunks):
+        """以 chunked transfer encoding 逐段发送识别结果"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/markdown; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._headers_sent = True
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            if not data:
+                continue
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class RecognitionServer:
+    """本地识别服务，编辑器插件和脚本可直接提交图片而无需经过剪贴板"""
+
+    def __init__(self, processor, host='127.0.0.1', port=8765, unix_socket=None,
+                 max_workers=4, log_callback=None):
+        """
+        Args:
+            processor: ImageToMarkdown 实例，与剪贴板监听共用同一客户端
+            host: 监听地址，仅建议使用本机地址
+            port: 监听端口，为 0 时不启动 HTTP 监听
+            unix_socket: Unix socket 路径，为空时不启动
+            max_workers: 同时进行的识别请求上限
+            log_callback: 日志回调
+        """
+        self.processor = processor
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.log_callback = log_callback
+        self.workers = threading.BoundedSemaphore(max(1, int(max_workers)))
+        self.servers = []
+        self.threads = []
+
+    @property
+    def is_running(self):
+        return bool(self.servers)
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def start(self):
+        """启动监听，返回是否成功"""
+        if self.is_running:
+            return True
+        try:
+            if self.port:
+                server = ThreadingHTTPServer((self.host, int(self.port)), RecognitionRequestHandler)
+                self.add_server(server)
+                self.log(f"本地识别接口已启动: http://{self.host}:{server.server_port}/v1/recognize")
+            if self.unix_socket and hasattr(socket, 'AF_UNIX'):
+                if os.path.exists(self.unix_socket):
+                    os.remove(self.unix_socket)
+                server = ThreadingUnixHTTPServer(self.unix_socket, RecognitionRequestHandler)
+                os.chmod(self.unix_socket, 0o600)
+                self.add_server(server)
+                self.log(f"本地识别接口已启动: unix:{self.unix_socket}")
+            return True
+        except Exception as e:
+            self.log(f"启动本地识别接口失败: {e}")
+            self.stop()
+            return False
+
+    def add_server(self, server):
+        server.daemon_threads = True
+        server.recognition = self
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.servers.append(server)
+        self.threads.append(thread)
+
+    def stop(self):
+        for server in self.servers:
+            try:
+                server.shutdown()
+                server.server_close()
+            except Exception:
+                pass
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            try:
+                os.remove(self.unix_socket)
+            except OSError:
+                pass
+        if self.servers:
+            self.log("本地识别接口已停止")
+        self.servers = []
+        self.threads = []
@@ -0,0 +1,176 @@
+import hmac
+import json
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# 单条识别结果的最大体积，缓存只保存文本
+MAX_ENTRY_SIZE = 256 * 1024
+# 缓存键为 SHA-256 十六进制串
+KEY_PATTERN = re.compile(r'^/v1/cache/([0-9a-f]{64})$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key         TEXT PRIMARY KEY,
+    raw         TEXT NOT NULL,
+    provider    TEXT,
+    model       TEXT,
+    created_at  REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """团队共享结果缓存的请求处理器
+
+    GET /v1/cache/<key>     返回 {'raw', 'provider', 'model', 'created_at'}，不存在时返回 404
+    PUT /v1/cache/<key>     请求体为 {'raw', 'provider', 'model'}，已存在时保留原结果
+    GET /v1/health          返回条目数和命中统计
+    设置了令牌时所有请求都需要 Authorization: Bearer <令牌>。
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PillOCR-Cache'
+
+    def log_message(self, format, *args):
+        pass
+
+    def authorized(self):
+        token = self.server.cache.token
+        if not token:
+            return True
+        supplied = self.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8'))
+
+    def do_GET(self):
+        if not self.authorized():
+            self.send_json(401, {'error': 'unauthorized'})
+            return
+        path = urlparse(self.path).path
+        cache = self.server.cache
+        if path == '/v1/health':
+            self.send_json(200, dict(cache.summary(), status='ok'))
+            return
+        match = KEY_PATTERN.match(path)
+        if not match:
+            self.send_json(404, {'error': 'not found'})
+            return
+        entry = cache.get(match.group(1))
+        if entry is None:
+            self.send_json(404, {'error': 'not found'})
+        else:
+            self.send_json(200, entry)
+
+    def do_PUT(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_ENTRY_SIZE:
+            self.close_connection = True
+            self.send_json(413, {'error': 'entry too large'})
+            return
+        body = self.rfile.read(length) if length > 0 else b''
+        if not self.authorized():
+            self.send_json(401, {'error': 'unauthorized'})
+            return
+        match = KEY_PATTERN.match(urlparse(self.path).path)
+        if not match:
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            entry = json.loads(body)
+            if not isinstance(entry.get('raw'), str) or not entry['raw'].strip():
+                raise ValueError('raw must be a non-empty string')
+        except (ValueError, AttributeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.server.cache.put(match.group(1), entry)
+        self.send_json(200, {'stored': True})
+
+    def send_json(self, code, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CacheServer:
+    """可自行部署的团队共享结果缓存服务，按缓存键保存识别结果文本，不接收图片"""
+
+    def __init__(self, db_path, host='127.0.0.1', port=8790, token='', log_callback=None):
+        """
+        Args:
+            db_path: SQLite 数据库路径
+            host: 监听地址，供团队使用时设为 0.0.0.0
+            port: 监听端口，为 0 时由系统分配
+            token: 访问令牌，为空时不校验
+            log_callback: 日志回调
+        """
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.token = token
+        self.log_callback = log_callback
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self.stats = {'lookups': 0, 'hits': 0, 'stored': 0}
+        self.server = None
+        self.thread = None
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def get(self, key):
+        with self.lock:
+            self.stats['lookups'] += 1
+            row = self.conn.execute(
+                "SELECT raw, provider, model, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.stats['hits'] += 1
+            with self.conn:
+                self.conn.execute("UPDATE cache SET hits = hits + 1 WHERE key = ?", (key,))
+        return dict(row)
+
+    def put(self, key, entry):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO cache (key, raw, provider, model, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, entry['raw'], entry.get('provider'), entry.get('model'), time.time())
+            )
+            self.stats['stored'] += cursor.rowcount
+
+    def summary(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return dict(self.stats, entries=entries)
+
+    @property
+    def url(self):
+        if self.server is None:
+            return ''
+        return f"http://{self.host}:{self.server.server_port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, int(self.port)), CacheRequestHandler)
+        self.server.daemon_threads = True
+        self.server.cache = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.log(f"结果缓存服务已启动: {self.url}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        with self.lock:
+            self.conn.close()
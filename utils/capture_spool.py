@@ -0,0 +1,194 @@
+import io
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+import openai
+from PIL import Image
+from processors.image_features import FEATURES_INFO_KEY
+from utils.path_tools import get_app_data_dir
+
+SPOOL_FILE = 'spool.dat'
+ACK_FILE = 'spool.ack'
+# 记录头：魔数、CRC32（元数据和图片）、元数据长度、图片长度
+RECORD_HEADER = struct.Struct('<4sIIQ')
+RECORD_MAGIC = b'PSP1'
+# 网络不可用时的重试间隔（秒），逐次翻倍
+RETRY_MIN_DELAY = 2
+RETRY_MAX_DELAY = 60
+# 这些错误说明服务商暂时不可用，图片保留在缓冲区中稍后重试
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CaptureSpool:
+    """待识别截图的磁盘缓冲区，保证截图在退出、崩溃或断网时不会丢失
+
+    截图编码为 PNG 后追加写入应用数据目录下的 spool.dat，内存中只保留记录的偏移量；
+    识别完成后把偏移量追加到 spool.ack。后台线程按顺序通过 mmap 读回图片并交给 handler，
+    服务商暂时不可用时等待后重试。程序重启后未确认的记录会重新识别（至少识别一次），
+    所有记录都确认后两个文件被清空。
+    """
+
+    def __init__(self, handler, spool_dir=None, log_callback=None):
+        """
+        Args:
+            handler: 以 (image, source) 调用的识别函数，如 ImageToMarkdown.handle_image
+            spool_dir: 缓冲区目录，默认为应用数据目录下的 spool
+            log_callback: 日志回调
+        """
+        self.handler = handler
+        self.spool_dir = spool_dir or os.path.join(get_app_data_dir(), 'spool')
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool_path = os.path.join(self.spool_dir, SPOOL_FILE)
+        self.ack_path = os.path.join(self.spool_dir, ACK_FILE)
+        self.log_callback = log_callback
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.running = False
+        self.thread = None
+        self.stats = {'spooled': 0, 'processed': 0, 'retries': 0, 'dropped': 0}
+        self.pending = self.recover()  # 未确认记录的偏移量，按写入顺序
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def recover(self):
+        """读取已有的缓冲区，返回未确认记录的偏移量；截断末尾写了一半的记录"""
+        acked = set()
+        if os.path.exists(self.ack_path):
+            with open(self.ack_path, encoding='ascii', errors='ignore') as f:
+                acked = {int(line) for line in f if line.strip().isdigit()}
+        offsets = []
+        valid_end = 0
+        if os.path.exists(self.spool_path) and os.path.getsize(self.spool_path):
+            with open(self.spool_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = 0
+                while offset + RECORD_HEADER.size <= len(mm):
+                    magic, crc, meta_len, data_len = RECORD_HEADER.unpack_from(mm, offset)
+                    end = offset + RECORD_HEADER.size + meta_len + data_len
+                    if magic != RECORD_MAGIC or end > len(mm) \
+                            or zlib.crc32(mm[offset + RECORD_HEADER.size:end]) != crc:
+                        break
+                    if offset not in acked:
+                        offsets.append(offset)
+                    offset = valid_end = end
+            if valid_end < os.path.getsize(self.spool_path):
+                self.log("截图缓冲区末尾的记录不完整，已丢弃")
+                with open(self.spool_path, 'r+b') as f:
+                    f.truncate(valid_end)
+        if not offsets:
+            self.reset()
+        else:
+            self.log(f"截图缓冲区中有 {len(offsets)} 张未识别的图片，将重新识别")
+        return offsets
+
+    def reset(self):
+        """所有记录都已确认，清空缓冲区文件"""
+        for path in (self.spool_path, self.ack_path):
+            with open(path, 'wb'):
+                pass
+
+    def append(self, image, source):
+        """把截图编码后写入缓冲区并立即返回，调用方可以随即释放图片"""
+        buffer = io.BytesIO()
+        # 缓冲区只是临时存放，用最快的压缩级别
+        image.save(buffer, format='PNG', compress_level=1)
+        data = buffer.getvalue()
+        meta = {'source': source, 'ts': round(time.time(), 3)}
+        if FEATURES_INFO_KEY in image.info:
+            # 预过滤已提取的特征随截图保存，识别时不再重复提取
+            meta['features'] = image.info[FEATURES_INFO_KEY]
+        meta = json.dumps(meta).encode('utf-8')
+        record = RECORD_HEADER.pack(RECORD_MAGIC, zlib.crc32(meta + data), len(meta), len(data)) + meta + data
+        with self.lock:
+            with open(self.spool_path, 'ab') as f:
+                offset = f.tell()
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.append(offset)
+            self.stats['spooled'] += 1
+            self.wakeup.notify()
+        return offset
+
+    def read(self, offset):
+        """通过 mmap 读回一条记录，返回 (图片, 元数据)"""
+        with open(self.spool_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _, _, meta_len, data_len = RECORD_HEADER.unpack_from(mm, offset)
+            start = offset + RECORD_HEADER.size
+            meta = json.loads(mm[start:start + meta_len])
+            image = Image.open(io.BytesIO(mm[start + meta_len:start + meta_len + data_len]))
+            image.load()
+        if 'features' in meta:
+            image.info[FEATURES_INFO_KEY] = meta.pop('features')
+        return image, meta
+
+    def ack(self, offset):
+        with self.lock:
+            with open(self.ack_path, 'a', encoding='ascii') as f:
+                f.write(f"{offset}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.remove(offset)
+            if not self.pending:
+                self.reset()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止后台线程，未识别的图片留在缓冲区中，下次启动时继续"""
+        with self.lock:
+            self.running = False
+            self.wakeup.notify_all()
+
+    def _run(self):
+        delay = RETRY_MIN_DELAY
+        while True:
+            with self.lock:
+                while self.running and not self.pending:
+                    self.wakeup.wait()
+                if not self.running:
+                    break
+                offset = self.pending[0]
+            try:
+                image, meta = self.read(offset)
+            except Exception as e:
+                self.log(f"读取缓冲区中的截图失败，已丢弃: {e}")
+                self.stats['dropped'] += 1
+                self.ack(offset)
+                continue
+            try:
+                self.handler(image, meta.get('source', 'clipboard'))
+                self.stats['processed'] += 1
+            except RETRYABLE_ERRORS as e:
+                # 网络恢复前保留在缓冲区中，不确认
+                self.stats['retries'] += 1
+                self.log(f"服务商暂时不可用，{delay} 秒后重试: {e}")
+                with self.lock:
+                    if self.running:
+                        self.wakeup.wait(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+                continue
+            except Exception as e:
+                self.log(f"发生错误: {e}")
+                self.stats['dropped'] += 1
+            finally:
+                image.close()
+            delay = RETRY_MIN_DELAY
+            self.ack(offset)
+
+    def summary(self):
+        return dict(self.stats, pending=len(self.pending))
@@ -1,18 +1,11 @@
 import json
 import os
-import platform
+from utils.path_tools import get_app_data_dir
 
 class ConfigManager:
     def __init__(self, config_file='config.json'):
-        # Get %APPDATA% directory and create app configuration directory
-        if platform.system() == "Windows":
-            appdata = os.getenv("APPDATA")
-            config_dir = os.path.join(appdata, "PillOCR")
-        elif platform.system() == "Darwin":
-            home = os.path.expanduser("~")
-            config_dir = os.path.join(home, "Library", "Application Support", "PillOCR")
-        if not os.path.exists(config_dir):
-            os.makedirs(config_dir, exist_ok=True)
+        # Get the app data directory (%APPDATA%, Application Support or XDG config)
+        config_dir = get_app_data_dir()
         self.config_file = os.path.join(config_dir, config_file)
         
     def load(self):
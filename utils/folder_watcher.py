@@ -0,0 +1,240 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import queue
+import select
+import struct
+import threading
+import time
+from PIL import Image
+from processors.batch_job import IMAGE_EXTENSIONS
+
+# inotify 事件，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+# 轮询模式下文件大小和修改时间连续两次不变才视为写入完成
+POLL_INTERVAL = 1.0
+
+
+def is_image_file(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.')
+
+
+def open_inotify(folder):
+    """在 Linux 上为目录创建 inotify 监听，返回文件描述符；不支持时返回 None"""
+    if platform.system() != 'Linux':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        # 只关心写完关闭和移入的文件，截图工具先写临时文件再改名时同样能收到
+        if libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class FolderWatcher:
+    """监听文件夹中新保存的图片并识别，结果写入同名 .md 文件或追加到指定文件
+
+    Linux 上使用 inotify，文件写完（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）后立即处理；
+    其他系统轮询目录，文件大小和修改时间稳定后再处理。监听线程只把路径放入队列，
+    固定数量的工作线程通过 ImageToMarkdown.submit 识别（启用合并请求时会被合并），
+    一次放入几百个文件也不会为每个文件创建线程。监听开始前已有的文件不处理。
+    """
+
+    def __init__(self, processor, folder, output='sidecar', target_file='', workers=2, log_callback=None):
+        """
+        Args:
+            processor: ImageToMarkdown 实例
+            folder: 监听的文件夹（不包含子文件夹）
+            output: 'sidecar' 在图片旁写入同名 .md 文件，'append' 追加到 target_file
+            target_file: output 为 'append' 时的目标文件
+            workers: 同时识别的图片数
+            log_callback: 日志回调
+        """
+        self.processor = processor
+        self.folder = os.path.abspath(folder)
+        self.output = output
+        self.target_file = target_file
+        self.workers = max(1, int(workers))
+        self.log_callback = log_callback
+        self.pending = queue.Queue()
+        self.queued = set()  # 已入队但尚未处理的路径，避免同一文件重复入队
+        self.seen = {}  # 已处理或启动时已存在的文件 -> (大小, 修改时间)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stats = {'processed': 0, 'failed': 0}
+        self.mode = None
+        self.fd = None
+        self.running = False
+        self.threads = []
+
+    @property
+    def is_running(self):
+        return self.running
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def start(self):
+        """开始监听，返回是否成功"""
+        if self.running:
+            return True
+        if not os.path.isdir(self.folder):
+            self.log(f"监听文件夹不存在: {self.folder}")
+            return False
+        if self.output == 'append' and not self.target_file:
+            self.log("未设置追加结果的目标文件")
+            return False
+        self.seen = self.scan()
+        self.fd = open_inotify(self.folder)
+        self.mode = 'inotify' if self.fd is not None else 'poll'
+        self.running = True
+        self.threads = [threading.Thread(target=self._watch, daemon=True)]
+        self.threads += [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        self.log(f"正在监听文件夹（{self.mode}）: {self.folder}")
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        for _ in range(self.workers):
+            self.pending.put(None)
+        if self.fd is not None:
+            # 监听线程最多在 select 超时后退出，之后再关闭
+            self.threads[0].join(timeout=2)
+            os.close(self.fd)
+            self.fd = None
+        self.threads = []
+        self.log("已停止监听文件夹")
+
+    def scan(self):
+        """返回目录中图片文件的 {路径: (大小, 修改时间)}"""
+        files = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_image_file(entry.name):
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_size, stat.st_mtime)
+        except OSError as e:
+            self.log(f"读取监听文件夹失败: {e}")
+        return files
+
+    def enqueue(self, path):
+        with self.lock:
+            if path in self.queued:
+                return
+            self.queued.add(path)
+        self.pending.put(path)
+
+    def _watch(self):
+        if self.mode == 'inotify':
+            self._watch_inotify()
+        else:
+            self._watch_poll()
+
+    def _watch_inotify(self):
+        while self.running:
+            readable, _, _ = select.select([self.fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出时丢失了部分事件，重新扫描目录补上
+                    self.log("文件夹事件过多，重新扫描目录")
+                    self.enqueue_changed(self.scan())
+                elif name and is_image_file(os.fsdecode(name)):
+                    self.enqueue(os.path.join(self.folder, os.fsdecode(name)))
+
+    def _watch_poll(self):
+        previous = {}
+        while self.running:
+            time.sleep(POLL_INTERVAL)
+            current = self.scan()
+            # 与上一次扫描相同的文件才认为已经写完
+            self.enqueue_changed({p: s for p, s in current.items() if previous.get(p) == s and s[0] > 0})
+            previous = current
+
+    def enqueue_changed(self, files):
+        for path, signature in files.items():
+            if self.seen.get(path) != signature:
+                self.enqueue(path)
+
+    def _work(self):
+        while True:
+            path = self.pending.get()
+            if path is None or not self.running:
+                break
+            try:
+                stat = os.stat(path)
+                self.seen[path] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                pass
+            with self.lock:
+                self.queued.discard(path)
+            try:
+                self.process(path)
+                result = 'processed'
+            except Exception as e:
+                result = 'failed'
+                self.log(f"识别 {os.path.basename(path)} 失败: {e}")
+            with self.lock:
+                self.stats[result] += 1
+
+    def process(self, path):
+        with Image.open(path) as image:
+            image.load()
+            self.processor.track('images', image)
+            self.processor.update_status('processing')
+            markdown_content = self.processor.submit(image, source='folder')['markdown']
+        translator = self.processor.active_translator()
+        if translator is not None:
+            try:
+                markdown_content = translator.translate(markdown_content, source='folder')
+            except Exception as e:
+                self.log(f"翻译失败，保留原文: {e}")
+        self.write(path, markdown_content)
+        self.processor.processed_count += 1
+        self.processor.update_status('success')
+        self.log(f"已识别 {os.path.basename(path)}")
+
+    def write(self, path, markdown_content):
+        if self.output == 'append':
+            with self.write_lock:
+                with open(self.target_file, 'a', encoding='utf-8') as f:
+                    f.write(markdown_content.rstrip('\n') + '\n\n')
+        else:
+            with open(os.path.splitext(path)[0] + '.md', 'w', encoding='utf-8') as f:
+                f.write(markdown_content)
+
+    def summary(self):
+        return {
+            'folder': self.folder,
+            'mode': self.mode,
+            'queued': self.pending.qsize(),
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+        }
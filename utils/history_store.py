@@ -0,0 +1,218 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from utils.path_tools import get_app_data_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at        REAL NOT NULL,
+    source            TEXT,
+    fingerprint       TEXT,
+    thumbnail         BLOB,
+    raw_output        TEXT,
+    markdown          TEXT,
+    provider          TEXT,
+    model             TEXT,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    total_tokens      INTEGER,
+    cached_tokens     INTEGER,
+    encode_ms         REAL,
+    request_ms        REAL,
+    total_ms          REAL
+);
+CREATE INDEX IF NOT EXISTS history_fingerprint ON history (fingerprint, model);
+CREATE INDEX IF NOT EXISTS history_created_at ON history (created_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    markdown, content='history', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, markdown) VALUES (new.id, new.markdown);
+END;
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, markdown) VALUES ('delete', old.id, old.markdown);
+END;
+"""
+
+COLUMNS = (
+    'created_at', 'source', 'fingerprint', 'thumbnail', 'raw_output', 'markdown',
+    'provider', 'model', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+    'cached_tokens', 'encode_ms', 'request_ms', 'total_ms',
+)
+
+
+class HistoryStore:
+    """识别历史记录，保存在应用数据目录下的 SQLite 数据库中
+
+    写入由后台线程批量提交，调用方（剪贴板监听线程、界面线程）不会被磁盘 IO 阻塞。
+    """
+
+    def __init__(self, db_path=None, batch_size=32, flush_interval=1.0, log_callback=None):
+        """
+        Args:
+            db_path: 数据库路径，默认为应用数据目录下的 history.db
+            batch_size: 单个事务最多写入的记录数
+            flush_interval: 等待凑批的最长时间（秒）
+            log_callback: 日志回调，写入失败时调用
+        """
+        self.db_path = db_path or os.path.join(get_app_data_dir(), 'history.db')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.log_callback = log_callback
+        self.pending = queue.Queue()
+        self.read_lock = threading.Lock()
+        self.fts_available = False
+
+        conn = self.connect()
+        try:
+            conn.executescript(SCHEMA)
+            self.migrate(conn)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts_available = True
+            except sqlite3.OperationalError:
+                # SQLite 未编译 FTS5 或不支持 trigram 分词时退化为 LIKE 查询
+                self.fts_available = False
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.read_conn = self.connect(check_same_thread=False)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    @staticmethod
+    def migrate(conn):
+        """为旧版本创建的数据库补充新增的列"""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+        if 'cached_tokens' not in existing:
+            conn.execute("ALTER TABLE history ADD COLUMN cached_tokens INTEGER")
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, record):
+        """提交一条记录，立即返回，由后台线程写入
+
+        Args:
+            record: dict，键为 COLUMNS 中的字段，缺失的字段记为 NULL
+        """
+        record = dict(record)
+        record.setdefault('created_at', time.time())
+        self.pending.put(record)
+
+    def _write_loop(self):
+        conn = self.connect()
+        while True:
+            record = self.pending.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO history ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                        [tuple(r.get(c) for c in COLUMNS) for r in batch]
+                    )
+            except sqlite3.Error as e:
+                self.log(f"写入历史记录失败: {e}")
+            for _ in batch:
+                self.pending.task_done()
+            if stop:
+                break
+        conn.close()
+
+    def query(self, sql, params=()):
+        with self.read_lock:
+            return [dict(row) for row in self.read_conn.execute(sql, params).fetchall()]
+
+    def search(self, text='', limit=100):
+        """全文搜索历史记录，text 为空时返回最近的记录"""
+        fields = ('h.id, h.created_at, h.source, h.fingerprint, h.markdown, h.model, '
+                  'h.total_tokens, h.total_ms')
+        text = text.strip()
+        if not text:
+            return self.query(f"SELECT {fields} FROM history h ORDER BY h.id DESC LIMIT ?", (limit,))
+        # trigram 分词要求至少三个字符，较短的关键词使用 LIKE
+        if self.fts_available and len(text) >= 3:
+            phrase = '"' + text.replace('"', '""') + '"'
+            return self.query(
+                f"SELECT {fields} FROM history_fts f JOIN history h ON h.id = f.rowid "
+                f"WHERE history_fts MATCH ? ORDER BY h.id DESC LIMIT ?",
+                (phrase, limit)
+            )
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self.query(
+            f"SELECT {fields} FROM history h WHERE h.markdown LIKE ? ESCAPE '\\' "
+            f"ORDER BY h.id DESC LIMIT ?",
+            (pattern, limit)
+        )
+
+    def get(self, record_id):
+        rows = self.query("SELECT * FROM history WHERE id = ?", (record_id,))
+        return rows[0] if rows else None
+
+    def find(self, fingerprint, model=None):
+        """按图片指纹（和模型）查找最近一次识别结果"""
+        if model:
+            rows = self.query(
+                "SELECT * FROM history WHERE fingerprint = ? AND model = ? ORDER BY id DESC LIMIT 1",
+                (fingerprint, model)
+            )
+        else:
+            rows = self.query(
+                "SELECT * FROM history WHERE fingerprint = ? ORDER BY id DESC LIMIT 1",
+                (fingerprint,)
+            )
+        return rows[0] if rows else None
+
+    def usage_summary(self, since=None):
+        """按服务商和模型汇总调用次数、token 用量和耗时，用于费用统计"""
+        return self.query(
+            "SELECT provider, model, COUNT(*) AS requests, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+            "SUM(total_tokens) AS total_tokens, SUM(cached_tokens) AS cached_tokens, AVG(total_ms) AS avg_ms "
+            "FROM history WHERE created_at >= ? GROUP BY provider, model ORDER BY requests DESC",
+            (since or 0,)
+        )
+
+    def flush(self, timeout=5.0):
+        """等待已提交的记录全部写入"""
+        deadline = time.monotonic() + timeout
+        while self.pending.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def close(self):
+        self.pending.put(None)
+        self.writer.join(timeout=5)
+        with self.read_lock:
+            self.read_conn.close()
@@ -1,18 +1,47 @@
+import os
 import platform
+import select
+import threading
 
 # 平台检测
 CURRENT_PLATFORM = platform.system()
 IS_WINDOWS = CURRENT_PLATFORM == "Windows"
 IS_MACOS = CURRENT_PLATFORM == "Darwin"
+IS_LINUX = CURRENT_PLATFORM == "Linux"
 
 # 尝试导入特定平台的模块
 KEYBOARD_AVAILABLE = False
+XLIB_AVAILABLE = False
+EVDEV_AVAILABLE = False
 if IS_WINDOWS:
     try:
         import keyboard
         KEYBOARD_AVAILABLE = True
     except ImportError:
         pass
+elif IS_LINUX:
+    try:
+        from Xlib import X, XK, display as xdisplay, error as xerror
+        XLIB_AVAILABLE = True
+    except ImportError:
+        pass
+    try:
+        import evdev
+        from evdev import ecodes
+        EVDEV_AVAILABLE = True
+    except ImportError:
+        pass
+    # X11 需要图形会话；evdev 直接读取 /dev/input，Wayland 和纯终端下也可用（需要 input 组权限）
+    KEYBOARD_AVAILABLE = (XLIB_AVAILABLE and bool(os.environ.get('DISPLAY'))) or EVDEV_AVAILABLE
+
+# 热键字符串中的修饰键写法 -> 统一名称
+MODIFIER_ALIASES = {
+    'ctrl': 'ctrl', 'control': 'ctrl',
+    'shift': 'shift',
+    'alt': 'alt', 'option': 'alt',
+    'super': 'super', 'win': 'super', 'windows': 'super', 'cmd': 'super', 'command': 'super', 'meta': 'super',
+}
+MODIFIER_ALIASES.update({f'{name}_{side}': alias for name, alias in list(MODIFIER_ALIASES.items()) for side in 'lr'})
 
 class HotkeyManager:
     
@@ -28,6 +57,8 @@ class HotkeyManager:
         self.screenshot_callback = None
         self.screenshot_hotkey = None
         self.screenshot_active = False
+        # 命名热键（如配置方案热键）: 名称 -> 热键字符串
+        self.named_hotkeys = {}
     
     def register_hotkey(self, hotkey_str):
         """注册热键
@@ -71,6 +102,35 @@ class HotkeyManager:
         """
         raise NotImplementedError("子类必须实现此方法")
     
+    def register_named_hotkey(self, name, hotkey_str, callback):
+        """注册一个带名称的附加热键，同名热键会被替换
+        
+        Args:
+            name: 热键名称，如配置方案名
+            hotkey_str: 热键字符串
+            callback: 热键触发时的回调函数
+            
+        Returns:
+            bool: 是否成功注册
+        """
+        raise NotImplementedError("子类必须实现此方法")
+    
+    def unregister_named_hotkey(self, name):
+        """取消注册带名称的附加热键
+        
+        Args:
+            name: 热键名称
+            
+        Returns:
+            bool: 是否成功取消
+        """
+        raise NotImplementedError("子类必须实现此方法")
+    
+    def unregister_all_named_hotkeys(self):
+        """取消所有带名称的附加热键"""
+        for name in list(self.named_hotkeys):
+            self.unregister_named_hotkey(name)
+    
     def set_callback(self, callback):
         """设置热键触发回调
         
@@ -95,7 +155,8 @@ class HotkeyManager:
         Returns:
             bool: 是否应显示UI
         """
-        return IS_WINDOWS  # 只在Windows上显示热键UI
+        # Windows 和有可用热键后端的 Linux 上显示热键UI
+        return IS_WINDOWS or (IS_LINUX and KEYBOARD_AVAILABLE)
 
 
 class WindowsHotkeyManager(HotkeyManager):
@@ -162,6 +223,30 @@ class WindowsHotkeyManager(HotkeyManager):
             return True
         except Exception:
             return False
+    
+    def register_named_hotkey(self, name, hotkey_str, callback):
+        if not KEYBOARD_AVAILABLE:
+            return False
+        
+        try:
+            self.unregister_named_hotkey(name)
+            keyboard.add_hotkey(hotkey_str, callback)
+            self.named_hotkeys[name] = hotkey_str
+            return True
+        except Exception:
+            return False
+    
+    def unregister_named_hotkey(self, name):
+        if not KEYBOARD_AVAILABLE:
+            return False
+        
+        try:
+            hotkey_str = self.named_hotkeys.pop(name, None)
+            if hotkey_str:
+                keyboard.remove_hotkey(hotkey_str)
+            return True
+        except Exception:
+            return False
 
 
 class MacOSHotkeyManager(HotkeyManager):
@@ -193,6 +278,373 @@ class MacOSHotkeyManager(HotkeyManager):
         self.screenshot_callback = None
         self.screenshot_active = False
         return True
+    
+    def register_named_hotkey(self, name, hotkey_str, callback):
+        # macOS上不支持，返回假成功
+        self.named_hotkeys[name] = hotkey_str
+        return True
+    
+    def unregister_named_hotkey(self, name):
+        # macOS上不支持，返回假成功
+        self.named_hotkeys.pop(name, None)
+        return True
+
+
+def parse_hotkey(hotkey_str):
+    """把 'ctrl+shift+o' 形式的热键拆分为 (修饰键集合, 按键名)
+
+    Raises:
+        ValueError: 没有普通按键或有多个普通按键
+    """
+    modifiers, keys = set(), []
+    for part in hotkey_str.lower().replace(' ', '').split('+'):
+        if not part:
+            continue
+        if part in MODIFIER_ALIASES:
+            modifiers.add(MODIFIER_ALIASES[part])
+        else:
+            keys.append(part)
+    if len(keys) != 1:
+        raise ValueError(f"无法识别的热键: {hotkey_str}")
+    return frozenset(modifiers), keys[0]
+
+
+class HotkeyListener:
+    """Linux 热键监听线程的公共部分：注册表和用于唤醒/退出 select 的管道
+
+    监听线程阻塞在 select 上，只有按键事件或注册变化时才被唤醒，空闲时不轮询。
+    热键以 slot（启动/停止、截图、命名热键各占一个）区分，同一 slot 重新注册时替换。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hotkeys = {}  # slot -> (匹配键, 回调)
+        self.wake_r, self.wake_w = os.pipe()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def wake(self):
+        os.write(self.wake_w, b'x')
+
+    def drain_wake(self):
+        os.read(self.wake_r, 4096)
+
+    def dispatch(self, key):
+        """调用与按键匹配的回调，回调出错不影响监听线程"""
+        with self.lock:
+            callbacks = [callback for match, callback in self.hotkeys.values() if match == key]
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def close(self):
+        self.running = False
+        self.wake()
+        self.thread.join(timeout=1)
+
+
+class X11HotkeyListener(HotkeyListener):
+    """通过 XGrabKey 在根窗口上抓取热键
+
+    python-xlib 的连接不是线程安全的，抓取和释放都在监听线程中执行，
+    调用方通过请求队列提交并等待结果。另外注册 NumLock、CapsLock 打开时的组合，
+    否则这两个键打开时热键不会触发。
+    """
+
+    # 忽略的锁定键：CapsLock（LockMask）和 NumLock（通常为 Mod2Mask）
+    LOCK_MASKS = (0, X.LockMask, X.Mod2Mask, X.LockMask | X.Mod2Mask) if XLIB_AVAILABLE else ()
+    MODIFIER_MASKS = {'ctrl': X.ControlMask, 'shift': X.ShiftMask, 'alt': X.Mod1Mask, 'super': X.Mod4Mask} \
+        if XLIB_AVAILABLE else {}
+    KEY_ALIASES = {
+        'esc': 'Escape', 'enter': 'Return', 'del': 'Delete', 'ins': 'Insert',
+        'pageup': 'Prior', 'pagedown': 'Next', 'printscreen': 'Print', 'prtsc': 'Print',
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.display = xdisplay.Display()
+        self.root = self.display.screen().root
+        self.requests = []
+        self.thread.start()
+
+    def keysym(self, name):
+        name = self.KEY_ALIASES.get(name, name)
+        for candidate in (name, name.capitalize(), name.upper()):
+            keysym = XK.string_to_keysym(candidate)
+            if keysym:
+                return keysym
+        return 0
+
+    def call(self, function, *args):
+        """在监听线程中执行 function 并返回结果"""
+        done = threading.Event()
+        result = [False]
+        with self.lock:
+            self.requests.append((function, args, result, done))
+        self.wake()
+        done.wait(timeout=2)
+        return result[0]
+
+    def add(self, slot, hotkey_str, callback):
+        return self.call(self._grab, slot, hotkey_str, callback)
+
+    def remove(self, slot):
+        return self.call(self._ungrab, slot)
+
+    def _grab(self, slot, hotkey_str, callback):
+        self._ungrab(slot)
+        try:
+            modifiers, name = parse_hotkey(hotkey_str)
+        except ValueError:
+            return False
+        keycode = self.display.keysym_to_keycode(self.keysym(name))
+        if not keycode:
+            return False
+        mask = 0
+        for modifier in modifiers:
+            mask |= self.MODIFIER_MASKS[modifier]
+        catcher = xerror.CatchError(xerror.BadAccess)
+        for lock_mask in self.LOCK_MASKS:
+            self.root.grab_key(keycode, mask | lock_mask, True, X.GrabModeAsync, X.GrabModeAsync, onerror=catcher)
+        self.display.sync()
+        if catcher.get_error():
+            # 其他程序已经抓取了该组合
+            for lock_mask in self.LOCK_MASKS:
+                self.root.ungrab_key(keycode, mask | lock_mask)
+            self.display.sync()
+            return False
+        with self.lock:
+            self.hotkeys[slot] = ((keycode, mask), callback)
+        return True
+
+    def _ungrab(self, slot):
+        with self.lock:
+            entry = self.hotkeys.pop(slot, None)
+            still_used = entry and any(match == entry[0] for match, _ in self.hotkeys.values())
+        if entry and not still_used:
+            keycode, mask = entry[0]
+            for lock_mask in self.LOCK_MASKS:
+                self.root.ungrab_key(keycode, mask | lock_mask)
+            self.display.sync()
+        return True
+
+    def _run(self):
+        fd = self.display.fileno()
+        while self.running:
+            # 读取事件时可能已经把后续事件一起缓存，先处理完再阻塞
+            if not self.display.pending_events():
+                readable, _, _ = select.select([fd, self.wake_r], [], [])
+                if self.wake_r in readable:
+                    self.drain_wake()
+            with self.lock:
+                requests, self.requests = self.requests, []
+            for function, args, result, done in requests:
+                try:
+                    result[0] = function(*args)
+                except Exception:
+                    result[0] = False
+                done.set()
+            while self.running and self.display.pending_events():
+                event = self.display.next_event()
+                if event.type == X.KeyPress:
+                    mask = 0
+                    for modifier_mask in self.MODIFIER_MASKS.values():
+                        mask |= event.state & modifier_mask
+                    self.dispatch((event.detail, mask))
+        self.display.close()
+
+
+class EvdevHotkeyListener(HotkeyListener):
+    """直接读取 /dev/input 中的键盘设备匹配热键（不抓取按键，按键仍会传给当前窗口）
+
+    适用于 Wayland 和没有 X11 的环境，需要当前用户有读取输入设备的权限（通常是 input 组）。
+    """
+
+    KEY_ALIASES = {
+        'print': 'sysrq', 'printscreen': 'sysrq', 'prtsc': 'sysrq', 'return': 'enter',
+        'escape': 'esc', 'prior': 'pageup', 'next': 'pagedown', 'del': 'delete', 'ins': 'insert',
+        'caps_lock': 'capslock',
+    }
+
+    def __init__(self, devices=None):
+        """
+        Args:
+            devices: 要监听的 evdev.InputDevice 列表，默认为所有键盘设备
+        """
+        super().__init__()
+        self.modifier_codes = {
+            ecodes.KEY_LEFTCTRL: 'ctrl', ecodes.KEY_RIGHTCTRL: 'ctrl',
+            ecodes.KEY_LEFTSHIFT: 'shift', ecodes.KEY_RIGHTSHIFT: 'shift',
+            ecodes.KEY_LEFTALT: 'alt', ecodes.KEY_RIGHTALT: 'alt',
+            ecodes.KEY_LEFTMETA: 'super', ecodes.KEY_RIGHTMETA: 'super',
+        }
+        self.pressed = {}  # 按下的修饰键码 -> 修饰键名
+        self.devices = self.find_keyboards() if devices is None else list(devices)
+        if not self.devices:
+            raise OSError("没有可读取的键盘设备，请把当前用户加入 input 组")
+        self.thread.start()
+
+    @staticmethod
+    def find_keyboards():
+        keyboards = []
+        for path in evdev.list_devices():
+            try:
+                device = evdev.InputDevice(path)
+            except OSError:
+                continue
+            if ecodes.KEY_A in device.capabilities().get(ecodes.EV_KEY, []):
+                keyboards.append(device)
+            else:
+                device.close()
+        return keyboards
+
+    def keycode(self, name):
+        name = self.KEY_ALIASES.get(name, name)
+        return ecodes.ecodes.get(f'KEY_{name.upper()}')
+
+    def add(self, slot, hotkey_str, callback):
+        try:
+            modifiers, name = parse_hotkey(hotkey_str)
+        except ValueError:
+            return False
+        code = self.keycode(name)
+        if code is None:
+            return False
+        with self.lock:
+            self.hotkeys[slot] = ((modifiers, code), callback)
+        return True
+
+    def remove(self, slot):
+        with self.lock:
+            self.hotkeys.pop(slot, None)
+        return True
+
+    def feed(self, code, value):
+        """处理一个按键事件：value 为 1 按下、0 松开、2 自动重复（重复不触发）"""
+        if code in self.modifier_codes:
+            if value:
+                self.pressed[code] = self.modifier_codes[code]
+            else:
+                self.pressed.pop(code, None)
+        elif value == 1:
+            self.dispatch((frozenset(self.pressed.values()), code))
+
+    def _run(self):
+        while self.running:
+            fds = {device.fd: device for device in self.devices}
+            readable, _, _ = select.select(list(fds) + [self.wake_r], [], [])
+            for fd in readable:
+                if fd == self.wake_r:
+                    self.drain_wake()
+                    continue
+                device = fds[fd]
+                try:
+                    for event in device.read():
+                        if event.type == ecodes.EV_KEY:
+                            self.feed(event.code, event.value)
+                except OSError:
+                    # 设备被拔出
+                    self.devices.remove(device)
+                    device.close()
+        for device in self.devices:
+            device.close()
+
+
+class LinuxHotkeyManager(HotkeyManager):
+    """Linux平台的热键管理实现
+
+    有 X11 会话时使用 XGrabKey，否则（或在 Wayland 会话中）读取 evdev 输入设备。
+    监听线程在第一次注册热键时创建。
+    """
+
+    TOGGLE_SLOT = '__toggle__'
+    SCREENSHOT_SLOT = '__screenshot__'
+
+    def __init__(self, callback=None):
+        super().__init__(callback)
+        self.listener = None
+
+    def get_listener(self):
+        if self.listener is not None:
+            return self.listener
+        backends = []
+        if XLIB_AVAILABLE and os.environ.get('DISPLAY'):
+            backends.append(X11HotkeyListener)
+        if EVDEV_AVAILABLE:
+            # Wayland 会话中 XWayland 只能收到自身窗口的按键，优先使用 evdev
+            if os.environ.get('WAYLAND_DISPLAY'):
+                backends.insert(0, EvdevHotkeyListener)
+            else:
+                backends.append(EvdevHotkeyListener)
+        for backend in backends:
+            try:
+                self.listener = backend()
+                break
+            except Exception:
+                continue
+        return self.listener
+
+    def add(self, slot, hotkey_str, callback):
+        listener = self.get_listener()
+        if listener is None:
+            return False
+        return listener.add(slot, hotkey_str, callback)
+
+    def remove(self, slot):
+        if self.listener is None:
+            return True
+        return self.listener.remove(slot)
+
+    def register_hotkey(self, hotkey_str):
+        self.unregister_hotkey()
+        if not self.add(self.TOGGLE_SLOT, hotkey_str, lambda: self.callback and self.callback()):
+            return False
+        self.current_hotkey = hotkey_str
+        self.is_active = True
+        return True
+
+    def unregister_hotkey(self, hotkey_str=None):
+        if hotkey_str is None or hotkey_str == self.current_hotkey:
+            self.remove(self.TOGGLE_SLOT)
+            self.current_hotkey = None
+            self.is_active = False
+        return True
+
+    def register_screenshot_listener(self, hotkey_str, callback):
+        self.unregister_screenshot_listener()
+        if not self.add(self.SCREENSHOT_SLOT, hotkey_str, callback):
+            return False
+        self.screenshot_hotkey = hotkey_str
+        self.screenshot_callback = callback
+        self.screenshot_active = True
+        return True
+
+    def unregister_screenshot_listener(self):
+        self.remove(self.SCREENSHOT_SLOT)
+        self.screenshot_hotkey = None
+        self.screenshot_callback = None
+        self.screenshot_active = False
+        return True
+
+    def register_named_hotkey(self, name, hotkey_str, callback):
+        self.unregister_named_hotkey(name)
+        if not self.add(name, hotkey_str, callback):
+            return False
+        self.named_hotkeys[name] = hotkey_str
+        return True
+
+    def unregister_named_hotkey(self, name):
+        if self.named_hotkeys.pop(name, None):
+            self.remove(name)
+        return True
+
+    def close(self):
+        """停止监听线程"""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
 
 
 def create_hotkey_manager(callback=None):
@@ -206,5 +658,7 @@ def create_hotkey_manager(callback=None):
     """
     if IS_WINDOWS:
         return WindowsHotkeyManager(callback)
+    elif IS_LINUX and KEYBOARD_AVAILABLE:
+        return LinuxHotkeyManager(callback)
     else:  # macOS或其他平台
         return MacOSHotkeyManager(callback)
\ No newline at end of file
@@ -0,0 +1,164 @@
+import gc
+import os
+import platform
+import threading
+import tracemalloc
+import weakref
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def get_rss_bytes():
+    """获取当前进程的常驻内存（RSS），无法获取时返回 None"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if platform.system() == "Windows":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        import resource
+        # macOS 上 ru_maxrss 以字节为单位（峰值，而非当前值）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+class MemoryMonitor:
+    """常驻进程的内存统计
+
+    - 定期检查 RSS，超过上限时回收内存并记录日志
+    - 统计存活的客户端、图片和线程数量
+    - 按需拍摄 tracemalloc 快照并与上一次快照对比
+    """
+
+    def __init__(self, limit_mb=0, interval=30, log_callback=None):
+        """
+        Args:
+            limit_mb: RSS 上限（MB），为 0 时不检查
+            interval: 定期检查的间隔（秒）
+            log_callback: 日志回调
+        """
+        self.limit_mb = limit_mb
+        self.interval = interval
+        self.log_callback = log_callback
+        self.tracked = {}
+        self.release_hooks = []
+        self.last_snapshot = None
+        self.over_budget_count = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def set_limit(self, limit_mb):
+        self.limit_mb = max(0, int(limit_mb or 0))
+
+    def track(self, kind, obj):
+        """登记一个需要统计存活数量的对象（仅持有弱引用）"""
+        with self.lock:
+            refs = self.tracked.setdefault(kind, weakref.WeakSet())
+            try:
+                refs.add(obj)
+            except TypeError:
+                pass
+
+    def add_release_hook(self, hook):
+        """登记超出内存上限时调用的释放函数"""
+        self.release_hooks.append(hook)
+
+    def counts(self):
+        with self.lock:
+            counts = {kind: len(refs) for kind, refs in self.tracked.items()}
+        counts['threads'] = threading.active_count()
+        return counts
+
+    def stats(self):
+        rss = get_rss_bytes()
+        stats = {
+            'rss_mb': round(rss / 1024 / 1024, 1) if rss else None,
+            'limit_mb': self.limit_mb,
+            'over_budget_count': self.over_budget_count,
+        }
+        stats.update(self.counts())
+        return stats
+
+    def check(self):
+        """检查 RSS 是否超过上限，超过时执行回收"""
+        stats = self.stats()
+        if self.limit_mb and stats['rss_mb'] and stats['rss_mb'] > self.limit_mb:
+            self.over_budget_count += 1
+            for hook in self.release_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    self.log(f"释放内存失败: {e}")
+            gc.collect()
+            after = get_rss_bytes()
+            self.log(
+                f"内存超出上限: {stats['rss_mb']}MB > {self.limit_mb}MB，"
+                f"回收后 {round(after / 1024 / 1024, 1) if after else '?'}MB"
+            )
+        return stats
+
+    def snapshot_diff(self, top=10):
+        """拍摄 tracemalloc 快照，返回与上一次快照相比增长最多的分配位置"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.last_snapshot = tracemalloc.take_snapshot()
+            return ["已开启 tracemalloc，再次拍摄快照即可查看内存增长"]
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        previous, self.last_snapshot = self.last_snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"tracemalloc: 当前 {current / 1024 / 1024:.1f}MB，峰值 {peak / 1024 / 1024:.1f}MB"]
+        for stat in snapshot.compare_to(previous, 'lineno')[:top]:
+            lines.append(str(stat))
+        return lines
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self.stop_event.set()
@@ -1,5 +1,6 @@
 import os
 import sys
+import platform
 
 def get_absolute_path(relative_path):
     """Get the absolute path of the resource file"""
@@ -13,4 +14,16 @@ def get_absolute_path(relative_path):
     except Exception:
         # Development environment
         base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
\ No newline at end of file
+    return os.path.join(base_path, relative_path)
+
+def get_app_data_dir():
+    """Get (and create) the per-user application data directory"""
+    if platform.system() == "Windows":
+        base_dir = os.getenv("APPDATA") or os.path.expanduser("~")
+    elif platform.system() == "Darwin":
+        base_dir = os.path.join(os.path.expanduser("~"), "Library", "Application Support")
+    else:
+        base_dir = os.getenv("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    app_dir = os.path.join(base_dir, "PillOCR")
+    os.makedirs(app_dir, exist_ok=True)
+    return app_dir
@@ -0,0 +1,98 @@
+import platform
+import tkinter as tk
+from PIL import Image, ImageEnhance, ImageGrab, ImageTk
+
+# 小于该尺寸（逻辑像素）的选区视为误触
+MIN_SELECTION = 4
+
+
+def get_virtual_screen(root):
+    """返回虚拟桌面的逻辑坐标 (x, y, width, height)，Windows 下包含所有显示器"""
+    if platform.system() == "Windows":
+        import ctypes
+        metrics = ctypes.windll.user32.GetSystemMetrics
+        # SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN
+        return metrics(76), metrics(77), metrics(78), metrics(79)
+    return 0, 0, root.winfo_screenwidth(), root.winfo_screenheight()
+
+
+class RegionSelector:
+    """内置区域截图：先冻结整个屏幕，在覆盖全屏的窗口上拖动选择区域，直接返回内存中的图片
+
+    选区按截图与窗口的尺寸比例换算为物理像素，因此高 DPI（缩放）和多显示器下都能截到原始分辨率，
+    也不会截到覆盖窗口本身。
+    """
+
+    def __init__(self, root, on_selected, on_cancel=None):
+        """
+        Args:
+            root: Tk 根窗口，select 必须在 Tk 主线程中调用
+            on_selected: 选择完成后以裁剪出的图片调用
+            on_cancel: 按 Esc 或选区过小时调用
+        """
+        self.root = root
+        self.on_selected = on_selected
+        self.on_cancel = on_cancel
+        self.window = None
+
+    def select(self):
+        if self.window is not None:
+            return
+        x, y, width, height = get_virtual_screen(self.root)
+        self.screenshot = ImageGrab.grab(all_screens=True) if platform.system() == "Windows" else ImageGrab.grab()
+        self.scale_x = self.screenshot.width / width
+        self.scale_y = self.screenshot.height / height
+
+        preview = self.screenshot.convert('RGB').resize((width, height), Image.Resampling.BILINEAR)
+        self.photo = ImageTk.PhotoImage(ImageEnhance.Brightness(preview).enhance(0.6))
+        preview.close()
+
+        self.window = tk.Toplevel(self.root)
+        self.window.overrideredirect(True)
+        self.window.geometry(f"{width}x{height}+{x}+{y}")
+        self.window.attributes('-topmost', True)
+        self.canvas = tk.Canvas(self.window, width=width, height=height, highlightthickness=0, cursor='crosshair')
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.canvas.create_image(0, 0, anchor='nw', image=self.photo)
+        self.rect = None
+        self.start = None
+        self.canvas.bind('<ButtonPress-1>', self.on_press)
+        self.canvas.bind('<B1-Motion>', self.on_drag)
+        self.canvas.bind('<ButtonRelease-1>', self.on_release)
+        self.window.bind('<Escape>', lambda e: self.finish(None))
+        self.window.focus_force()
+
+    def on_press(self, event):
+        self.start = (event.x, event.y)
+        if self.rect:
+            self.canvas.delete(self.rect)
+        self.rect = self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline='#587d9d', width=2)
+
+    def on_drag(self, event):
+        if self.start:
+            self.canvas.coords(self.rect, *self.start, event.x, event.y)
+
+    def on_release(self, event):
+        if not self.start:
+            return
+        x0, x1 = sorted((self.start[0], event.x))
+        y0, y1 = sorted((self.start[1], event.y))
+        if x1 - x0 < MIN_SELECTION or y1 - y0 < MIN_SELECTION:
+            self.finish(None)
+            return
+        box = (
+            round(x0 * self.scale_x), round(y0 * self.scale_y),
+            round(x1 * self.scale_x), round(y1 * self.scale_y),
+        )
+        self.finish(self.screenshot.crop(box))
+
+    def finish(self, image):
+        self.window.destroy()
+        self.window = None
+        self.photo = None
+        self.screenshot.close()
+        self.screenshot = None
+        if image is not None:
+            self.on_selected(image)
+        elif self.on_cancel:
+            self.on_cancel()
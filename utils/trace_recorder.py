@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import queue
+import threading
+import time
+from processors.image_encoder import ImageEncoder
+
+TRACE_FILE = 'trace.jsonl'
+IMAGE_DIR = 'images'
+# 等待写入的事件数上限，超出时丢弃事件，避免磁盘过慢时图片副本堆积
+MAX_PENDING = 64
+
+
+class TraceRecorder:
+    """把每次识别（图片、到达时间、尺寸、服务商返回和耗时）记录到录制目录，供 pillocr_replay.py 重放
+
+    目录结构：
+        trace.jsonl         每行一个识别事件
+        images/<指纹>.png   图片副本，相同图片只保存一次
+
+    PNG 编码和写文件在后台线程中进行，开启录制不会增加识别结果复制到剪贴板前的耗时。
+    """
+
+    def __init__(self, trace_dir, log_callback=None):
+        self.trace_dir = trace_dir
+        self.image_dir = os.path.join(trace_dir, IMAGE_DIR)
+        os.makedirs(self.image_dir, exist_ok=True)
+        self.image_encoder = ImageEncoder()
+        self.log_callback = log_callback
+        self.lock = threading.Lock()
+        self.file = open(os.path.join(trace_dir, TRACE_FILE), 'a', encoding='utf-8')
+        self.dropped = 0
+        self.pending = queue.Queue(maxsize=MAX_PENDING)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+
+    def record(self, image, result, source):
+        """记录一次识别，result 为 ImageToMarkdown.recognize 的返回值；只复制图片，写入在后台进行"""
+        finished = time.time()
+        copy = image.copy()
+        try:
+            self.pending.put_nowait((copy, dict(result), source, finished))
+        except queue.Full:
+            copy.close()
+            self.dropped += 1
+            if self.dropped == 1:
+                self.log("录制写入过慢，部分识别事件未被录制")
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            image, result, source, finished = item
+            try:
+                self.write(image, result, source, finished)
+            except Exception as e:
+                self.log(f"写入录制文件失败: {e}")
+            finally:
+                image.close()
+
+    def write(self, image, result, source, finished):
+        fingerprint = self.image_encoder.fingerprint(image)
+        image_path = os.path.join(self.image_dir, f"{fingerprint}.png")
+        size = None
+        if not os.path.exists(image_path):
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+            size = buffer.tell()
+            with open(image_path, 'wb') as f:
+                f.write(buffer.getvalue())
+        event = {
+            'ts': round(finished - (result.get('total_ms') or 0) / 1000, 3),
+            'source': source,
+            'fingerprint': fingerprint,
+            'ahash': self.image_encoder.average_hash(image),
+            'width': image.width,
+            'height': image.height,
+            'png_bytes': size if size is not None else os.path.getsize(image_path),
+        }
+        for key in ('provider', 'model', 'raw', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+                    'cached_tokens', 'encode_ms', 'request_ms', 'total_ms'):
+            event[key] = result.get(key)
+        line = json.dumps(event, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        """写完已提交的事件后关闭录制文件"""
+        self.pending.put(None)
+        self.thread.join()
+        with self.lock:
+            self.file.close()
+
+
+def load_trace(trace_dir):
+    """读取录制目录中的事件，按到达时间排序"""
+    events = []
+    with open(os.path.join(trace_dir, TRACE_FILE), encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                events.append(json.loads(line))
+    events.sort(key=lambda e: e['ts'])
+    return events
+
+
+def trace_image_path(trace_dir, event):
+    return os.path.join(trace_dir, IMAGE_DIR, f"{event['fingerprint']}.png")